@@ -0,0 +1,287 @@
+"""
+Render benchmark: replays generated_scripts/ and the curated scenes in
+benchmarks/scenes/ across quality tiers and records where the time goes.
+
+Each (script, scene, tier) run happens in a fresh interpreter so import cost
+is measured honestly and caches start cold. Results are written as JSON and
+can be compared against a stored baseline; the exit status is non-zero when
+a stage regresses past the threshold.
+
+    python benchmarks/render_bench.py --tiers preview,high --output bench.json
+    python benchmarks/render_bench.py --baseline benchmarks/baseline.json
+    python benchmarks/render_bench.py --output benchmarks/baseline.json  # refresh
+"""
+
+import os
+import sys
+import ast
+import json
+import time
+import glob
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src", "flask_app"))
+
+from quality import QUALITY_TIERS, tier_flags  # noqa: E402
+from warm_pool import quality_from_flags  # noqa: E402
+
+STAGES = ("import_s", "construct_s", "tex_s", "text_s", "frames_s", "encode_s", "total_s")
+
+# (module path, attribute path, stage) pairs timed inside the child process
+TIMED = (
+    ("manim.utils.tex_file_writing", "compile_tex", "tex_s"),
+    ("manim.utils.tex_file_writing", "convert_to_svg", "tex_s"),
+    ("manim.mobject.text.text_mobject", "Text._text2svg", "text_s"),
+    ("manim.mobject.text.text_mobject", "MarkupText._text2svg", "text_s"),
+    ("manim.renderer.cairo_renderer", "CairoRenderer.update_frame", "frames_s"),
+    ("manim.scene.scene_file_writer", "SceneFileWriter.write_frame", "encode_s"),
+    ("manim.scene.scene_file_writer", "SceneFileWriter.combine_to_movie", "encode_s"),
+)
+
+
+def discover_scenes(paths):
+    """Yield (script, scene class) for every Scene subclass in the given files"""
+    for path in paths:
+        with open(path) as f:
+            tree = ast.parse(f.read())
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and any(
+                isinstance(base, ast.Name) and base.id.endswith("Scene")
+                for base in node.bases
+            ):
+                yield path, node.name
+
+
+def _instrument(timings):
+    """Wrap manim internals so time spent in them lands in `timings`"""
+    import importlib
+
+    for module_name, attr_path, stage in TIMED:
+        try:
+            owner = importlib.import_module(module_name)
+            *parents, attr = attr_path.split(".")
+            for parent in parents:
+                owner = getattr(owner, parent)
+            original = getattr(owner, attr)
+        except (ImportError, AttributeError):
+            continue
+
+        def timed(*args, __original=original, __stage=stage, **kwargs):
+            start = time.perf_counter()
+            try:
+                return __original(*args, **kwargs)
+            finally:
+                timings[__stage] += time.perf_counter() - start
+
+        setattr(owner, attr, timed)
+        # Modules that imported the function by name keep their own reference
+        if not parents:
+            for module in list(sys.modules.values()):
+                if getattr(module, attr, None) is original:
+                    setattr(module, attr, timed)
+
+
+def child_main(spec):
+    """Render one scene and write the stage breakdown to spec["out"]"""
+    timings = dict.fromkeys(STAGES, 0.0)
+    result = {"ok": False}
+    start = time.perf_counter()
+    try:
+        import manim
+        from manim import tempconfig
+
+        timings["import_s"] = time.perf_counter() - start
+        result["manim_version"] = getattr(manim, "__version__", None)
+        _instrument(timings)
+
+        import importlib.util
+
+        module_spec = importlib.util.spec_from_file_location("bench_scene", spec["script"])
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+        scene_cls = getattr(module, spec["scene"])
+
+        render_start = time.perf_counter()
+        with tempconfig(
+            {
+                "quality": spec["quality"],
+                "media_dir": spec["media_dir"],
+                "input_file": spec["script"],
+                "preview": False,
+                "progress_bar": "none",
+                "verbosity": "WARNING",
+            }
+        ):
+            scene_cls().render()
+        render_s = time.perf_counter() - render_start
+        # Whatever isn't TeX, Pango, drawing or encoding is construct() itself
+        timings["construct_s"] = max(
+            render_s
+            - timings["tex_s"]
+            - timings["text_s"]
+            - timings["frames_s"]
+            - timings["encode_s"],
+            0.0,
+        )
+        result["ok"] = True
+    except BaseException as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    timings["total_s"] = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux; children covers latex, dvisvgm and ffmpeg
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    result["peak_child_rss_mb"] = (
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    )
+    result.update(timings)
+    with open(spec["out"], "w") as f:
+        json.dump(result, f)
+
+
+def run_once(script, scene, tier):
+    with tempfile.TemporaryDirectory(prefix="render-bench-") as tmp:
+        spec = {
+            "script": os.path.abspath(script),
+            "scene": scene,
+            "quality": quality_from_flags(tier_flags(tier)),
+            # Fresh media dir per run, so TeX and partial movie caches are cold
+            "media_dir": os.path.join(tmp, "media"),
+            "out": os.path.join(tmp, "result.json"),
+        }
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec)],
+            capture_output=True,
+            text=True,
+        )
+        if not os.path.exists(spec["out"]):
+            return {"ok": False, "error": proc.stderr.strip()[-500:]}
+        with open(spec["out"]) as f:
+            return json.load(f)
+
+
+def run_benchmark(scenes, tiers, repeat):
+    results = []
+    for script, scene in scenes:
+        for tier in tiers:
+            runs = [run_once(script, scene, tier) for _ in range(repeat)]
+            ok = [r for r in runs if r["ok"]]
+            entry = {
+                "script": os.path.relpath(script, ROOT),
+                "scene": scene,
+                "tier": tier,
+                "runs": len(runs),
+                "ok": len(ok) == len(runs),
+            }
+            if ok:
+                # Medians keep one noisy run from moving the numbers
+                for stage in (*STAGES, "peak_rss_mb", "peak_child_rss_mb"):
+                    entry[stage] = statistics.median(r[stage] for r in ok)
+                entry["manim_version"] = ok[0].get("manim_version")
+            else:
+                entry["error"] = runs[-1].get("error")
+            print(
+                f"{entry['script']}:{scene} [{tier}] "
+                + (
+                    f"total {entry['total_s']:.2f}s, rss {entry['peak_rss_mb']:.0f} MB"
+                    if ok
+                    else f"FAILED: {entry['error']}"
+                )
+            )
+            results.append(entry)
+    return results
+
+
+def compare(results, baseline, threshold, min_seconds):
+    """Return human-readable regressions of `results` against `baseline`"""
+    previous = {(r["script"], r["scene"], r["tier"]): r for r in baseline["results"]}
+    regressions = []
+    for entry in results:
+        old = previous.get((entry["script"], entry["scene"], entry["tier"]))
+        if old is None or not old.get("ok"):
+            continue
+        if not entry["ok"]:
+            regressions.append(f"{entry['script']}:{entry['scene']} [{entry['tier']}] now fails")
+            continue
+        for stage in (*STAGES, "peak_rss_mb"):
+            before, after = old.get(stage), entry.get(stage)
+            if before is None or after is None:
+                continue
+            # RSS is in MB, so give it the same absolute slack in its own unit
+            slack = min_seconds if stage.endswith("_s") else 10
+            if after > before * (1 + threshold) and after - before > slack:
+                regressions.append(
+                    f"{entry['script']}:{entry['scene']} [{entry['tier']}] "
+                    f"{stage}: {before:.2f} -> {after:.2f}"
+                )
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--tiers", default="preview", help="comma separated, e.g. preview,high")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--scripts", nargs="*", help="override the script corpus")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="previous results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative slowdown")
+    parser.add_argument("--min-seconds", type=float, default=0.25, help="ignore smaller absolute changes")
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(json.loads(args.child))
+        return 0
+
+    tiers = args.tiers.split(",")
+    unknown = [t for t in tiers if t not in QUALITY_TIERS]
+    if unknown:
+        parser.error(f"unknown tiers {unknown}, use {list(QUALITY_TIERS)}")
+
+    scripts = args.scripts or sorted(
+        glob.glob(os.path.join(ROOT, "generated_scripts", "*.py"))
+        + glob.glob(os.path.join(ROOT, "benchmarks", "scenes", "*.py"))
+        + [os.path.join(ROOT, "src", "manim_script", "generated_scene.py")]
+    )
+    results = run_benchmark(list(discover_scenes(scripts)), tiers, args.repeat)
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_seconds)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Micro-benchmark for code_repair.repair_code against the regex auto_fix_code
+it replaced, on adversarial single-line inputs of doubling size.
+
+    python benchmarks/repair_bench.py --max-kb 256
+
+For each input the last column is the time ratio between consecutive sizes:
+about 2 means linear scaling, about 4 quadratic.
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src", "flask_app"))
+
+from code_repair import repair_code  # noqa: E402
+
+
+def legacy_auto_fix_code(code):
+    """The regex version that used to live in src/flask_app/app.py"""
+    code = re.sub(r"\.T\b", "", code)
+
+    def to_column(match):
+        nums = [f"[{n.strip()}]" for n in match.group(1).split(",")]
+        return f"Matrix([{', '.join(nums)}])"
+
+    code = re.sub(r"Matrix\(\[([^\[\]]+?)\]\)", to_column, code)
+    code = re.sub(r"Matrix\(.*?\)\.dot\(.*?\)", "# Removed invalid .dot() usage", code)
+    return code
+
+
+def wrap(line):
+    return f"from manim import *\n\nclass GeneratedScene(Scene):\n    def construct(self):\n        x = {line}\n"
+
+
+# Each builder returns a valid script whose one long line is about `n` chars
+INPUTS = {
+    # Many Matrix( calls and no .dot: the lazy .*? rescans the rest of the line each time
+    "matrix_no_dot": lambda n: wrap(" + ".join(["Matrix(a)"] * (n // 12))),
+    # Long runs of 1-D matrices, all of which get rewritten
+    "flat_matrices": lambda n: wrap("[" + ", ".join(["Matrix([1, 2, 3])"] * (n // 19)) + "]"),
+    # Nested .dot() calls inside matrix arguments
+    "nested_dot": lambda n: wrap(" + ".join(["Matrix([a.dot(b), c.T])"] * (n // 26))),
+}
+
+
+def best_of(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--min-kb", type=int, default=4)
+    parser.add_argument("--max-kb", type=int, default=128)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--legacy-max-kb",
+        type=int,
+        default=32,
+        help="stop timing the regex version past this size; it gets slow",
+    )
+    args = parser.parse_args()
+
+    for name, build in INPUTS.items():
+        print(f"\n{name}")
+        print(f"{'size':>8} {'repair_code':>12} {'ratio':>6} {'legacy':>10} {'ratio':>6}")
+        previous = {}
+        kb = args.min_kb
+        while kb <= args.max_kb:
+            code = build(kb * 1024)
+            row = [f"{kb:>6}KB"]
+            for label, fn, limit in (
+                ("new", lambda c: repair_code(c, "GeneratedScene"), args.max_kb),
+                ("legacy", legacy_auto_fix_code, args.legacy_max_kb),
+            ):
+                if kb > limit:
+                    row.append(f"{'-':>12} {'':>6}")
+                    continue
+                seconds = best_of(fn, code, args.repeat)
+                ratio = seconds / previous[label] if label in previous else None
+                previous[label] = seconds
+                ratio = f"{ratio:>5.1f}x" if ratio else f"{'':>6}"
+                row.append(f"{seconds * 1000:>10.1f}ms {ratio}")
+            print(" ".join(row))
+            kb *= 2
+
+
+if __name__ == "__main__":
+    main()
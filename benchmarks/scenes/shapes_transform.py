@@ -0,0 +1,16 @@
+from manim import *
+
+
+class ShapesTransformScene(Scene):
+    def construct(self):
+        square = Square(side_length=2, fill_opacity=0.5)
+        circle = Circle(radius=1, fill_opacity=0.5, color=BLUE)
+        triangle = Triangle(fill_opacity=0.5, color=GREEN)
+        self.play(Create(square))
+        self.play(Transform(square, circle))
+        self.play(Transform(square, triangle))
+        self.play(square.animate.shift(2 * LEFT).scale(0.5))
+        arrows = VGroup(*[Arrow(ORIGIN, direction) for direction in (UP, RIGHT, DOWN, LEFT)])
+        self.play(LaggedStart(*[GrowArrow(arrow) for arrow in arrows], lag_ratio=0.2))
+        self.play(Rotate(arrows, PI), run_time=2)
+        self.wait(1)
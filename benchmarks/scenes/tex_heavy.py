@@ -0,0 +1,24 @@
+from manim import *
+
+
+class TexHeavyScene(Scene):
+    def construct(self):
+        title = Text("Expanding a binomial").to_edge(UP)
+        self.play(Write(title))
+        steps = [
+            r"(a + b)^2",
+            r"(a + b)(a + b)",
+            r"a^2 + ab + ba + b^2",
+            r"a^2 + 2ab + b^2",
+        ]
+        current = MathTex(steps[0])
+        self.play(Write(current))
+        self.wait(1)
+        for step in steps[1:]:
+            nxt = MathTex(step)
+            self.play(TransformMatchingTex(current, nxt))
+            self.wait(1)
+            current = nxt
+        matrix = Matrix([[r"\alpha", r"\beta"], [r"\gamma", r"\delta"]]).next_to(current, DOWN)
+        self.play(Create(matrix))
+        self.wait(1)
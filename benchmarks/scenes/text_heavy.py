@@ -0,0 +1,17 @@
+from manim import *
+
+
+class TextHeavyScene(Scene):
+    def construct(self):
+        lines = [
+            "Step 1: Write down the matrix and the vector.",
+            "Step 2: Multiply each row by the vector.",
+            "Step 3: Add up the products in each row.",
+            "Step 4: Collect the sums into a new vector.",
+            "Step 5: That vector is the answer.",
+        ]
+        for line in lines:
+            caption = Text(line, font_size=32)
+            self.play(Write(caption))
+            self.wait(1)
+            self.play(FadeOut(caption))
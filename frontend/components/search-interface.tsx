@@ -14,20 +14,16 @@ import "katex/dist/katex.min.css"; // Ensure KaTeX CSS is imported
 import Markdown from "react-markdown"
 import rehypeKatex from "rehype-katex"
 import remarkMath from "remark-math"
+import { generateVideo, type VideoOutputs } from "@/lib/video-job"
 
-// Define the base prompt string outside the component for efficiency
-const baseManimPrompt = "You're an expert educator and Manim CE developer. Create a **complete and runnable Manim CE script** that visually explains the following math question in a clear, step-by-step animation: **Question:** \"{QUESTION}\" Goals:   * Define a class called GeneratedScene that inherits from Scene\n      Break the explanation into 3–6 short steps\n      Use `Text()` to explain each step simply (one sentence max)\n      Use `MathTex()` for all math (e.g., equations, fractions, dot products)\n      If applicable, use `Matrix()` objects to show visual matrix/vector layout\n      Use `Write`, `Create`, and `FadeOut` to animate content\n      Add pauses using `wait(1)` or `wait(2)` after each step\n      Visually show the final answer at the end of the scene\n      Constraints:\n      Don't use `.dot()`, `.T`, or real math operations\n      Don't use numpy, sympy, or external math libraries\n      Keep all math symbolic and visually instructive\n      + Keep visuals uncluttered: \n      If multiple elements are on screen together, use `.next_to()` or `.shift()` to space them\n      If an element replaces the previous one, center it (e.g., at `ORIGIN`, `DOWN`, or `UP`) so content stays vertically balanced\n      Ensure that everything that's being displayed at all time should be centered on the screen vertically and horizontally\n      Nothing should be outside of the bounds of the screen\n      Manim script shouldn't include unneccesary comments\n      Output:\n      Respond ONLY with valid Python code\n      The script must run with `manim -pql script.py {SCENE_NAME}` without errors";
 const mockExplanation = `This is important: \\[ c_{ij} = \\sum_{k=1}^n a_{ik} \\cdot b_{kj} \\]`;
 
-//const manimServerURL = "https://mathlens-beta-937226988264.us-central1.run.app";
-const manimServerURL = "http://127.0.0.1:5000";
-
 
 export default function SearchInterface() {
   const [query, setQuery] = useState("")
   const [isSearching, setIsSearching] = useState(false)
   const [searchHistory, setSearchHistory] = useState<string[]>([])
-  const [videoUrl, setVideoUrl] = useState<string | null>(null)
+  const [video, setVideo] = useState<VideoOutputs | null>(null)
   const [explanation, setExplanation] = useState<string | null>(null)
   const [searchError, setSearchError] = useState<string | null>(null)
 
@@ -57,7 +53,7 @@ export default function SearchInterface() {
 
     setIsSearching(true)
     setExplanation(null)
-    setVideoUrl(null)
+    setVideo(null)
     setSearchError(null) // Clear previous errors
 
     // Add to history (keep only last 5)
@@ -113,51 +109,14 @@ export default function SearchInterface() {
     if (process.env.NEXT_PUBLIC_SKIP_VIDEO_GENERATION) {
       // For development/testing purposes, use a mock video URL
       console.log("Using mock video response")
-      setVideoUrl("https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4")
+      setVideo({ videoUrl: "https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4" })
       setIsSearching(false)
       return
     }
 
     try {
-      // Prepare the prompt by replacing the placeholder with the actual query
-      const manimPrompt = baseManimPrompt.replace("{QUESTION}", currentQuery);
-
-      // Prepare FormData
-      const formData = new FormData();
-      formData.append("question", currentQuery);
-      formData.append("prompt", manimPrompt); // Use 'prompt' as the field name
-
-      // Send request using FormData to external backend
-      const response = await fetch(`${manimServerURL}/generate`, {
-        method: "POST",
-        body: formData,
-      })
-
-      if (!response.ok) {
-        let errorBody = "Unknown error";
-        try {
-            const errorData = await response.json();
-            errorBody = errorData.error || JSON.stringify(errorData);
-        } catch (parseError) {
-            errorBody = await response.text();
-        }
-        throw new Error(`Video generation HTTP error! Status: ${response.status}, Message: ${errorBody}`)
-      }
-
-      const data = await response.json()
-
-      console.log("Video generation response:", data)
-
-      if (data.video_url) {
-        // Prepend the base URL if the backend returns a relative path
-        const fullVideoUrl = data.video_url.startsWith("http") ? data.video_url : `${manimServerURL}/${data.video_url.replace(/^\/+/,'')}`;
-        setVideoUrl(fullVideoUrl);
-        console.log("Video URL:", fullVideoUrl);
-      } else if (data.error) {
-        throw new Error(`Video generation API Error: ${data.error}`);
-      } else {
-        throw new Error("Unexpected response format from video generation API.");
-      }
+      // Renditions (poster, mobile cut) keep arriving after the video is done
+      setVideo(await generateVideo(currentQuery, setVideo));
     } catch (error) {
       const errorMsg = `Failed to generate video: ${error instanceof Error ? error.message : String(error)}`;
       setSearchError((prevError) => prevError ? `${prevError}\n${errorMsg}` : errorMsg); // Append error messages
@@ -298,7 +257,7 @@ export default function SearchInterface() {
             <SkeletonLoader type="text" />
             <SkeletonLoader type="video" />
           </motion.div>
-        ) : (explanation || videoUrl) ? (
+        ) : (explanation || video) ? (
           <motion.div
             key="results"
             initial={{ opacity: 0, y: 20 }}
@@ -331,8 +290,8 @@ export default function SearchInterface() {
                   Video Visualization
                 </h2>
                 <div className="aspect-video">
-                  {videoUrl ? (
-                    <VideoPlayer videoUrl={videoUrl} />
+                  {video ? (
+                    <VideoPlayer videoUrl={video.videoUrl} posterUrl={video.posterUrl} mobileUrl={video.mobileUrl} />
                   ) : (
                     <div className="w-full h-full flex items-center justify-center bg-slate-100 dark:bg-slate-800">
                       <p className="text-slate-500 dark:text-slate-400">No video available</p>
@@ -4,13 +4,25 @@ import { useState, useRef, useEffect } from "react"
 import { Play, Pause, Volume2, VolumeX, Maximize } from "lucide-react"
 import { Slider } from "@/components/ui/slider"
 import { Button } from "@/components/ui/button"
+import { useIsMobile } from "@/hooks/use-mobile"
 
 interface VideoPlayerProps {
   videoUrl: string
+  // Renditions from the job result, when they have landed
+  posterUrl?: string
+  mobileUrl?: string
 }
 
-export default function VideoPlayer({ videoUrl }: VideoPlayerProps) {
+const saveData = () =>
+  typeof navigator !== "undefined" &&
+  !!(navigator as Navigator & { connection?: { saveData?: boolean } }).connection?.saveData
+
+export default function VideoPlayer({ videoUrl, posterUrl, mobileUrl }: VideoPlayerProps) {
+  // Small screens and data-saver connections get the low-bitrate rendition
+  const isMobile = useIsMobile()
+  const preferred = mobileUrl && (isMobile || saveData()) ? mobileUrl : videoUrl
   const videoRef = useRef<HTMLVideoElement>(null)
+  const [src, setSrc] = useState(preferred)
   const [isPlaying, setIsPlaying] = useState(false)
   const [currentTime, setCurrentTime] = useState(0)
   const [duration, setDuration] = useState(0)
@@ -19,6 +31,19 @@ export default function VideoPlayer({ videoUrl }: VideoPlayerProps) {
   const [isLoading, setIsLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
 
+  // The mobile rendition often lands after the player is shown; switch to it
+  // only until playback starts, since changing the source restarts the video.
+  // A different video always replaces the current one.
+  const shownVideo = useRef(videoUrl)
+  useEffect(() => {
+    const video = videoRef.current
+    const untouched = !video || (video.currentTime === 0 && video.paused)
+    if (untouched || shownVideo.current !== videoUrl) {
+      shownVideo.current = videoUrl
+      setSrc(preferred)
+    }
+  }, [videoUrl, preferred])
+
   // Update time display
   useEffect(() => {
     const video = videoRef.current
@@ -55,7 +80,7 @@ export default function VideoPlayer({ videoUrl }: VideoPlayerProps) {
       video.removeEventListener("canplay", handleCanPlay)
       video.removeEventListener("error", handleError)
     }
-  }, [videoUrl])
+  }, [src])
 
   // Handle play/pause
   const togglePlay = () => {
@@ -131,7 +156,9 @@ export default function VideoPlayer({ videoUrl }: VideoPlayerProps) {
       {/* Video element */}
       <video
         ref={videoRef}
-        src={videoUrl}
+        src={src}
+        poster={posterUrl}
+        preload="metadata"
         className="w-full h-full object-contain"
         onClick={togglePlay}
         onPlay={() => setIsPlaying(true)}
@@ -8,11 +8,12 @@ import { Button } from "@/components/ui/button"
 import { Input } from "@/components/ui/input"
 import VideoPlayer from "@/components/video-player"
 import { Card } from "@/components/ui/card"
+import { generateVideo, type VideoOutputs } from "@/lib/video-job"
 
-type VideoResponse = {
+// posterUrl, previewUrl and mobileUrl are filled in as the job's renditions land
+type VideoResponse = VideoOutputs & {
   id: string
   question: string
-  videoUrl: string
   timestamp: Date
 }
 
@@ -21,6 +22,13 @@ export default function VideoQAInterface() {
   const [isGenerating, setIsGenerating] = useState(false)
   const [currentVideo, setCurrentVideo] = useState<VideoResponse | null>(null)
   const [history, setHistory] = useState<VideoResponse[]>([])
+  const [error, setError] = useState<string | null>(null)
+
+  // Apply a rendition update to the video wherever it is shown
+  const updateVideo = (id: string, outputs: VideoOutputs) => {
+    setHistory((prev) => prev.map((item) => (item.id === id ? { ...item, ...outputs } : item)))
+    setCurrentVideo((prev) => (prev?.id === id ? { ...prev, ...outputs } : prev))
+  }
 
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault()
@@ -29,22 +37,25 @@ export default function VideoQAInterface() {
 
     // Start generating
     setIsGenerating(true)
+    setError(null)
+    const id = Date.now().toString()
 
-    // Simulate video generation delay
-    setTimeout(() => {
-      const newVideo: VideoResponse = {
-        id: Date.now().toString(),
-        question,
-        // Using a sample video for demonstration
-        videoUrl: "https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4",
-        timestamp: new Date(),
-      }
+    try {
+      const outputs = process.env.NEXT_PUBLIC_SKIP_VIDEO_GENERATION
+        ? // Using a sample video for development
+          { videoUrl: "https://commondatastorage.googleapis.com/gtv-videos-bucket/sample/BigBuckBunny.mp4" }
+        : await generateVideo(question, (update) => updateVideo(id, update))
+      const newVideo: VideoResponse = { id, question, ...outputs, timestamp: new Date() }
 
       setCurrentVideo(newVideo)
       setHistory((prev) => [newVideo, ...prev])
-      setIsGenerating(false)
       setQuestion("")
-    }, 3000)
+    } catch (err) {
+      setError(err instanceof Error ? err.message : String(err))
+      console.error("Video generation error:", err)
+    } finally {
+      setIsGenerating(false)
+    }
   }
 
   return (
@@ -64,7 +75,11 @@ export default function VideoQAInterface() {
                 <p className="text-slate-600 dark:text-slate-400">Generating your video...</p>
               </div>
             ) : currentVideo ? (
-              <VideoPlayer videoUrl={currentVideo.videoUrl} />
+              <VideoPlayer
+                videoUrl={currentVideo.videoUrl}
+                posterUrl={currentVideo.posterUrl}
+                mobileUrl={currentVideo.mobileUrl}
+              />
             ) : (
               <div className="absolute inset-0 flex items-center justify-center">
                 <p className="text-slate-500 dark:text-slate-400 text-center px-4">
@@ -74,6 +89,10 @@ export default function VideoQAInterface() {
             )}
           </div>
 
+          {error && (
+            <div className="p-4 bg-red-100 dark:bg-red-900/30 text-red-700 dark:text-red-300">{error}</div>
+          )}
+
           {currentVideo && (
             <div className="p-4 bg-slate-50 dark:bg-slate-800/50">
               <h3 className="font-medium text-slate-900 dark:text-slate-200 mb-1">Question:</h3>
@@ -118,8 +137,20 @@ export default function VideoQAInterface() {
                     className="p-3 hover:bg-slate-50 dark:hover:bg-slate-800 cursor-pointer rounded-md"
                     onClick={() => setCurrentVideo(item)}
                   >
-                    <p className="text-slate-800 dark:text-slate-200 line-clamp-2 mb-1">{item.question}</p>
-                    <p className="text-xs text-slate-500 dark:text-slate-400">{item.timestamp.toLocaleString()}</p>
+                    <div className="flex gap-3">
+                      {(item.previewUrl || item.posterUrl) && (
+                        <img
+                          src={item.previewUrl || item.posterUrl}
+                          alt=""
+                          loading="lazy"
+                          className="w-24 aspect-video object-cover rounded bg-slate-100 dark:bg-slate-800"
+                        />
+                      )}
+                      <div className="min-w-0">
+                        <p className="text-slate-800 dark:text-slate-200 line-clamp-2 mb-1">{item.question}</p>
+                        <p className="text-xs text-slate-500 dark:text-slate-400">{item.timestamp.toLocaleString()}</p>
+                      </div>
+                    </div>
                   </li>
                 ))}
               </ul>
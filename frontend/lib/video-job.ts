@@ -0,0 +1,99 @@
+// Client for the backend's /generate job API
+
+//export const manimServerURL = "https://mathlens-beta-937226988264.us-central1.run.app";
+export const manimServerURL = "http://127.0.0.1:5000"
+
+export type Rendition = {
+  status: "pending" | "done" | "failed"
+  url?: string
+  content_type?: string
+  bytes?: number
+}
+
+// Everything a finished job offers for playback; renditions appear as they land
+export type VideoOutputs = {
+  videoUrl: string
+  posterUrl?: string
+  previewUrl?: string
+  mobileUrl?: string
+}
+
+// Prepend the server URL when the backend returns a relative path
+const absoluteUrl = (url: string) =>
+  url.startsWith("http") ? url : `${manimServerURL}/${url.replace(/^\/+/, "")}`
+
+export function videoOutputs(result: { video_url: string; renditions?: Record<string, Rendition> }): VideoOutputs {
+  const renditions = result.renditions || {}
+  const ready = (name: string) => {
+    const rendition = renditions[name]
+    return rendition?.status === "done" && rendition.url ? absoluteUrl(rendition.url) : undefined
+  }
+  return {
+    videoUrl: absoluteUrl(result.video_url),
+    posterUrl: ready("poster"),
+    previewUrl: ready("preview"),
+    mobileUrl: ready("mobile"),
+  }
+}
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms))
+
+/**
+ * Submit a question and poll its job until the video is done, then resolve
+ * with its outputs. The server's default prompt is used, which lets it
+ * answer canonical questions from pre-rendered scene templates. Polling carries on in the background while the job's
+ * renditions are still being made, calling `onUpdate` as each one lands.
+ * The first video is kept: swapping the source would restart playback.
+ */
+export async function generateVideo(
+  question: string,
+  onUpdate: (outputs: VideoOutputs) => void = () => {},
+  pollInterval = 2000,
+): Promise<VideoOutputs> {
+  const formData = new FormData()
+  formData.append("question", question)
+
+  const response = await fetch(`${manimServerURL}/generate`, {
+    method: "POST",
+    body: formData,
+  })
+  if (!response.ok) {
+    let errorBody = "Unknown error"
+    try {
+      const errorData = await response.json()
+      errorBody = errorData.error || JSON.stringify(errorData)
+    } catch (parseError) {
+      errorBody = await response.text()
+    }
+    throw new Error(`Video generation HTTP error! Status: ${response.status}, Message: ${errorBody}`)
+  }
+  const job = await response.json()
+  console.log("Video generation job:", job)
+
+  // Polling also keeps the job alive; the server cancels jobs nobody asks about
+  const poll = async () => (await fetch(`${manimServerURL}${job.status_url}`)).json()
+
+  let status = job.result ? job : await poll()
+  while (status.status !== "done") {
+    if (status.status === "error") {
+      throw new Error(`Video generation API Error: ${status.error}`)
+    }
+    await sleep(pollInterval)
+    status = await poll()
+  }
+  if (!status.result?.video_url) {
+    throw new Error("Unexpected response format from video generation API.")
+  }
+
+  const first = videoOutputs(status.result)
+  const followRenditions = async () => {
+    // `pending` counts background work (renditions, upgrades) still running
+    while (status.pending > 0) {
+      await sleep(pollInterval)
+      status = await poll()
+      onUpdate({ ...videoOutputs(status.result), videoUrl: first.videoUrl })
+    }
+  }
+  followRenditions().catch((error) => console.error("Following renditions failed:", error))
+  return first
+}
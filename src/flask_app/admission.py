@@ -0,0 +1,115 @@
+import time
+import logging
+import threading
+
+from metrics import REGISTRY
+from render_pool import PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+# Load levels, mildest first
+NORMAL = "normal"
+# Low-priority work (quality upgrades, new batches) is turned away
+SHED = "shed"
+# Previews also render at the draft tier with wait() calls shortened
+DEGRADE = "degrade"
+LEVELS = (NORMAL, SHED, DEGRADE)
+
+LOAD_LEVEL = REGISTRY.gauge(
+    "animator_load_level",
+    "Degradation level: 0 normal, 1 shedding low-priority work, 2 degrading previews",
+)
+ESTIMATED_WAIT = REGISTRY.gauge(
+    "animator_render_estimated_wait_seconds",
+    "Estimated queue wait for an interactive render",
+)
+DEGRADATIONS = REGISTRY.counter(
+    "animator_degradations_total",
+    "Work shed or degraded to keep interactive renders within the latency target",
+    ["action"],
+)
+
+
+class LoadGovernor:
+    """
+    Picks a load level from the scheduler's estimated queue wait for an
+    interactive render, measured against a latency target of `slo` seconds.
+    Past `shed_at` of the target low-priority work is shed; at the target
+    previews are degraded as well. A level is only left once the estimate
+    drops below `recover` of the threshold that raised it, so the service
+    doesn't flap around a boundary. A falsy `slo` keeps the level at normal.
+
+    Callers apply the level themselves and report what they actually did
+    with record(), which is what shows up in job results and metrics.
+    """
+
+    def __init__(
+        self, scheduler, slo=60, shed_at=0.5, recover=0.75, max_wait=1.0, interval=1.0
+    ):
+        self.scheduler = scheduler
+        self.slo = slo
+        self.shed_at = shed_at
+        self.recover = recover
+        # Longest wait() left in a degraded preview, in seconds
+        self.max_wait = max_wait
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._level = 0
+        self._estimate = 0.0
+        self._checked_at = None
+        self._counts = {}
+
+    def _thresholds(self):
+        return (0, self.slo * self.shed_at, self.slo)
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.interval:
+            return
+        self._checked_at = now
+        self._estimate = self.scheduler.estimated_wait(PRIORITY_INTERACTIVE)
+        thresholds = self._thresholds()
+        level = self._level
+        while level + 1 < len(LEVELS) and self._estimate >= thresholds[level + 1]:
+            level += 1
+        while level > 0 and self._estimate < thresholds[level] * self.recover:
+            level -= 1
+        if level != self._level:
+            log = logger.warning if level > self._level else logger.info
+            log(
+                f"Load level {LEVELS[self._level]} -> {LEVELS[level]} "
+                f"(estimated wait {self._estimate:.1f}s, target {self.slo:g}s)"
+            )
+            self._level = level
+        LOAD_LEVEL.set(self._level)
+        ESTIMATED_WAIT.set(self._estimate)
+
+    def assess(self):
+        """
+        The current level as a dict for one request: `level`,
+        `estimated_wait`, `slo`, and the `actions` record() adds to it.
+        """
+        if not self.slo:
+            return {"level": NORMAL, "estimated_wait": None, "slo": None, "actions": []}
+        with self._lock:
+            self._refresh()
+            return {
+                "level": LEVELS[self._level],
+                "estimated_wait": round(self._estimate, 1),
+                "slo": self.slo,
+                "actions": [],
+            }
+
+    def record(self, load, action):
+        """Note that `action` was taken because of `load` (from assess())"""
+        load["actions"].append(action)
+        DEGRADATIONS.inc(action=action)
+        with self._lock:
+            self._counts[action] = self._counts.get(action, 0) + 1
+
+    def stats(self):
+        stats = self.assess()
+        del stats["actions"]
+        with self._lock:
+            stats["degradations"] = dict(self._counts)
+        return stats
@@ -1,14 +1,59 @@
 import os
 import re
+import time
 import uuid
-import subprocess
 import shutil
+import tempfile
 import logging
-import traceback
 import warnings
-from flask import Flask, request, jsonify, send_from_directory, render_template
+import threading
+from functools import partial
+from flask import (
+    Flask,
+    Response,
+    request,
+    jsonify,
+    render_template,
+    stream_with_context,
+)
 from flask_cors import CORS
-from openai import OpenAI
+
+from jobs import Job, JobManager, JobCancelled, sse_events
+from batches import submit_batch
+from render_pool import (
+    RenderScheduler,
+    QueueFull,
+    available_cores,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BACKGROUND,
+    PRIORITY_BATCH,
+)
+from render_cache import RenderCache, script_key
+from limits import limits_from_env
+from warm_pool import WarmRenderPool, OneShotDryRunner
+from glyph_cache import GlyphCache
+from preflight import preflight, PreflightError
+from segmented import render_segmented
+from quality import (
+    QUALITY_TIERS,
+    DEFAULT_PREVIEW,
+    DEGRADED_PREVIEW,
+    tier_flags,
+    video_path as tier_video_path,
+)
+from llm_cache import LLMCache, request_key
+from llm_gateway import gateway_from_env
+from code_repair import repair_code, cap_waits
+from render_repair import BrokenScript, request_repair, trim_error
+from video_delivery import send_video, faststart
+from storage import IMMUTABLE_PREFIXES, Uploader, storage_from_env
+from renditions import renditions_from_env
+from janitor import Janitor
+from work_queue import SQLiteQueue, queue_api, queue_from_url
+from render_node import QueueRenderScheduler
+from scene_templates import match_template, prewarm as prewarm_templates
+from admission import LoadGovernor, NORMAL, DEGRADE
+from metrics import span, observe_stage, update_render_gauges, render_latest, CONTENT_TYPE
 
 # Suppress watchdog/fsevents warnings
 warnings.filterwarnings(
@@ -31,9 +76,9 @@ if not os.environ.get("OPENAI_API_KEY"):
     logger.warning("OPENAI_API_KEY environment variable is not set!")
     logger.warning("Set it with: export OPENAI_API_KEY=your_api_key_here")
 
-# Initialize OpenAI client
+# Initialize the OpenAI client behind the rate limiting / retrying gateway
 try:
-    client = OpenAI()
+    client = gateway_from_env()
     logger.info("OpenAI client initialized successfully")
 except Exception as e:
     logger.error(f"Error initializing OpenAI client: {str(e)}")
@@ -46,6 +91,218 @@ STATIC_DIR = "media"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(STATIC_DIR, exist_ok=True)
 
+# Background job pool; /generate only enqueues, these threads do the work
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "8"))
+# /generate_batch items run on their own threads so they never delay /generate
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "16"))
+# A client whose last event stream dropped has this long to reconnect or poll
+# before it gives up its claim on the job; 0 ignores dropped streams
+DISCONNECT_GRACE = float(os.environ.get("DISCONNECT_GRACE", "15"))
+# A running job nobody has polled or streamed for this long is cancelled, so
+# it must be well above any client's poll interval; 0 keeps idle jobs running
+IDLE_GRACE = float(os.environ.get("IDLE_GRACE", "120"))
+jobs = JobManager(
+    max_workers=JOB_WORKERS,
+    lanes={"batch": BATCH_WORKERS},
+    disconnect_grace=DISCONNECT_GRACE or None,
+    idle_grace=IDLE_GRACE or None,
+)
+
+# Largest number of questions one /generate_batch request may carry
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "1000"))
+
+# Bounded render slots, one per core unless overridden
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", "0")) or available_cores()
+# "warm" renders in pre-started processes that import manim once; "cli" spawns manim
+RENDER_BACKEND = os.environ.get("RENDER_BACKEND", "warm")
+# Per-render time, memory and length caps (RENDER_TIMEOUT, RENDER_CPU_SECONDS,
+# RENDER_MEMORY_BYTES, RENDER_MAX_FRAMES, RENDER_MAX_SECONDS)
+render_limits = limits_from_env()
+glyph_cache = GlyphCache(
+    os.environ.get(
+        "GLYPH_CACHE_DIR", os.path.join(tempfile.gettempdir(), "animator-glyph-cache")
+    ),
+    max_bytes=int(os.environ.get("GLYPH_CACHE_MAX_BYTES", 512 * 1024**2)),
+)
+
+# With a work queue (sqlite://<path> or http(s)://<host>/queue), renders run on
+# render nodes (render_node.py) instead of in this process
+WORK_QUEUE_URL = os.environ.get("WORK_QUEUE_URL")
+WORK_QUEUE_TOKEN = os.environ.get("WORK_QUEUE_TOKEN")
+if WORK_QUEUE_URL:
+    work_queue = queue_from_url(WORK_QUEUE_URL, token=WORK_QUEUE_TOKEN)
+    render_scheduler = QueueRenderScheduler(
+        work_queue, max_queue=int(os.environ.get("RENDER_QUEUE_SIZE", "64"))
+    )
+    # Render nodes on other hosts lease through this app
+    if WORK_QUEUE_TOKEN and isinstance(work_queue, SQLiteQueue):
+        app.register_blueprint(
+            queue_api(work_queue, WORK_QUEUE_TOKEN), url_prefix="/queue"
+        )
+else:
+    render_scheduler = RenderScheduler(
+        workers=RENDER_WORKERS,
+        max_queue=int(os.environ["RENDER_QUEUE_SIZE"])
+        if "RENDER_QUEUE_SIZE" in os.environ
+        else None,
+        backend=WarmRenderPool(
+            RENDER_WORKERS,
+            max_jobs_per_worker=int(os.environ.get("RENDER_WORKER_MAX_JOBS", "50")),
+            glyph_cache=glyph_cache,
+            limits=render_limits,
+        )
+        if RENDER_BACKEND == "warm"
+        else None,
+        limits=render_limits,
+    )
+
+# Pre-flight dry runs never take a render slot: separate warm workers with the
+# warm backend, otherwise a one-shot process per script. "0" skips dry runs
+if os.environ.get("PREFLIGHT_WORKERS") == "0":
+    preflight_pool = None
+elif RENDER_BACKEND == "warm":
+    preflight_pool = WarmRenderPool(
+        int(os.environ.get("PREFLIGHT_WORKERS", "1")),
+        glyph_cache=glyph_cache,
+        limits=render_limits,
+    )
+else:
+    preflight_pool = OneShotDryRunner(glyph_cache=glyph_cache, limits=render_limits)
+
+# Target queue wait for interactive renders. Past half of it quality upgrades
+# and new batches are shed; past all of it previews drop to the draft tier
+# with wait() calls capped at DEGRADE_MAX_WAIT seconds. 0 disables both
+governor = LoadGovernor(
+    render_scheduler,
+    slo=float(os.environ.get("LATENCY_SLO", "60")),
+    max_wait=float(os.environ.get("DEGRADE_MAX_WAIT", "1")),
+)
+
+# Persistent cache of LLM completions keyed on model, prompt and question
+llm_cache = LLMCache(
+    os.environ.get("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite3")),
+    ttl=int(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600)),
+    max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 5000)),
+)
+
+# Stream completions and start fixing as soon as the code fence closes
+LLM_STREAM = os.environ.get("LLM_STREAM", "1") != "0"
+
+# Times a script that fails validation or rendering goes back to the LLM
+# with its error before the job fails
+RENDER_REPAIR_ATTEMPTS = int(os.environ.get("RENDER_REPAIR_ATTEMPTS", "2"))
+
+# Scenes with at least this many play()/wait() calls are split across idle slots
+SEGMENT_MIN_PLAYS = int(os.environ.get("SEGMENT_MIN_PLAYS", "6"))
+
+# Batch renders wait while this many renders are queued, leaving the rest to /generate
+BATCH_QUEUE_LIMIT = int(
+    os.environ.get("BATCH_QUEUE_LIMIT", max(render_scheduler.max_queue // 2, 1))
+)
+
+# Final quality when the request doesn't ask for one; a preview is served first
+VIDEO_QUALITY = os.environ.get("VIDEO_QUALITY", "high")
+
+# Content-addressed cache of finished renders, shared by all workers
+RENDER_CACHE_DIR = os.environ.get("RENDER_CACHE_DIR", os.path.join(STATIC_DIR, "cache"))
+render_cache = RenderCache(
+    RENDER_CACHE_DIR,
+    max_bytes=int(os.environ.get("RENDER_CACHE_MAX_BYTES", 2 * 1024**3)),
+)
+
+# Where finished videos are published; video_url is the backend's URL for them
+uploader = Uploader(
+    storage_from_env(STATIC_DIR, base_url=STATIC_DIR),
+    media_root=STATIC_DIR,
+    workers=int(os.environ.get("UPLOAD_WORKERS", "2")),
+    cache_root=RENDER_CACHE_DIR,
+)
+
+# Poster frame, GIF preview and low-bitrate variant of every finished video,
+# transcoded on their own threads; RENDITIONS="" turns them off
+rendition_pool = renditions_from_env()
+
+
+def quota(name, default_bytes, default_files):
+    """(max_bytes, max_files) from <name>_QUOTA_BYTES / <name>_QUOTA_FILES; 0 disables"""
+    max_bytes = int(os.environ.get(f"{name}_QUOTA_BYTES", default_bytes))
+    max_files = int(os.environ.get(f"{name}_QUOTA_FILES", default_files))
+    return (max_bytes or None, max_files or None)
+
+
+# Evicts least recently served scripts and render trees once over quota
+janitor = Janitor(
+    os.environ.get("JANITOR_INDEX_PATH", os.path.join(".cache", "artifacts.sqlite3")),
+    media_dir=STATIC_DIR,
+    script_dir=OUTPUT_DIR,
+    quotas={
+        "videos": quota("VIDEO", 5 * 1024**3, 5000),
+        "scripts": quota("SCRIPT", 256 * 1024**2, 20000),
+    },
+    interval=int(os.environ.get("JANITOR_INTERVAL", "60")),
+    min_age=int(os.environ.get("JANITOR_MIN_AGE", "600")),
+    tex_dirs=[os.path.join(STATIC_DIR, "Tex"), glyph_cache.tex_dir],
+)
+
+
+# Prompt for requests that don't send their own; only these use scene templates
+DEFAULT_PROMPT = """\
+You're an expert educator and Manim CE developer. Create a **complete and runnable
+Manim CE script** that visually explains the following math question in a clear,
+step-by-step animation: **Question:** "{QUESTION}"
+
+Goals:
+- Define a class called {SCENE_NAME} that inherits from Scene
+- Break the explanation into 3–6 short steps
+- Use `Text()` to explain each step simply (one sentence max)
+- Use `MathTex()` for all math (e.g., equations, fractions, dot products)
+- If applicable, use `Matrix()` objects to show visual matrix/vector layout
+- Use `Write`, `Create`, and `FadeOut` to animate content
+- Add pauses using `wait(1)` or `wait(2)` after each step
+- Visually show the final answer at the end of the scene
+
+Constraints:
+- Don't use `.dot()`, `.T`, or real math operations
+- Don't use numpy, sympy, or external math libraries
+- Keep all math symbolic and visually instructive
+- Keep visuals uncluttered: if multiple elements are on screen together, use
+  `.next_to()` or `.shift()` to space them; if an element replaces the previous
+  one, center it (e.g., at `ORIGIN`, `DOWN`, or `UP`) so content stays balanced
+- Everything displayed should be centered on the screen vertically and horizontally
+- Nothing should be outside of the bounds of the screen
+- The script shouldn't include unnecessary comments
+
+Output:
+Respond ONLY with valid Python code. The script must run with
+`manim -pql script.py {SCENE_NAME}` without errors
+"""
+
+# Answer canonical questions (matrix times vector, Pythagoras, dot product,
+# determinant) from hand-tuned scene templates instead of the LLM, and render
+# the TEMPLATE_PREWARM most popular ones at startup
+SCENE_TEMPLATES = os.environ.get("SCENE_TEMPLATES", "1") != "0"
+TEMPLATE_PREWARM = int(os.environ.get("TEMPLATE_PREWARM", "4"))
+
+
+def prepare_render(script_file, path):
+    """What every finished render goes through before it is cached"""
+    faststart(path)
+    janitor.track_render(script_file)
+
+
+if SCENE_TEMPLATES and TEMPLATE_PREWARM:
+    threading.Thread(
+        target=prewarm_templates,
+        args=(render_scheduler, render_cache, OUTPUT_DIR),
+        kwargs={
+            "tiers": list(dict.fromkeys([DEFAULT_PREVIEW, VIDEO_QUALITY])),
+            "count": TEMPLATE_PREWARM,
+            "prepare": prepare_render,
+        },
+        name="template-prewarm",
+        daemon=True,
+    ).start()
+
 
 @app.route("/")
 def index():
@@ -55,117 +312,708 @@ def index():
 @app.route("/generate", methods=["POST"])
 def generate():
     question = request.form.get("question")
-    custom_prompt = request.form.get("prompt")
+    # None means DEFAULT_PROMPT; only then may a scene template answer
+    custom_prompt = request.form.get("prompt") or None
+    # Skip the LLM cache and ask for a new generation
+    fresh = request.form.get("fresh", "").lower() in ("1", "true", "yes")
+    quality = request.form.get("quality", VIDEO_QUALITY)
 
-    if not question or not custom_prompt:
-        return jsonify({"error": "Missing question or prompt"}), 400
+    if not question:
+        return jsonify({"error": "Missing question"}), 400
+    if quality not in QUALITY_TIERS:
+        return jsonify({"error": f"Unknown quality, use one of {list(QUALITY_TIERS)}"}), 400
+
+    # Pre-rendered answers to canonical questions are served on the spot
+    if SCENE_TEMPLATES and not fresh and custom_prompt is None:
+        job = template_job(question, quality)
+        if job is not None:
+            logger.info(f"Served job {job.id} from a pre-rendered template")
+            return (
+                jsonify(
+                    {
+                        "job_id": job.id,
+                        "status": job.status,
+                        "status_url": f"/jobs/{job.id}",
+                        "events_url": f"/jobs/{job.id}/events",
+                        "coalesced": False,
+                        "result": job.result,
+                    }
+                ),
+                202,
+            )
 
     # Check if OpenAI client is available
     if client is None:
         return jsonify({"error": "OpenAI client not initialized. Check API key."}), 500
 
+    # Identical questions asked at once share one job; fresh ones never do
+    key = None if fresh else request_key(question, custom_prompt, quality)
+    job = jobs.attach(key) if key else None
+    coalesced = job is not None
+    if not coalesced:
+        # Shed load up front rather than accepting work we cannot render soon
+        if render_scheduler.saturated():
+            return busy_response(render_scheduler.retry_after())
+        if key:
+            job, coalesced = jobs.submit_once(
+                key, run_generation, question, custom_prompt, fresh, quality
+            )
+        else:
+            job = jobs.submit(run_generation, question, custom_prompt, fresh, quality)
+    if coalesced:
+        logger.info(f"Attached to in-flight job {job.id} for question: {question}")
+    else:
+        logger.info(f"Queued job {job.id} for question: {question}")
+    return (
+        jsonify(
+            {
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/jobs/{job.id}",
+                "events_url": f"/jobs/{job.id}/events",
+                # Another request started this job; its events replay from the start
+                "coalesced": coalesced,
+                # Poll status_url or keep events_url open at least this often
+                # (seconds), or the job is cancelled as abandoned; None: never
+                "idle_timeout": IDLE_GRACE or None,
+            }
+        ),
+        202,
+    )
+
+
+def template_job(question, quality):
+    """
+    A finished job for a question whose template is already rendered at
+    `quality`, or None. Template questions that miss the render cache still
+    skip the LLM in run_generation.
+    """
+    matched = match_template(question)
+    if matched is None:
+        return None
+    template, params = matched
+    code = template.script(params)
+    with span("template", template=template.name) as s:
+        path = render_cache.get(script_key(code, template.class_name, tier_flags(quality)))
+        if path is None:
+            return None
+        s["outcome"] = "cached"
+        video_url = uploader.publish(path)
+    job = Job(kind="template")
+    jobs.track(job)
+    job.finish(
+        generation_result(
+            video_url,
+            quality,
+            None,
+            matched,
+            schedule_renditions(job, path),
+            cached=True,
+        )
+    )
+    return job
+
+
+@app.route("/generate_batch", methods=["POST"])
+def generate_batch():
+    """
+    Queue many questions that share one prompt template. Accepts JSON
+    ({"questions": [...], "prompt": ..., "quality": ..., "fresh": ...}) or a
+    form with repeated `question` fields. Duplicate questions are folded
+    together; the returned batch streams an "item" event per finished item.
+    """
+    payload = request.get_json(silent=True) or {}
+
+    def field(name, default=None):
+        return payload.get(name, request.form.get(name, default))
+
+    questions = payload.get("questions") or request.form.getlist("question")
+    custom_prompt = field("prompt") or None
+    fresh = str(field("fresh", "")).lower() in ("1", "true", "yes")
+    quality = field("quality", VIDEO_QUALITY)
+
+    if not isinstance(questions, list) or not questions:
+        return jsonify({"error": "Missing questions"}), 400
+    if not all(isinstance(q, str) and q.strip() for q in questions):
+        return jsonify({"error": "Every question must be a non-empty string"}), 400
+    if len(questions) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} questions per batch"}), 413
+    if quality not in QUALITY_TIERS:
+        return jsonify({"error": f"Unknown quality, use one of {list(QUALITY_TIERS)}"}), 400
+    if client is None:
+        return jsonify({"error": "OpenAI client not initialized. Check API key."}), 500
+    # Bulk work is the first to go when interactive latency is at risk
+    load = governor.assess()
+    if load["level"] != NORMAL:
+        governor.record(load, "shed_batch")
+        return busy_response(
+            render_scheduler.retry_after(),
+            "Batches are paused while interactive renders are backed up, try again later",
+        )
+
+    batch = submit_batch(
+        jobs, questions, run_generation, custom_prompt, fresh, quality, batch=True
+    )
+    return (
+        jsonify(
+            {
+                **batch.to_dict(),
+                "status_url": f"/jobs/{batch.id}",
+                "events_url": f"/jobs/{batch.id}/events",
+            }
+        ),
+        202,
+    )
+
+
+@app.route("/render_stats")
+def render_stats():
+    stats = render_scheduler.stats()
+    stats["load"] = governor.stats()
+    if client is not None:
+        stats["llm"] = client.stats()
+    return jsonify(stats)
+
+
+@app.route("/metrics")
+def metrics():
+    """Stage timings and render queue state in the Prometheus text format"""
+    update_render_gauges(render_scheduler.stats())
+    # Refreshes the load level gauges
+    governor.assess()
+    return Response(render_latest(), content_type=CONTENT_TYPE)
+
+
+@app.route("/health")
+def health_check():
+    return jsonify({"status": "ok"})
+
+
+def busy_response(retry_after, error="Render queue is full, try again later"):
+    response = jsonify({"error": error, "retry_after": retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    # Polling counts as still being there for the disconnect check
+    job.seen()
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    """
+    Give up on a job. Coalesced requests share one job, so it only stops
+    (killing its renders) once every request attached to it has cancelled.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    cancelled = job.release()
+    return jsonify({**job.to_dict(), "cancelled": cancelled})
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    last_id = int(request.headers.get("Last-Event-ID", -1))
+    return Response(
+        stream_with_context(sse_events(job, last_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def generation_result(
+    video_url,
+    quality,
+    script_id,
+    matched,
+    renditions,
+    cached=False,
+    upgrade=None,
+    repairs=(),
+    load=None,
+):
+    """What a finished generation reports; every path returns the same keys"""
+    return {
+        "video_url": video_url,
+        "quality": quality,
+        "script_id": script_id,
+        "cached": cached,
+        "upgrade": upgrade,
+        "repairs": list(repairs),
+        "template": matched[0].name if matched else None,
+        "renditions": renditions,
+        # What the load governor changed about this job, if anything
+        "degradation": load if load and load["actions"] else None,
+    }
+
+
+def run_generation(
+    job, question, custom_prompt, fresh=False, quality=VIDEO_QUALITY, batch=False
+):
+    """
+    Runs on the job pool: LLM call, code fix, preview render. When `quality`
+    is above the preview tier, a background re-render is queued and swaps the
+    job's video_url once it lands. `batch` items render behind interactive
+    work and wait for queue room instead of failing when it is full.
+    """
     scene_name = "GeneratedScene"
     script_id = uuid.uuid4().hex[:8]
     script_file = os.path.join(OUTPUT_DIR, f"{script_id}.py")
 
     # Format full prompt
-    full_prompt = custom_prompt.replace("{QUESTION}", question).replace(
-        "{SCENE_NAME}", scene_name
+    full_prompt = (
+        (custom_prompt or DEFAULT_PROMPT)
+        .replace("{QUESTION}", question)
+        .replace("{SCENE_NAME}", scene_name)
     )
 
-    try:
-        logger.info(f"Sending request to OpenAI for question: {question}")
-        # Call OpenAI GPT-4
+    # Canonical questions come from a hand-tuned template, with no LLM call;
+    # a custom prompt asks for something a template can't promise
+    use_template = SCENE_TEMPLATES and not fresh and custom_prompt is None
+    matched = match_template(question) if use_template else None
+    if matched:
+        template, params = matched
+        scene_name = template.class_name
+        logger.info(f"Question matched the {template.name} template: {question}")
+        job.emit("template", template=template.name, script_id=script_id)
+        code = template.script(params)
+    else:
+        code = llm_script(job, question, full_prompt, fresh, batch, script_id, scene_name)
+
+    # Save the script
+    with span("file_io", script_id, op="save_script"):
+        with open(script_file, "w") as f:
+            f.write(code)
+    janitor.track_script(script_file)
+
+    logger.info(f"Generated script saved to {script_file}")
+
+    # Asking for the draft tier gets just that; better tiers start with a preview
+    preview_tier = DEGRADED_PREVIEW if quality == DEGRADED_PREVIEW else DEFAULT_PREVIEW
+    upgrade_tier = quality if quality != preview_tier else None
+
+    # Identical scripts render to identical videos; skip Manim on a hit
+    if upgrade_tier:
+        with span("file_io", script_id, op="cache_lookup", tier=upgrade_tier):
+            cached_path = render_cache.get(
+                script_key(code, scene_name, tier_flags(upgrade_tier))
+            )
+        if cached_path:
+            logger.info(f"Render cache hit for {script_id}: {cached_path}")
+            with span("file_io", script_id, op="upload"):
+                video_url = uploader.publish(cached_path)
+            # Already at the requested tier, so there is nothing to upgrade
+            return generation_result(
+                video_url,
+                upgrade_tier,
+                script_id,
+                matched,
+                schedule_renditions(job, cached_path, script_id),
+                cached=True,
+            )
+
+    preview_key = script_key(code, scene_name, tier_flags(preview_tier))
+    with span("file_io", script_id, op="cache_lookup", tier=preview_tier):
+        video_path = render_cache.get(preview_key)
+    load = governor.assess()
+    degrade = load["level"] == DEGRADE and preview_tier != DEGRADED_PREVIEW
+    if video_path is None and degrade:
+        # Interactive renders are over their latency target: render less
+        preview_tier = DEGRADED_PREVIEW
+        governor.record(load, "draft_tier")
+        capped = cap_waits(code, governor.max_wait)
+        if capped != code:
+            code = capped
+            with span("file_io", script_id, op="save_script"):
+                with open(script_file, "w") as f:
+                    f.write(code)
+            governor.record(load, "cap_waits")
+        preview_key = script_key(code, scene_name, tier_flags(preview_tier))
+        with span("file_io", script_id, op="cache_lookup", tier=preview_tier):
+            video_path = render_cache.get(preview_key)
+    cached = video_path is not None
+    repairs = []
+    if cached:
+        logger.info(f"Render cache hit for {script_id}: {video_path}")
+    while video_path is None:
+        attempt_start = time.perf_counter()
         try:
-            response = client.chat.completions.create(
+            video_path = render_preview(
+                job,
+                code,
+                script_file,
+                scene_name,
+                preview_key,
+                batch=batch,
+                tier=preview_tier,
+            )
+        except BrokenScript as e:
+            # A template that fails is a bug here, not something the LLM can fix
+            if matched or len(repairs) >= RENDER_REPAIR_ATTEMPTS:
+                job.fail(str(e), **e.details, repairs=repairs)
+                return None
+            code = repair_script(job, code, e, script_file, scene_name, len(repairs) + 1)
+            preview_key = script_key(code, scene_name, tier_flags(preview_tier))
+            repairs.append(
+                {
+                    "attempt": len(repairs) + 1,
+                    "stage": e.stage,
+                    "error": e.error,
+                    # The failed validation or render plus the LLM's fix
+                    "seconds": round(time.perf_counter() - attempt_start, 2),
+                }
+            )
+            continue
+        if video_path is None:
+            return None
+    if repairs and not matched:
+        # Later requests for this question start from the script that worked
+        llm_cache.store("gpt-4", full_prompt, question, 0.3, f"```python\n{code}\n```")
+
+    with span("file_io", script_id, op="upload"):
+        video_url = uploader.publish(video_path)
+    renditions = schedule_renditions(job, video_path, script_id)
+
+    upgrade = None
+    if upgrade_tier and load["level"] != NORMAL:
+        logger.info(f"Shedding the {upgrade_tier} upgrade for {script_file} under load")
+        governor.record(load, "shed_upgrade")
+        upgrade = "shed"
+    elif upgrade_tier:
+        upgrade = schedule_upgrade(
+            job, code, script_file, scene_name, upgrade_tier, batch=batch
+        )
+
+    return generation_result(
+        video_url,
+        preview_tier,
+        script_id,
+        matched,
+        renditions,
+        cached=cached,
+        upgrade=upgrade,
+        repairs=repairs,
+        load=load,
+    )
+
+
+def llm_script(job, question, full_prompt, fresh, batch, script_id, scene_name):
+    """Ask the LLM for the scene (streaming it to the job's subscribers) and fix it up"""
+    logger.info(f"Sending request to OpenAI for question: {question}")
+    job.emit("llm", script_id=script_id)
+    # Forward the script to SSE subscribers a line at a time as it streams in
+    pending = []
+
+    def on_code(text):
+        # Stops the completion mid-stream once the job is cancelled
+        job.check_cancelled()
+        pending.append(text)
+        if "\n" in text:
+            job.publish("code_partial", text="".join(pending))
+            pending.clear()
+
+    # Nobody watches a batch item's script being typed
+    if batch:
+        on_code = None
+
+    # Call OpenAI GPT-4
+    try:
+        with span("llm", script_id, model="gpt-4", streamed=LLM_STREAM) as s:
+            content, cache_hit = llm_cache.complete(
+                client,
                 model="gpt-4",
-                messages=[{"role": "user", "content": full_prompt}],
+                prompt=full_prompt,
+                question=question,
                 temperature=0.3,
+                bypass=fresh,
+                stream=LLM_STREAM,
+                on_code=on_code,
             )
-            content = response.choices[0].message.content
+            if cache_hit:
+                s["outcome"] = "cached"
+        if pending:
+            job.publish("code_partial", text="".join(pending))
+        if not cache_hit:
             logger.info("Successfully received response from OpenAI")
-        except Exception as api_error:
-            logger.error(f"OpenAI API error: {str(api_error)}")
-            return jsonify({"error": f"OpenAI API error: {str(api_error)}"}), 500
+    except JobCancelled:
+        raise
+    except Exception as api_error:
+        logger.error(f"OpenAI API error: {str(api_error)}")
+        raise RuntimeError(f"OpenAI API error: {str(api_error)}") from api_error
 
+    job.check_cancelled()
+    job.emit("code_fix", llm_cached=cache_hit)
+    with span("extract", script_id):
         code = extract_code(content)
-        code = auto_fix_code(code)
+    with span("auto_fix", script_id):
+        code = repair_code(code, scene_name)
+    return code
 
-        # Save the script
-        with open(script_file, "w") as f:
-            f.write(code)
 
-        logger.info(f"Generated script saved to {script_file}")
-        # Render using Manim
-        try:
-            logger.info(f"Running Manim for {script_file} with scene {scene_name}")
-            # Run Manim but don't check for errors since it might still generate the video
-            subprocess.run(
-                ["manim", "-pql", script_file, scene_name], capture_output=True
+def render_preview(
+    job, code, script_file, scene_name, cache_key, batch=False, tier=DEFAULT_PREVIEW
+):
+    """
+    Validate and render the fast preview `tier`. Returns the video path, or
+    None once the job has been failed or cancelled; raises BrokenScript
+    when the script itself is at fault.
+    """
+    script_id = os.path.splitext(os.path.basename(script_file))[0]
+
+    # Reject broken scripts before they take a render slot
+    job.emit("validate")
+    try:
+        with span("validate", script_id) as s:
+            try:
+                checks = preflight(
+                    code,
+                    script_file,
+                    scene_name,
+                    dry_runner=preflight_pool,
+                    max_duration=render_limits.max_duration,
+                    cancel=job.cancelled,
+                )
+            except PreflightError:
+                s["outcome"] = "rejected"
+                raise
+    except PreflightError as e:
+        logger.info(f"Pre-flight rejected {script_file}: {e}")
+        raise BrokenScript(
+            "Generated script failed validation",
+            "validate",
+            "\n".join(e.problems),
+            problems=e.problems,
+            script_id=script_id,
+        ) from e
+
+    # Long scenes fan out over whatever render slots are idle right now
+    num_plays = checks.get("num_plays") or 0
+    segments = render_scheduler.idle_slots()
+    # Batches already keep every slot busy; splitting would only add overhead
+    if batch or num_plays < SEGMENT_MIN_PLAYS or segments < 2:
+        segments = 1
+
+    job.check_cancelled()
+    # Render using Manim
+    job.emit("render", script_file=script_file, scene_name=scene_name, segments=segments)
+    result = None
+    render_error = None
+    try:
+        logger.info(f"Running Manim for {script_file} with scene {scene_name}")
+        # Includes the time spent waiting for a slot; see the queue_wait span
+        with span(
+            "render", script_id, tier=tier, segments=segments
+        ) as s:
+            # A non-zero exit can still leave a usable video (e.g. the preview step failing)
+            if segments > 1:
+                result = render_segmented(
+                    render_scheduler,
+                    script_file,
+                    scene_name,
+                    tier,
+                    num_plays,
+                    segments,
+                    cancel=job.cancelled,
+                )
+            else:
+                result = render_scheduler.render(
+                    script_file,
+                    scene_name,
+                    tier_flags(tier),
+                    PRIORITY_BATCH if batch else PRIORITY_INTERACTIVE,
+                    wait_below=BATCH_QUEUE_LIMIT if batch else None,
+                    cancel=job.cancelled,
+                )
+            if result.returncode != 0:
+                s["outcome"] = "error"
+    except QueueFull as e:
+        job.fail(str(e), retry_after=e.retry_after)
+        return None
+    except Exception as e:
+        print(f"Manim execution error: {str(e)}")
+        render_error = e
+        # Continue anyway to check if video was generated despite errors
+
+    # The render was killed; the job already reports the cancellation
+    if job.cancelled.is_set():
+        return None
+
+    video_path = tier_video_path(script_file, scene_name, tier)
+    logger.info(f"Expected video path: {video_path}")
+
+    if not os.path.exists(video_path):
+        if result is None:
+            # The render never ran (e.g. it was dead-lettered); not the script's fault
+            job.fail(
+                "Video rendering failed - file not found",
+                details=str(render_error),
+                script_id=script_id,
             )
-        except Exception as e:
-            print(f"Manim execution error: {str(e)}")
-            # Continue anyway to check if video was generated despite errors
-
-        # Get final video path
-        video_path = os.path.join(
-            VIDEO_DIR,
-            os.path.splitext(os.path.basename(script_file))[0],
-            f"{scene_name}.mp4",
+            return None
+        stderr = result.stderr or ""
+        raise BrokenScript(
+            "Video rendering failed - file not found",
+            "render",
+            trim_error(stderr, script_file, code),
+            details=stderr[-2000:],
+            script_id=script_id,
         )
 
-        video_path = f"media/videos/{script_id}/480p15/GeneratedScene.mp4"
-        logger.info(f"Expected video path: {video_path}")
+    with span("file_io", script_id, op="faststart"):
+        faststart(video_path)
+    janitor.track_render(script_file)
 
-        """
-        # Wait a moment and check multiple times for the video file
-        max_attempts = 5
-        for attempt in range(max_attempts):
-            if os.path.exists(video_path):
-                break
-            print(f"Video not found on attempt {attempt+1}, waiting...")
-            # Wait a second before checking again
-            subprocess.run(["sleep", "1"])
+    # Only clean renders go into the cache
+    if result is not None and result.returncode == 0:
+        with span("file_io", script_id, op="cache_put"):
+            video_path = render_cache.put(cache_key, video_path)
+    return video_path
 
-        if not os.path.exists(video_path):
-            return (
-                jsonify(
-                    {
-                        "error": "Video rendering failed - file not found after multiple attempts"
-                    }
-                ),
-                500,
+
+def repair_script(job, code, failure, script_file, scene_name, attempt):
+    """Send a BrokenScript's error back to the LLM and save the fixed script"""
+    script_id = os.path.splitext(os.path.basename(script_file))[0]
+    job.check_cancelled()
+    logger.info(f"Repair attempt {attempt} for {script_file} after {failure.stage} failed")
+    job.emit("repair", attempt=attempt, failed_stage=failure.stage, error=failure.error)
+    with span("repair", script_id, attempt=attempt, failed_stage=failure.stage) as s:
+        content, cache_hit = request_repair(
+            llm_cache, client, "gpt-4", code, failure.error, scene_name
+        )
+        if cache_hit:
+            s["outcome"] = "cached"
+    code = repair_code(extract_code(content), scene_name)
+    with span("file_io", script_id, op="save_script"):
+        with open(script_file, "w") as f:
+            f.write(code)
+    return code
+
+
+def schedule_renditions(job, video_path, script_id=None):
+    """
+    Start the renditions of `video_path` in the background and return the
+    job result's initial `renditions`, every one "pending" with the URL it
+    will have. As each lands a
+    "rendition" event carries the whole set. They are made from the first
+    video a job publishes; a later quality upgrade keeps them.
+    """
+    if rendition_pool is None:
+        return {}
+    renditions = rendition_pool.pending(video_path, uploader.url_for)
+    initial = {name: dict(entry) for name, entry in renditions.items()}
+    lock = threading.Lock()
+
+    def landed(name, future):
+        with lock:
+            renditions[name] = future.result()
+            # Under the lock, so results never go back to an older set
+            job.end_background(
+                "rendition",
+                renditions={name: dict(entry) for name, entry in renditions.items()},
             )
 
-        # Create a unique name for the video in static directory
-        unique_video_name = f"{script_id}_{scene_name}.mp4"
-        static_video_path = os.path.join(STATIC_DIR, unique_video_name)
+    # Counted before they start, so the job cannot settle in between
+    for _ in renditions:
+        job.begin_background()
+    futures = rendition_pool.submit(video_path, uploader.publish, script_id)
+    for name, future in futures.items():
+        future.add_done_callback(partial(landed, name))
+    return initial
 
-        # Copy the video to static directory
-        shutil.copy2(video_path, static_video_path)
-        """
 
-        return jsonify(
-            {
-                "video_url": video_path,
-            }
+def schedule_upgrade(job, code, script_file, scene_name, tier, batch=False):
+    """
+    Queue a `tier` re-render behind interactive work. When it finishes the
+    job's result switches to the better video and an "upgraded" event fires.
+    Returns "queued", or "skipped" when the render queue is full. Batch
+    upgrades wait for queue room instead of being skipped.
+    """
+    flags = tier_flags(tier)
+    script_id = os.path.splitext(os.path.basename(script_file))[0]
+    queued_at = time.perf_counter()
+    try:
+        future = render_scheduler.submit_render(
+            script_file,
+            scene_name,
+            flags,
+            priority=PRIORITY_BATCH if batch else PRIORITY_BACKGROUND,
+            wait_below=BATCH_QUEUE_LIMIT if batch else None,
+            # Cancelling the job after the preview stops the upgrade too
+            cancel=job.cancelled,
         )
+    except QueueFull:
+        logger.info(f"Render queue full, skipping {tier} upgrade for {script_file}")
+        return "skipped"
 
-    except Exception as e:
-        error_details = traceback.format_exc()
-        logger.error(f"Error in generate endpoint: {str(e)}")
-        logger.error(error_details)
-        return jsonify({"error": str(e), "details": error_details}), 500
+    job.begin_background()
+
+    def on_done(future):
+        path = tier_video_path(script_file, scene_name, tier)
+        try:
+            ok = future.result().returncode == 0 and os.path.exists(path)
+        except Exception:
+            logger.exception(f"{tier} upgrade for {script_file} failed")
+            ok = False
+        observe_stage(
+            "upgrade",
+            time.perf_counter() - queued_at,
+            "ok" if ok else "error",
+            script_id,
+            tier=tier,
+        )
+        if not ok:
+            job.end_background("upgrade_failed", upgrade="failed")
+            return
+
+        def prepare(path):
+            faststart(path)
+            janitor.track_render(script_file)
+            return render_cache.put(script_key(code, scene_name, flags), path)
+
+        def on_published(upload):
+            try:
+                video_url = upload.result()
+            except Exception:
+                logger.exception(f"Publishing the {tier} upgrade for {script_file} failed")
+                job.end_background("upgrade_failed", upgrade="failed")
+                return
+            job.end_background(
+                "upgraded", video_url=video_url, quality=tier, upgrade="done"
+            )
+
+        # Remux, cache and upload off the render thread so the slot frees up now
+        uploader.submit(path, prepare=prepare).add_done_callback(on_published)
+
+    future.add_done_callback(on_done)
+    return "queued"
 
 
 @app.route("/video/<folder>/<filename>")
 def serve_video(folder, filename):
-    return send_from_directory(os.path.join(VIDEO_DIR, folder), filename)
+    janitor.touch(os.path.join(VIDEO_DIR, folder, filename))
+    return send_video(os.path.join(VIDEO_DIR, folder), filename)
 
 
 @app.route(f"/{STATIC_DIR}/<path:filename>")
 def serve_static(filename):
-    return send_from_directory(STATIC_DIR, filename)
+    # Render cache entries are named by content, so their URLs can be cached forever
+    path = os.path.abspath(os.path.join(STATIC_DIR, filename))
+    immutable = path.startswith(
+        os.path.abspath(RENDER_CACHE_DIR) + os.sep
+    ) or filename.startswith(IMMUTABLE_PREFIXES)
+    janitor.touch(path)
+    return send_video(STATIC_DIR, filename, immutable=immutable)
 
 
 def extract_code(content: str) -> str:
@@ -182,22 +1030,5 @@ def extract_code(content: str) -> str:
         return content.strip()
 
 
-def auto_fix_code(code: str) -> str:
-    # Remove `.T`
-    code = re.sub(r"\.T\b", "", code)
-
-    # Replace 1D Matrix([1, 2]) → Matrix([[1], [2]])
-    def to_column(match):
-        nums = [f"[{n.strip()}]" for n in match.group(1).split(",")]
-        return f"Matrix([{', '.join(nums)}])"
-
-    code = re.sub(r"Matrix\(\[([^\[\]]+?)\]\)", to_column, code)
-
-    # Remove .dot() if mistakenly used
-    code = re.sub(r"Matrix\(.*?\)\.dot\(.*?\)", "# Removed invalid .dot() usage", code)
-
-    return code
-
-
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False)
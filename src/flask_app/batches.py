@@ -0,0 +1,130 @@
+import logging
+from functools import partial
+
+from jobs import Job
+from llm_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+# Item job events that change what a batch reports for the item
+ITEM_EVENTS = ("done", "error", "upgraded", "upgrade_failed", "rendition")
+
+
+class Batch(Job):
+    """
+    A set of questions generated together. Questions that normalize to the
+    same text become one item; each item runs as its own job, and the batch
+    publishes an "item" event whenever one finishes, fails or is upgraded.
+    The batch is done once every item has settled.
+    """
+
+    def __init__(self, questions):
+        self.items = []
+        by_key = {}
+        for position, question in enumerate(questions):
+            key = normalize_question(question)
+            if key not in by_key:
+                by_key[key] = len(self.items)
+                self.items.append(
+                    {
+                        "index": len(self.items),
+                        "question": question,
+                        # Positions in the submitted list answered by this item
+                        "inputs": [],
+                        "job_id": None,
+                        "status": "queued",
+                        "result": None,
+                        "error": None,
+                    }
+                )
+            self.items[by_key[key]]["inputs"].append(position)
+        self.submitted = len(questions)
+        self._unsettled = len(self.items)
+        self._item_jobs = []
+        super().__init__(kind="batch")
+        # Batches are fire-and-forget; only an explicit cancel stops one
+        self.cancel_on_disconnect = False
+
+    @property
+    def duplicates(self):
+        return self.submitted - len(self.items)
+
+    def _on_item_event(self, item, job, event):
+        """Listener on an item's job; runs under that job's lock"""
+        with self._cond:
+            if event["stage"] not in ITEM_EVENTS and item["status"] != "queued":
+                return
+            item["job_id"] = job.id
+            item["status"] = job.status
+            item["result"] = job.result
+            item["error"] = job.error
+            if event["stage"] in ITEM_EVENTS:
+                self.publish("item", **item)
+            if not job.settled:
+                return
+            self._unsettled -= 1
+            finished = self._unsettled == 0 and not self.finished
+        if finished:
+            self.finish(self.summary())
+
+    def cancel(self, reason="cancelled by client"):
+        """Cancel the batch and every item still running"""
+        cancelled = super().cancel(reason)
+        for job in list(self._item_jobs):
+            job.cancel(reason)
+        return cancelled
+
+    def summary(self):
+        with self._cond:
+            counts = {}
+            for item in self.items:
+                counts[item["status"]] = counts.get(item["status"], 0) + 1
+            return {
+                "submitted": self.submitted,
+                "unique": len(self.items),
+                "duplicates": self.duplicates,
+                "counts": counts,
+            }
+
+    def to_dict(self):
+        with self._cond:
+            return {
+                **super().to_dict(),
+                "batch_id": self.id,
+                "items": [dict(item) for item in self.items],
+                "summary": self.summary(),
+            }
+
+
+def submit_batch(manager, questions, fn, *args, lane="batch", **kwargs):
+    """
+    Dedupe `questions` and schedule `fn(job, question, *args, **kwargs)` for
+    each unique one on `manager`'s `lane`. Returns the Batch, which is also
+    registered with the manager so /jobs/<id> and its events work for it.
+    """
+    batch = Batch(questions)
+    manager.track(batch)
+    if not batch.items:
+        batch.finish(batch.summary())
+        return batch
+    batch.emit("running", unique=len(batch.items), duplicates=batch.duplicates)
+    for item in batch.items:
+        job = manager.submit(
+            fn,
+            item["question"],
+            *args,
+            kind="batch_item",
+            lane=lane,
+            listener=partial(batch._on_item_event, item),
+            **kwargs,
+        )
+        # Nobody polls items; they stop only with their batch
+        job.cancel_on_disconnect = False
+        with batch._cond:
+            item["job_id"] = job.id
+            batch._item_jobs.append(job)
+    logger.info(
+        f"Batch {batch.id}: {len(batch.items)} questions queued, "
+        f"{batch.duplicates} duplicates folded"
+    )
+    return batch
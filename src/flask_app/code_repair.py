@@ -0,0 +1,227 @@
+import io
+import ast
+import logging
+import tokenize
+
+logger = logging.getLogger(__name__)
+
+CLOSING = {"(": ")", "[": "]", "{": "}"}
+# Tokens that carry no code; skipped when looking at "the previous token"
+TRIVIA = {tokenize.COMMENT, tokenize.NL, tokenize.INDENT, tokenize.DEDENT}
+
+
+class _Frame:
+    """An open bracket and what the scanner has learned about its contents"""
+
+    __slots__ = (
+        "char",
+        "kind",
+        "start",
+        "index",
+        "name",
+        "scene",
+        "list",
+        "element",
+        "elements",
+        "valid",
+        "closed_at",
+    )
+
+    def __init__(self, char, kind, start, index):
+        self.char = char
+        # matrix_call, matrix_list, dot_call, class_bases or None
+        self.kind = kind
+        # Offset where a rewrite of this bracket begins
+        self.start = start
+        # Position of the bracket in the significant token stream
+        self.index = index
+        self.name = None  # class_bases: the class being defined
+        self.scene = False  # class_bases: a base looks like a Scene
+        self.list = None  # matrix_call: its list argument
+        self.element = None  # matrix_list: start offset of the element being read
+        self.elements = []  # matrix_list: (start, end) offsets of finished elements
+        self.valid = True  # matrix_list: still looks like a flat 1-D list
+        self.closed_at = None  # matrix_list: index of its "]"
+
+
+def repair_code(code: str, scene_name: str = None) -> str:
+    """
+    Fix common LLM mistakes in a generated Manim script with a single scan of
+    its tokens, so strings and comments are never rewritten and the cost stays
+    linear however long the lines are:
+
+    - drop `.T` (Manim matrices are not numpy arrays)
+    - turn a 1-D `Matrix([a, b])` into the column `Matrix([[a], [b]])`
+    - strip `.dot(...)` calls, keeping the receiver
+    - if `scene_name` is given but no class has that name, rename the first
+      Scene subclass to it
+
+    Scripts that do not tokenize are returned unchanged for pre-flight to report.
+    """
+    try:
+        tokens = tokenize.generate_tokens(io.StringIO(code).readline)
+        line_starts = [0, 0]
+        for line in io.StringIO(code):
+            line_starts.append(line_starts[-1] + len(line))
+        return _apply(code, _scan(tokens, line_starts, scene_name))
+    except (tokenize.TokenError, SyntaxError) as e:
+        logger.info(f"Skipping code repair, script does not tokenize: {e}")
+        return code
+
+
+def _scan(tokens, line_starts, scene_name):
+    """Collect (start, end, replacement) edits for every rewrite"""
+    edits = []
+    stack = []
+    prev = prev2 = None  # the two previous significant tokens
+    classes = set()
+    scene_class = None
+    names = {}  # identifier -> offsets where it is used, not as an attribute
+
+    for index, tok in enumerate(t for t in tokens if t.type not in TRIVIA):
+        start = line_starts[tok.start[0]] + tok.start[1]
+        end = line_starts[tok.end[0]] + tok.end[1]
+        top = stack[-1] if stack else None
+        is_op = tok.type == tokenize.OP
+
+        # Split a candidate Matrix list into its top-level elements
+        if top is not None and top.kind == "matrix_list":
+            if is_op and tok.string in (",", "]"):
+                if top.element is not None:
+                    prev_end = line_starts[prev.end[0]] + prev.end[1]
+                    top.elements.append((top.element, prev_end))
+                    top.element = None
+            elif top.element is None:
+                top.element = start
+                if tok.string == "[":
+                    top.valid = False  # already a column or 2-D
+
+        if is_op and tok.string in CLOSING:
+            kind = None
+            if tok.string == "(" and prev is not None:
+                after_dot = prev2 is not None and prev2.string == "."
+                if prev.string == "Matrix" and not after_dot:
+                    kind = "matrix_call"
+                elif prev.string == "dot" and after_dot:
+                    kind = "dot_call"
+                elif prev2 is not None and prev2.string == "class":
+                    kind = "class_bases"
+            elif (
+                tok.string == "["
+                and top is not None
+                and top.kind == "matrix_call"
+                and top.index == index - 1
+            ):
+                kind = "matrix_list"
+            frame = _Frame(tok.string, kind, start, index)
+            if kind == "dot_call":
+                frame.start = line_starts[prev2.start[0]] + prev2.start[1]
+            elif kind == "class_bases":
+                frame.name = prev.string
+            elif kind == "matrix_list":
+                top.list = frame
+            stack.append(frame)
+
+        elif is_op and tok.string in (")", "]", "}"):
+            if not stack or CLOSING[stack[-1].char] != tok.string:
+                raise SyntaxError("unbalanced brackets")
+            frame = stack.pop()
+            if frame.kind == "matrix_list":
+                frame.closed_at = index
+            elif frame.kind == "matrix_call":
+                inner = frame.list
+                # Only Matrix([...]) with the list as its sole argument
+                if (
+                    inner is not None
+                    and inner.closed_at == index - 1
+                    and inner.valid
+                    and inner.elements
+                ):
+                    for element_start, element_end in inner.elements:
+                        edits.append((element_start, element_start, "["))
+                        edits.append((element_end, element_end, "]"))
+            elif frame.kind == "dot_call":
+                edits.append((frame.start, end, ""))
+            elif frame.kind == "class_bases" and frame.scene and scene_class is None:
+                scene_class = frame.name
+
+        elif tok.type == tokenize.NAME:
+            after_dot = prev is not None and prev.string == "."
+            if tok.string == "T" and after_dot:
+                edits.append((line_starts[prev.start[0]] + prev.start[1], end, ""))
+            if prev is not None and prev.string == "class":
+                classes.add(tok.string)
+            if top is not None and top.kind == "class_bases" and tok.string.endswith("Scene"):
+                top.scene = True
+            if not after_dot:
+                names.setdefault(tok.string, []).append(start)
+
+        prev2, prev = prev, tok
+
+    if scene_name and scene_name not in classes and scene_class is not None:
+        logger.info(f"Renaming scene class {scene_class} to {scene_name}")
+        for start in names[scene_class]:
+            edits.append((start, start + len(scene_class), scene_name))
+    return edits
+
+
+def _apply(code, edits):
+    """Splice edits into `code`; edits inside a span already removed are dropped"""
+    out = []
+    pos = 0
+    for start, end, replacement in sorted(edits, key=lambda e: (e[0], e[1])):
+        if start < pos:
+            continue
+        out.append(code[pos:start])
+        out.append(replacement)
+        pos = end
+    out.append(code[pos:])
+    return "".join(out)
+
+
+def cap_waits(code: str, max_seconds: float) -> str:
+    """
+    Shorten `self.wait(n)` / `.wait(duration=n)` calls with a literal `n`
+    above `max_seconds`. Used to cut render time when the queue is under
+    pressure; waits with computed durations are left alone.
+    """
+    try:
+        tokens = [
+            tok
+            for tok in tokenize.generate_tokens(io.StringIO(code).readline)
+            if tok.type not in TRIVIA and tok.type != tokenize.NEWLINE
+        ]
+    except (tokenize.TokenError, SyntaxError) as e:
+        logger.info(f"Skipping wait capping, script does not tokenize: {e}")
+        return code
+    line_starts = [0, 0]
+    for line in io.StringIO(code).readlines():
+        line_starts.append(line_starts[-1] + len(line))
+
+    edits = []
+    for i in range(len(tokens) - 3):
+        if not (
+            tokens[i].string == "."
+            and tokens[i + 1].string == "wait"
+            and tokens[i + 2].string == "("
+        ):
+            continue
+        j = i + 3
+        if tokens[j].string == "duration" and tokens[j + 1].string == "=":
+            j += 2
+        if j + 1 >= len(tokens) or tokens[j].type != tokenize.NUMBER:
+            continue
+        if tokens[j + 1].string not in (")", ","):
+            continue
+        try:
+            seconds = float(ast.literal_eval(tokens[j].string))
+        except (ValueError, SyntaxError, TypeError):
+            continue
+        if seconds > max_seconds:
+            (row, col), (end_row, end_col) = tokens[j].start, tokens[j].end
+            edits.append(
+                (line_starts[row] + col, line_starts[end_row] + end_col, f"{max_seconds:g}")
+            )
+    if edits:
+        logger.info(f"Capped {len(edits)} wait() calls at {max_seconds:g}s")
+    return _apply(code, edits)
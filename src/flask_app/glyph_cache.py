@@ -0,0 +1,160 @@
+import os
+import time
+import fcntl
+import zlib
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Entries are guarded by one of this many lock files, picked by hashing the key
+LOCK_STRIPES = 64
+
+
+class GlyphCache:
+    """
+    Machine-wide cache of compiled TeX and Text SVGs shared by every render
+    worker. Manim already skips LaTeX/Pango when the output SVG exists in its
+    tex_dir/text_dir; pointing all workers at the same directories (instead of
+    a fresh media/ tree per job) is what makes those files reusable.
+
+    Building an entry holds a striped flock so two workers never compile the
+    same glyph at once or read a half-written SVG. Hit/miss counters are
+    per process; workers report them back with each job.
+    """
+
+    def __init__(self, root, max_bytes=512 * 1024**2):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.tex_dir = os.path.join(root, "Tex")
+        self.text_dir = os.path.join(root, "texts")
+        self.lock_dir = os.path.join(root, "locks")
+        for path in (self.tex_dir, self.text_dir, self.lock_dir):
+            os.makedirs(path, exist_ok=True)
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    def config(self):
+        """manim config overrides that route glyph output into the cache"""
+        return {
+            "tex_dir": self.tex_dir,
+            "text_dir": self.text_dir,
+            # Manim's cleanup deletes every non-SVG file in tex_dir, which would
+            # pull .tex/.dvi files out from under other workers mid-compile
+            "no_latex_cleanup": True,
+        }
+
+    @contextmanager
+    def locked(self, key):
+        stripe = zlib.crc32(key.encode()) % LOCK_STRIPES
+        with open(os.path.join(self.lock_dir, f"{stripe:02d}.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def record(self, kind, hit, seconds):
+        with self._stats_lock:
+            stats = self._stats.setdefault(
+                kind, {"hits": 0, "misses": 0, "miss_seconds": 0.0}
+            )
+            if hit:
+                stats["hits"] += 1
+            else:
+                stats["misses"] += 1
+                stats["miss_seconds"] += seconds
+
+    def drain_stats(self):
+        """Return counters accumulated since the last call and reset them"""
+        with self._stats_lock:
+            stats, self._stats = self._stats, {}
+        return stats
+
+    def install(self):
+        """
+        Wrap manim's TeX and Text SVG builders so they take the cache lock
+        and count hits. Call once in each render worker after importing manim.
+        """
+        from manim.utils import tex_file_writing
+        from manim.mobject.text import tex_mobject, text_mobject
+
+        original_tex_to_svg = tex_file_writing.tex_to_svg_file
+        generate_tex_file = tex_file_writing.generate_tex_file
+        cache = self
+
+        def tex_to_svg_file(expression, environment=None, tex_template=None):
+            from manim import config
+
+            template = tex_template or config["tex_template"]
+            with cache.locked(expression):
+                start = time.time()
+                tex_file = generate_tex_file(expression, environment, template)
+                hit = tex_file.with_suffix(".svg").exists()
+                svg_file = original_tex_to_svg(expression, environment, template)
+                cache.record("tex", hit, time.time() - start)
+            os.utime(svg_file)
+            return svg_file
+
+        tex_file_writing.tex_to_svg_file = tex_to_svg_file
+        # tex_mobject imported the function by name, so patch its reference too
+        if getattr(tex_mobject, "tex_to_svg_file", None) is original_tex_to_svg:
+            tex_mobject.tex_to_svg_file = tex_to_svg_file
+
+        for cls in (text_mobject.Text, text_mobject.MarkupText):
+            self._wrap_text2svg(cls)
+
+    def _wrap_text2svg(self, cls):
+        original = cls._text2svg
+        cache = self
+
+        def _text2svg(self, color=None):
+            from manim import config
+
+            name = self._text2hash(color)
+            svg_file = os.path.join(config.get_dir("text_dir"), f"{name}.svg")
+            with cache.locked(name):
+                start = time.time()
+                hit = os.path.exists(svg_file)
+                result = original(self, color)
+                cache.record("text", hit, time.time() - start)
+            if os.path.exists(svg_file):
+                os.utime(svg_file)
+            return result
+
+        cls._text2svg = _text2svg
+
+    def evict(self, min_age=300):
+        """
+        Remove least recently used entries until the cache fits `max_bytes`.
+        Files touched within `min_age` seconds are left alone since a worker
+        may be about to read them.
+        """
+        entries = []
+        total = 0
+        for directory in (self.tex_dir, self.text_dir):
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+        entries.sort()
+        cutoff = time.time() - min_age
+        removed = 0
+        for mtime, size, path in entries:
+            if total <= self.max_bytes or mtime > cutoff:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        logger.info(f"Evicted {removed} glyph cache files")
+        return removed
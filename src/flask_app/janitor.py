@@ -0,0 +1,338 @@
+import os
+import time
+import shutil
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+# LaTeX leftovers; the .svg next to them is the part worth keeping
+TEX_SCRATCH_SUFFIXES = (".aux", ".log", ".dvi", ".xdv", ".fls", ".fdb_latexmk")
+
+
+def _tree_inodes(path):
+    """(dev, ino, size) of every file under `path`, each hard-linked inode once"""
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = [
+            os.path.join(dirpath, name)
+            for dirpath, _, filenames in os.walk(path)
+            for name in filenames
+        ]
+    inodes = {}
+    for file in files:
+        try:
+            st = os.stat(file)
+        except OSError:
+            continue
+        inodes[(st.st_dev, st.st_ino)] = st.st_size
+    return [(dev, ino, size) for (dev, ino), size in inodes.items()]
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+class ArtifactIndex:
+    """
+    SQLite record of every artifact the janitor manages: its kind, size and
+    when it was last served. Quotas are enforced from these rows, so the
+    media tree never has to be walked to find what to evict.
+
+    The inodes of each artifact's files are kept too. A file hard-linked
+    from elsewhere (the render cache links finished mp4s) counts once
+    towards its kind's bytes, and serving it through any of its names
+    counts as serving the artifact.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            # Indexes from before inodes were tracked are rebuilt by adopt()
+            if not db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'inodes'"
+            ).fetchone():
+                db.execute("DROP TABLE IF EXISTS artifacts")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    path TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS artifacts_lru ON artifacts (kind, last_access)"
+            )
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS inodes (
+                    dev INTEGER NOT NULL,
+                    ino INTEGER NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    PRIMARY KEY (dev, ino, path)
+                )
+                """
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS inodes_path ON inodes (path)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, path, kind, inodes, now=None):
+        """Index `path` with the (dev, ino, size) of its files"""
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?)",
+                (path, kind, sum(size for _, _, size in inodes), now or time.time()),
+            )
+            db.execute("DELETE FROM inodes WHERE path = ?", (path,))
+            db.executemany(
+                "INSERT OR REPLACE INTO inodes VALUES (?, ?, ?, ?)",
+                [(dev, ino, path, size) for dev, ino, size in inodes],
+            )
+
+    def touch_many(self, accesses):
+        """
+        Apply a batch of {path: last_access} updates. A path that is not an
+        artifact itself (e.g. a render cache entry) touches the artifacts
+        holding the same inode.
+        """
+        with closing(self._connect()) as db, db:
+            for path, when in accesses.items():
+                updated = db.execute(
+                    "UPDATE artifacts SET last_access = MAX(last_access, ?) WHERE path = ?",
+                    (when, path),
+                ).rowcount
+                if updated:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                db.execute(
+                    """
+                    UPDATE artifacts SET last_access = MAX(last_access, ?)
+                    WHERE path IN (SELECT path FROM inodes WHERE dev = ? AND ino = ?)
+                    """,
+                    (when, st.st_dev, st.st_ino),
+                )
+
+    def totals(self, kind):
+        """Artifact count and bytes of `kind`, counting each inode once"""
+        with closing(self._connect()) as db:
+            (count,) = db.execute(
+                "SELECT COUNT(*) FROM artifacts WHERE kind = ?", (kind,)
+            ).fetchone()
+            (size,) = db.execute(
+                """
+                SELECT COALESCE(SUM(size), 0) FROM (
+                    SELECT DISTINCT i.dev, i.ino, i.size
+                    FROM inodes i JOIN artifacts a ON a.path = i.path
+                    WHERE a.kind = ?
+                )
+                """,
+                (kind,),
+            ).fetchone()
+        return count, size
+
+    def oldest(self, kind, before, limit=100):
+        """Least recently served artifacts of `kind` not touched since `before`"""
+        with closing(self._connect()) as db:
+            return db.execute(
+                """
+                SELECT path, size FROM artifacts
+                WHERE kind = ? AND last_access < ?
+                ORDER BY last_access LIMIT ?
+                """,
+                (kind, before, limit),
+            ).fetchall()
+
+    def remove(self, path):
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM artifacts WHERE path = ?", (path,))
+            db.execute("DELETE FROM inodes WHERE path = ?", (path,))
+
+    def empty(self):
+        with closing(self._connect()) as db:
+            return db.execute("SELECT 1 FROM artifacts LIMIT 1").fetchone() is None
+
+
+class Janitor:
+    """
+    Keeps generated scripts and per-script Manim output trees within byte
+    and file-count quotas, evicting the least recently served first.
+
+    Renders are tracked per script: `media_dir/videos/<stem>` (every tier of
+    one script) is a single artifact, as is `generated_scripts/<stem>.py`.
+    Serving a video calls `touch()`, which only updates memory; a background
+    thread writes those accesses to the index and enforces the quotas every
+    `interval` seconds. Anything used within `min_age` seconds is never
+    evicted, so in-flight renders and upgrades keep their files.
+    """
+
+    def __init__(
+        self,
+        index_path,
+        media_dir,
+        script_dir,
+        quotas,
+        interval=60,
+        min_age=600,
+        tex_dirs=(),
+    ):
+        self.index = ArtifactIndex(index_path)
+        self.media_dir = media_dir
+        self.script_dir = script_dir
+        # kind -> (max_bytes, max_files); None means unlimited
+        self.quotas = quotas
+        self.interval = interval
+        self.min_age = min_age
+        self.tex_dirs = [d for d in tex_dirs if d]
+        self._touches = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if self.index.empty():
+            self.adopt()
+        self._thread = threading.Thread(target=self._loop, name="janitor", daemon=True)
+        self._thread.start()
+
+    def _video_root(self, script_file):
+        stem = os.path.splitext(os.path.basename(script_file))[0]
+        return os.path.join(self.media_dir, "videos", stem)
+
+    def adopt(self):
+        """One-off scan that indexes artifacts left by earlier runs"""
+        adopted = 0
+        for kind, root, pick in (
+            ("scripts", self.script_dir, lambda e: e.is_file() and e.name.endswith(".py")),
+            ("videos", os.path.join(self.media_dir, "videos"), lambda e: e.is_dir()),
+        ):
+            if not os.path.isdir(root):
+                continue
+            with os.scandir(root) as it:
+                for entry in it:
+                    if pick(entry):
+                        self.index.record(
+                            entry.path,
+                            kind,
+                            _tree_inodes(entry.path),
+                            entry.stat().st_mtime,
+                        )
+                        adopted += 1
+        if adopted:
+            logger.info(f"Janitor indexed {adopted} existing artifacts")
+
+    def track_script(self, script_file):
+        self.index.record(script_file, "scripts", _tree_inodes(script_file))
+
+    def track_render(self, script_file):
+        """
+        Call once a script's final mp4 exists: drops the partial movie files
+        and frame images Manim left behind, then indexes what remains.
+        Call it before the mp4 is linked into the render cache, so serving
+        the cache entry keeps this render alive.
+        """
+        video_root = self._video_root(script_file)
+        stem = os.path.basename(video_root)
+        if os.path.isdir(video_root):
+            with os.scandir(video_root) as it:
+                for tier in it:
+                    partials = os.path.join(tier.path, "partial_movie_files")
+                    if tier.is_dir() and os.path.isdir(partials):
+                        shutil.rmtree(partials, ignore_errors=True)
+        shutil.rmtree(os.path.join(self.media_dir, "images", stem), ignore_errors=True)
+        if os.path.isdir(video_root):
+            self.index.record(video_root, "videos", _tree_inodes(video_root))
+
+    def touch(self, path):
+        """
+        Note that `path` (a served video or script) was just used. Files
+        outside the indexed trees, like render cache entries, are matched
+        to their artifact by inode on the next pass.
+        """
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(self.media_dir))
+        parts = rel.split(os.sep)
+        if len(parts) > 2 and parts[0] == "videos":
+            path = os.path.join(self.media_dir, "videos", parts[1])
+        with self._lock:
+            self._touches[path] = time.time()
+
+    def sweep_tex_scratch(self):
+        """Delete LaTeX intermediates older than `min_age` from the TeX dirs"""
+        cutoff = time.time() - self.min_age
+        removed = 0
+        for tex_dir in self.tex_dirs:
+            if not os.path.isdir(tex_dir):
+                continue
+            with os.scandir(tex_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(TEX_SCRATCH_SUFFIXES):
+                        continue
+                    try:
+                        if entry.stat().st_mtime < cutoff:
+                            os.unlink(entry.path)
+                            removed += 1
+                    except FileNotFoundError:
+                        pass
+        return removed
+
+    def enforce(self):
+        """Evict least recently served artifacts until every quota holds"""
+        evicted = 0
+        cutoff = time.time() - self.min_age
+        for kind, (max_bytes, max_files) in self.quotas.items():
+            count, size = self.index.totals(kind)
+            while (max_bytes is not None and size > max_bytes) or (
+                max_files is not None and count > max_files
+            ):
+                batch = self.index.oldest(kind, cutoff)
+                if not batch:
+                    logger.warning(f"{kind} over quota but everything is in use")
+                    break
+                for path, _ in batch:
+                    if (max_bytes is None or size <= max_bytes) and (
+                        max_files is None or count <= max_files
+                    ):
+                        break
+                    _remove(path)
+                    self.index.remove(path)
+                    # Inodes shared with other artifacts still count, so re-total
+                    count, size = self.index.totals(kind)
+                    evicted += 1
+        if evicted:
+            logger.info(f"Janitor evicted {evicted} artifacts")
+        return evicted
+
+    def run_once(self):
+        with self._lock:
+            touches, self._touches = self._touches, {}
+        if touches:
+            self.index.touch_many(touches)
+        self.enforce()
+        self.sweep_tex_scratch()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Janitor pass failed")
+
+    def close(self):
+        self._stop.set()
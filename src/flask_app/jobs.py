@@ -0,0 +1,420 @@
+import json
+import time
+import uuid
+import logging
+import threading
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import REGISTRY, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Terminal job states; once a job reaches one of these no more events follow
+FINISHED_STATES = ("done", "error")
+
+COALESCED = REGISTRY.counter(
+    "animator_coalesced_requests_total",
+    "Requests that attached to identical in-flight work instead of starting their own",
+    ["kind"],
+)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work once the job has been cancelled"""
+
+
+class Job:
+    """
+    A single unit of background work plus the ordered list of progress events
+    it has emitted. Readers block on the condition variable instead of polling.
+    """
+
+    def __init__(self, kind="generate"):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = "queued"
+        self.stage = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.events = []
+        # Background follow-ups (e.g. quality upgrades) still running after "done"
+        self.pending = 0
+        # Set when nobody wants the result any more; renders watch it and stop
+        self.cancelled = threading.Event()
+        # Requests sharing this job (see JobManager.submit_once) and open event streams
+        self.requesters = 1
+        self.subscribers = 0
+        # Whether a job nobody polls or streams any more should be cancelled
+        self.cancel_on_disconnect = True
+        # Last status poll or event-stream activity
+        self.last_seen = self.created_at
+        # When the last open event stream dropped, until a client comes back
+        self.dropped_at = None
+        self._cond = threading.Condition()
+        self._listeners = []
+        self.emit("queued")
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def settled(self):
+        """Finished and nothing left running in the background"""
+        return self.finished and self.pending == 0
+
+    def add_listener(self, listener):
+        """
+        Call `listener(job, event)` for every event from now on. It runs while
+        the job's lock is held, so it must be quick and not wait on this job.
+        """
+        with self._cond:
+            self._listeners.append(listener)
+
+    def seen(self):
+        """A client just polled or streamed this job"""
+        self.last_seen = time.time()
+        self.dropped_at = None
+
+    def subscribe(self):
+        with self._cond:
+            self.subscribers += 1
+            self.seen()
+
+    def unsubscribe(self, dropped=False):
+        """
+        An event stream closed. When it `dropped` (the client went away) and
+        no other stream is open, the drop is noted for JobManager to release
+        the client's claim unless it reconnects or polls in time.
+        """
+        with self._cond:
+            self.subscribers -= 1
+            self.seen()
+            if dropped and self.subscribers == 0:
+                self.dropped_at = self.last_seen
+
+    def cancel(self, reason="cancelled by client"):
+        """Stop the job's work and fail it, unless it already finished"""
+        self.cancelled.set()
+        with self._cond:
+            if self.finished:
+                return False
+            self.error = f"Cancelled: {reason}"
+            self.status = "error"
+        logger.info(f"Job {self.id} cancelled: {reason}")
+        self.emit("error", error=self.error, cancelled=True)
+        return True
+
+    def release(self, reason="cancelled by client"):
+        """One requester gives up; the job is cancelled once none remain"""
+        with self._cond:
+            # A stream may outlive the request that started it; never go below zero
+            self.requesters = max(self.requesters - 1, 0)
+            remaining = self.requesters
+        if remaining > 0:
+            return False
+        return self.cancel(reason)
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise JobCancelled(self.id)
+
+    def begin_background(self):
+        with self._cond:
+            self.pending += 1
+
+    def end_background(self, event, **changes):
+        """Merge `changes` into the result and announce them as `event`"""
+        with self._cond:
+            self.pending -= 1
+            self.result = dict(self.result or {}, **changes)
+            self._append(event, changes)
+
+    def emit(self, stage, **data):
+        """Record a progress event and wake up anyone streaming this job"""
+        with self._cond:
+            self.stage = stage
+            if stage not in FINISHED_STATES and stage != "queued":
+                self.status = "running"
+            self._append(stage, data)
+
+    def publish(self, event, **data):
+        """Stream an event (e.g. partial output) without changing the stage"""
+        with self._cond:
+            self._append(event, data)
+
+    def _append(self, event, data):
+        self.updated_at = time.time()
+        entry = {
+            "id": len(self.events),
+            "stage": event,
+            "time": self.updated_at,
+            "data": data,
+        }
+        self.events.append(entry)
+        self._cond.notify_all()
+        for listener in self._listeners:
+            try:
+                listener(self, entry)
+            except Exception:
+                logger.exception(f"Listener on job {self.id} failed")
+
+    def finish(self, result):
+        with self._cond:
+            # A background follow-up may already have reported; its changes win
+            self.result = {**(result or {}), **(self.result or {})}
+            self.status = "done"
+        self.emit("done", **(result or {}))
+
+    def fail(self, error, **data):
+        with self._cond:
+            if self.cancelled.is_set() and self.finished:
+                return  # already failed as cancelled
+            self.error = error
+            self.status = "error"
+        self.emit("error", error=error, **data)
+
+    def events_after(self, last_id, timeout=None):
+        """
+        Return events with an id greater than `last_id`, waiting up to
+        `timeout` seconds for one to arrive if there are none yet.
+        """
+        with self._cond:
+            if len(self.events) <= last_id + 1 and not self.settled:
+                self._cond.wait(timeout)
+            return list(self.events[last_id + 1 :])
+
+    def to_dict(self):
+        with self._cond:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "stage": self.stage,
+                "result": self.result,
+                "error": self.error,
+                "pending": self.pending,
+                "created_at": self.created_at,
+                "updated_at": self.updated_at,
+            }
+
+
+class JobManager:
+    """
+    Runs jobs on a small thread pool so HTTP workers return immediately.
+    Finished jobs are kept around for `ttl` seconds so clients can still
+    poll for the result.
+
+    `lanes` maps a name to a worker count for extra pools, so bulk work
+    (e.g. batch items) queues on its own threads instead of delaying
+    interactive jobs.
+
+    With `disconnect_grace`, a running job whose last event stream dropped
+    that many seconds ago, with no reconnect or poll since, loses that
+    client's claim (see Job.release). With `idle_grace`, a running job that
+    nobody has polled or streamed for that many seconds is cancelled: its
+    clients are gone. Keep it well above any client's poll interval.
+    """
+
+    def __init__(
+        self, max_workers=4, ttl=3600, lanes=None, disconnect_grace=None, idle_grace=None
+    ):
+        self.ttl = ttl
+        self._jobs = {}
+        # Coalescing key -> the job doing that work, until it settles
+        self._inflight = {}
+        self._lock = threading.RLock()
+        self._executors = {
+            None: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        }
+        for lane, workers in (lanes or {}).items():
+            self._executors[lane] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=f"job-{lane}"
+            )
+        self.disconnect_grace = disconnect_grace
+        self.idle_grace = idle_grace
+        if disconnect_grace or idle_grace:
+            threading.Thread(target=self._reap, name="job-reaper", daemon=True).start()
+
+    def submit(self, fn, *args, kind="generate", lane=None, listener=None, **kwargs):
+        """
+        Create a job and schedule `fn(job, *args, **kwargs)` on the pool
+        for `lane`. A `listener` is attached before the job can start.
+        """
+        job = Job(kind=kind)
+        if listener is not None:
+            job.add_listener(listener)
+        self.track(job)
+        self._executors[lane].submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def attach(self, key):
+        """The unsettled job submitted under `key`, if any; the caller shares it"""
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is None or job.settled or job.cancelled.is_set():
+                return None
+            with job._cond:
+                job.requesters += 1
+        COALESCED.inc(kind=job.kind)
+        return job
+
+    def submit_once(self, key, fn, *args, **kwargs):
+        """
+        Like submit(), but while a job submitted under the same `key` has not
+        settled, return that job instead of starting another. Returns
+        (job, coalesced).
+        """
+        with self._lock:
+            job = self.attach(key)
+            if job is not None:
+                return job, True
+            job = self.submit(fn, *args, **kwargs)
+            self._inflight[key] = job
+            return job, False
+
+    def track(self, job):
+        """Make a job driven from elsewhere (e.g. a batch) visible to get()"""
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args, kwargs):
+        observe_stage("job_queue_wait", time.time() - job.created_at, job_id=job.id)
+        start = time.time()
+        try:
+            result = fn(job, *args, **kwargs)
+            if not job.finished:
+                job.finish(result)
+        except JobCancelled:
+            logger.info(f"Job {job.id} stopped after being cancelled")
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            if not job.finished:
+                job.fail(str(e), details=traceback.format_exc())
+        finally:
+            # Background upgrades are not included; they report their own span
+            observe_stage(
+                f"job_{job.kind}",
+                time.time() - start,
+                "ok" if job.status == "done" else "error",
+                job_id=job.id,
+                script_id=(job.result or {}).get("script_id"),
+            )
+
+    def _reap(self):
+        while True:
+            time.sleep(1)
+            self.reap()
+
+    def reap(self, now=None):
+        """Release dropped streams and cancel idle jobs past their grace"""
+        now = now or time.time()
+        with self._lock:
+            running = [
+                job
+                for job in self._jobs.values()
+                if job.cancel_on_disconnect and job.subscribers == 0 and not job.finished
+            ]
+        for job in running:
+            with job._cond:
+                dropped_at = job.dropped_at
+                idle = self.idle_grace and job.last_seen < now - self.idle_grace
+                dropped = (
+                    self.disconnect_grace
+                    and dropped_at is not None
+                    and dropped_at < now - self.disconnect_grace
+                )
+                if dropped:
+                    job.dropped_at = None
+            if idle:
+                job.cancel("no client polled or streamed it")
+            elif dropped:
+                job.release("client disconnected")
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished and job.updated_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        for key in [key for key, job in self._inflight.items() if job.settled]:
+            del self._inflight[key]
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers arriving while it runs
+    wait for it and share its result (or exception) instead of repeating it.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """Returns (result, shared); `shared` is True for callers that waited"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            COALESCED.inc(kind="request")
+            return future.result(), True
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+def sse_events(job, last_id=-1, heartbeat=5):
+    """
+    Generator of server-sent-event frames for a job. Replays anything after
+    `last_id` (so reconnecting clients can pass Last-Event-ID) and ends once
+    the job is finished and its background follow-ups have reported.
+    While it runs the client counts as a subscriber. A disconnect is noticed
+    at the next write, at most `heartbeat` seconds later; if no other stream
+    is open, the client's claim is released once JobManager's
+    disconnect_grace passes without it reconnecting (EventSource does so on
+    its own, resuming with Last-Event-ID) or polling.
+    """
+    job.subscribe()
+    disconnected = False
+    try:
+        while True:
+            events = job.events_after(last_id, timeout=heartbeat)
+            if not events:
+                if job.settled:
+                    return
+                # Comment frame keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                last_id = event["id"]
+                yield (
+                    f"id: {event['id']}\n"
+                    f"event: {event['stage']}\n"
+                    f"data: {json.dumps(event)}\n\n"
+                )
+    except GeneratorExit:
+        disconnected = True
+        raise
+    finally:
+        job.unsubscribe(dropped=disconnected)
@@ -0,0 +1,276 @@
+"""
+Resource caps for renders: wall-clock and CPU time, address space, and the
+number of frames / seconds of video a scene may produce.
+
+Run as a script it wraps the manim CLI with the frame caps installed:
+
+    python limits.py --max-frames 7200 --max-duration 120 -- -ql script.py Scene
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import subprocess
+from contextlib import contextmanager
+
+from render_repair import ERROR_LINE
+
+try:
+    import resource
+except ImportError:  # not available on Windows; rlimits are skipped there
+    resource = None
+# Sets a running child's limits from the parent, so nothing runs in the
+# forked child (preexec_fn can deadlock in a threaded process); Linux only
+prlimit = getattr(resource, "prlimit", None)
+
+# Exit status of a render killed for breaking a limit or being cancelled
+KILLED = -signal.SIGKILL
+
+
+class RenderLimitExceeded(Exception):
+    """A render went over one of its RenderLimits"""
+
+
+class RenderLimits:
+    """
+    Caps applied to each render. Any of them may be None (no limit).
+
+    - `wall_seconds`: the render is killed after this long
+    - `cpu_seconds`: CPU time for the render (per process for CLI renders,
+      per job inside a warm worker)
+    - `memory_bytes`: address space limit on the render process
+    - `max_frames` / `max_duration`: frames written, and seconds of video,
+      before the render is stopped
+    """
+
+    def __init__(
+        self,
+        wall_seconds=None,
+        cpu_seconds=None,
+        memory_bytes=None,
+        max_frames=None,
+        max_duration=None,
+    ):
+        self.wall_seconds = wall_seconds
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.max_frames = max_frames
+        self.max_duration = max_duration
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**(data or {}))
+
+    def apply_memory_limit(self, pid):
+        """
+        Cap a long-lived worker's address space. Call right after starting
+        it; processes it spawns later inherit the limit.
+        """
+        if prlimit is not None and self.memory_bytes:
+            prlimit(pid, resource.RLIMIT_AS, (self.memory_bytes, self.memory_bytes))
+
+    def apply_rlimits(self, pid):
+        """Address space and CPU caps for a one-shot render process"""
+        self.apply_memory_limit(pid)
+        if prlimit is not None and self.cpu_seconds:
+            # SIGXCPU at the soft limit, SIGKILL at the hard one
+            prlimit(
+                pid,
+                resource.RLIMIT_CPU,
+                (int(self.cpu_seconds), int(self.cpu_seconds) + 5),
+            )
+
+    def cli_command(self, manim_args):
+        """The manim CLI invocation for `manim_args`, with the frame caps installed"""
+        if not (self.max_frames or self.max_duration):
+            return ["manim", *manim_args]
+        cmd = [sys.executable, os.path.abspath(__file__)]
+        if self.max_frames:
+            cmd += ["--max-frames", str(self.max_frames)]
+        if self.max_duration:
+            cmd += ["--max-duration", str(self.max_duration)]
+        return [*cmd, "--", *manim_args]
+
+
+def limits_from_env():
+    """RenderLimits from RENDER_TIMEOUT, RENDER_CPU_SECONDS, RENDER_MEMORY_BYTES,
+    RENDER_MAX_FRAMES and RENDER_MAX_SECONDS; 0 disables a limit"""
+    return RenderLimits(
+        wall_seconds=float(os.environ.get("RENDER_TIMEOUT", "300")) or None,
+        cpu_seconds=float(os.environ.get("RENDER_CPU_SECONDS", "600")) or None,
+        memory_bytes=int(os.environ.get("RENDER_MEMORY_BYTES", 4 * 1024**3)) or None,
+        max_frames=int(os.environ.get("RENDER_MAX_FRAMES", "0")) or None,
+        max_duration=float(os.environ.get("RENDER_MAX_SECONDS", "120")) or None,
+    )
+
+
+def kill_tree(proc):
+    """Kill a process started with start_new_session=True and everything it spawned"""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        proc.kill()
+
+
+def run_limited(
+    cmd,
+    limits=None,
+    cancel=None,
+    poll_interval=0.5,
+    fail_fast=False,
+    on_output=None,
+    env=None,
+):
+    """
+    `subprocess.run(cmd, capture_output=True, text=True, env=env)` under `limits`,
+    killed as soon as its wall-clock budget runs out or `cancel` is set.
+
+    Output is read as it is written: `on_output(stream, line)` sees every
+    line, and with `fail_fast` the process is killed the moment an
+    exception summary appears on stderr instead of being left to wind down.
+    """
+    limits = limits or RenderLimits()
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+        env=env,
+        start_new_session=True,
+    )
+    try:
+        limits.apply_rlimits(proc.pid)
+    except ProcessLookupError:
+        pass  # already exited; proc.wait() below collects it
+    output = {"stdout": [], "stderr": []}
+    failed = threading.Event()
+
+    def pump(name, pipe):
+        for line in pipe:
+            output[name].append(line)
+            if on_output is not None:
+                on_output(name, line)
+            if fail_fast and name == "stderr" and ERROR_LINE.match(line):
+                failed.set()
+        pipe.close()
+
+    readers = [
+        threading.Thread(target=pump, args=(name, getattr(proc, name)), daemon=True)
+        for name in output
+    ]
+    for reader in readers:
+        reader.start()
+
+    deadline = time.monotonic() + limits.wall_seconds if limits.wall_seconds else None
+    reason = None
+    while proc.poll() is None:
+        # Wakes early when the stderr reader spots an error
+        failed.wait(poll_interval)
+        if failed.is_set():
+            reason = "Render stopped at its first error"
+        elif cancel is not None and cancel.is_set():
+            reason = "Render cancelled"
+        elif deadline is not None and time.monotonic() > deadline:
+            reason = f"Render exceeded the {limits.wall_seconds:g}s time limit"
+        if reason:
+            kill_tree(proc)
+            break
+    proc.wait()
+    # Whatever was written before the kill is still in the pipes
+    for reader in readers:
+        reader.join()
+    stdout, stderr = "".join(output["stdout"]), "".join(output["stderr"])
+
+    if reason:
+        stderr = f"{stderr}\n{reason}"
+    elif proc.returncode == -signal.SIGXCPU or proc.returncode == KILLED:
+        stderr = f"{stderr}\nRender exceeded its CPU or memory limit"
+    return subprocess.CompletedProcess(
+        cmd, KILLED if reason else proc.returncode, stdout, stderr
+    )
+
+
+@contextmanager
+def cpu_budget(seconds):
+    """Raise RenderLimitExceeded in the main thread after `seconds` of CPU time"""
+    if not seconds or not hasattr(signal, "ITIMER_PROF"):
+        yield
+        return
+
+    def over_budget(signum, frame):
+        raise RenderLimitExceeded(f"Render exceeded the {seconds:g}s CPU time limit")
+
+    previous = signal.signal(signal.SIGPROF, over_budget)
+    signal.setitimer(signal.ITIMER_PROF, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, previous)
+
+
+# Caps for the render running in this process; see frame_caps()
+_caps = {"max_frames": None, "max_duration": None, "frames": 0}
+
+
+def install_frame_hook():
+    """Count frames as manim writes them and stop a render that goes over its caps"""
+    from manim import config
+    from manim.scene.scene_file_writer import SceneFileWriter
+
+    if getattr(SceneFileWriter.write_frame, "_frame_capped", False):
+        return
+    write_frame = SceneFileWriter.write_frame
+
+    def capped_write_frame(self, *args, **kwargs):
+        frames = kwargs.get("num_frames", args[1] if len(args) > 1 else 1)
+        _caps["frames"] += frames
+        if _caps["max_frames"] and _caps["frames"] > _caps["max_frames"]:
+            raise RenderLimitExceeded(
+                f"Scene is longer than the {_caps['max_frames']} frame limit"
+            )
+        if _caps["max_duration"] and _caps["frames"] / config.frame_rate > _caps["max_duration"]:
+            raise RenderLimitExceeded(
+                f"Scene is longer than the {_caps['max_duration']:g}s limit"
+            )
+        return write_frame(self, *args, **kwargs)
+
+    capped_write_frame._frame_capped = True
+    SceneFileWriter.write_frame = capped_write_frame
+
+
+@contextmanager
+def frame_caps(max_frames=None, max_duration=None):
+    """Apply frame caps to renders inside the block (install_frame_hook() first)"""
+    _caps.update(max_frames=max_frames, max_duration=max_duration, frames=0)
+    try:
+        yield
+    finally:
+        _caps.update(max_frames=None, max_duration=None, frames=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the manim CLI with frame caps")
+    parser.add_argument("--max-frames", type=int)
+    parser.add_argument("--max-duration", type=float)
+    parser.add_argument("manim_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    manim_args = args.manim_args[1:] if args.manim_args[:1] == ["--"] else args.manim_args
+
+    install_frame_hook()
+    from manim.__main__ import main as manim_main
+
+    sys.argv = ["manim", *manim_args]
+    with frame_caps(args.max_frames, args.max_duration):
+        manim_main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from contextlib import closing
+
+from llm_stream import stream_completion
+
+logger = logging.getLogger(__name__)
+
+QUESTION_PLACEHOLDER = "__QUESTION__"
+SCENE_PLACEHOLDER = "__SCENE_NAME__"
+
+
+# Sentence punctuation, unless it sits between digits as in 2.5, 5,6 or 2:3
+SENTENCE_PUNCTUATION = re.compile(r"(?<!\d)[?.!,;:]|[?.!,;:](?!\d)")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Fold case, whitespace and sentence punctuation so trivially different
+    phrasings match. Operators, brackets, signs and digits are kept: "2+3"
+    and "2-3" are different questions.
+    """
+    question = SENTENCE_PUNCTUATION.sub(" ", question.lower())
+    return " ".join(question.split())
+
+
+def request_key(question, *parts):
+    """
+    Coalescing key for requests in flight: the normalized question plus the
+    other `parts` (prompt, quality, ...) that shape the answer
+    """
+    return (normalize_question(question), *parts)
+
+
+def cache_key(model, temperature, prompt, question, scene_name=None):
+    """
+    Key for a completion. The question is lifted out of the formatted prompt
+    and normalized on its own, so "How do I multiply a matrix?" and
+    "how do i multiply a matrix" share an entry. Per-request scene names are
+    lifted out the same way.
+    """
+    template = prompt.replace(question, QUESTION_PLACEHOLDER) if question else prompt
+    if scene_name:
+        template = template.replace(scene_name, SCENE_PLACEHOLDER)
+    payload = json.dumps(
+        [model, float(temperature), template, normalize_question(question)]
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    Persistent completion cache in a SQLite file, safe to share between
+    threads and processes. Entries expire after `ttl` seconds and the least
+    recently used ones are dropped once there are more than `max_entries`.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            row = db.execute(
+                "SELECT content, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            content, created_at = row
+            if now - created_at > self.ttl:
+                db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                return None
+            db.execute(
+                "UPDATE completions SET last_used = ? WHERE key = ?", (now, key)
+            )
+            return content
+
+    def put(self, key, content):
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                (key, content, now, now),
+            )
+            db.execute(
+                "DELETE FROM completions WHERE created_at < ?", (now - self.ttl,)
+            )
+            db.execute(
+                """
+                DELETE FROM completions WHERE key IN (
+                    SELECT key FROM completions ORDER BY last_used DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def store(self, model, prompt, question, temperature, content, scene_name=None):
+        """Overwrite the completion cached for a request, e.g. with a repaired script"""
+        key = cache_key(model, temperature, prompt, question, scene_name)
+        self.put(key, content.replace(scene_name, SCENE_PLACEHOLDER) if scene_name else content)
+
+    def complete(
+        self,
+        client,
+        model,
+        prompt,
+        question,
+        temperature,
+        scene_name=None,
+        bypass=False,
+        stream=False,
+        on_code=None,
+    ):
+        """
+        Return `(content, hit)` for a chat completion, calling the API only on
+        a miss. `bypass` forces a fresh generation but still stores it.
+        With `stream`, a miss is streamed and cut off once the code fence
+        closes; `on_code` receives code as it arrives.
+        """
+        key = cache_key(model, temperature, prompt, question, scene_name)
+        if not bypass:
+            content = self.get(key)
+            if content is not None:
+                logger.info(f"LLM cache hit for question: {question}")
+                if scene_name:
+                    content = content.replace(SCENE_PLACEHOLDER, scene_name)
+                return content, True
+
+        if stream:
+            content = stream_completion(client, model, prompt, temperature, on_code)
+        else:
+            response = client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+            )
+            content = response.choices[0].message.content
+        stored = content.replace(scene_name, SCENE_PLACEHOLDER) if scene_name else content
+        self.put(key, stored)
+        return content, False
@@ -0,0 +1,327 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import openai
+from openai import OpenAI
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LLM_RETRIES = REGISTRY.counter(
+    "animator_llm_retries_total", "LLM calls retried, by reason", ["reason"]
+)
+LLM_HEDGES = REGISTRY.counter(
+    "animator_llm_hedges_total", "Hedged LLM calls, by which attempt answered first", ["winner"]
+)
+
+# Rough prompt size in tokens when we only have characters
+CHARS_PER_TOKEN = 4
+
+
+class TokenBucket:
+    """Refills at `per_minute` / 60 per second up to `capacity`"""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, n=1):
+        n = min(n, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= n:
+                self._tokens -= n
+                return True
+            return False
+
+    def acquire(self, n=1):
+        """Block until `n` tokens are available, then take them"""
+        n = min(n, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                shortfall = (n - self._tokens) / self.rate
+            time.sleep(min(shortfall, 1.0))
+
+
+class _Stream:
+    """
+    A streaming response whose first chunk has already been read. Holds a
+    concurrency slot until it is exhausted or closed.
+    """
+
+    def __init__(self, stream, chunks, first, release):
+        self._stream = stream
+        self._chunks = chunks
+        self._first = first
+        self._release = release
+        self._released = False
+
+    def __iter__(self):
+        try:
+            if self._first is not None:
+                yield self._first
+            yield from self._chunks
+        finally:
+            self._done()
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._done()
+
+    def _done(self):
+        if not self._released:
+            self._released = True
+            self._release()
+
+
+class _Completions:
+    def __init__(self, gateway):
+        self._gateway = gateway
+
+    def create(self, **kwargs):
+        return self._gateway.create(**kwargs)
+
+
+class _Chat:
+    def __init__(self, gateway):
+        self.completions = _Completions(gateway)
+
+
+class LLMGateway:
+    """
+    The one way the apps talk to OpenAI. Looks like an `OpenAI` client
+    (`gateway.chat.completions.create(...)`), so callers such as LLMCache
+    take it unchanged, and adds:
+
+    - a pooled, keep-alive HTTP client with a per-request timeout
+    - request and token buckets sized to the account's RPM / TPM quota
+    - at most `max_concurrency` calls in flight
+    - exponential backoff with jitter on 429, 5xx, timeouts and dropped
+      connections, honouring Retry-After
+    - optional hedging: once `hedge_quantile` of recent latencies have
+      elapsed without an answer, a second identical call is fired and
+      whichever answers first is used. Hedges only go out when the
+      limiters have room, so they never queue behind real traffic.
+
+    For streamed calls, latency and hedging are measured to the first chunk.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        rpm=500,
+        tpm=90000,
+        max_concurrency=8,
+        max_retries=4,
+        timeout=60.0,
+        backoff=1.0,
+        max_backoff=30.0,
+        hedge_quantile=None,
+        hedge_min_samples=20,
+        default_max_tokens=1024,
+    ):
+        self.client = client or _pooled_client(timeout, max_concurrency)
+        self.chat = _Chat(self)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.default_max_tokens = default_max_tokens
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._latencies = {False: deque(maxlen=200), True: deque(maxlen=200)}
+        self._lock = threading.Lock()
+        self._hedge_pool = ThreadPoolExecutor(
+            max_workers=max_concurrency * 2, thread_name_prefix="llm-hedge"
+        )
+        self._hedges = 0
+        self._hedges_won = 0
+        self._retries = 0
+
+    def _estimate_tokens(self, kwargs):
+        prompt_chars = sum(len(m.get("content") or "") for m in kwargs.get("messages", ()))
+        return prompt_chars // CHARS_PER_TOKEN + kwargs.get("max_tokens", self.default_max_tokens)
+
+    def _hedge_after(self, stream):
+        """Seconds to wait before hedging, or None until there is enough history"""
+        if not self.hedge_quantile:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies[stream])
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return samples[min(int(len(samples) * self.hedge_quantile), len(samples) - 1)]
+
+    def create(self, **kwargs):
+        stream = bool(kwargs.get("stream"))
+        hedge_after = self._hedge_after(stream)
+        if hedge_after is None:
+            return self._with_retries(kwargs)
+        return self._hedged(kwargs, hedge_after)
+
+    def _with_retries(self, kwargs, blocking=True):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._attempt(kwargs, blocking)
+            except (
+                openai.RateLimitError,
+                openai.InternalServerError,
+                openai.APIConnectionError,
+            ) as e:
+                if attempt == self.max_retries:
+                    raise
+                reason = type(e).__name__
+                delay = min(self.max_backoff, self.backoff * 2**attempt)
+                delay = random.uniform(delay / 2, delay)
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                with self._lock:
+                    self._retries += 1
+                LLM_RETRIES.inc(reason=reason)
+                logger.warning(f"LLM call failed ({reason}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _attempt(self, kwargs, blocking=True):
+        """One call through the limiters; returns the completion or a _Stream"""
+        tokens = self._estimate_tokens(kwargs)
+        if blocking:
+            self._requests.acquire()
+            self._tokens.acquire(tokens)
+            self._slots.acquire()
+        else:
+            if not self._slots.acquire(blocking=False):
+                return None
+            if not (self._requests.try_acquire() and self._tokens.try_acquire(tokens)):
+                self._slots.release()
+                return None
+
+        stream = bool(kwargs.get("stream"))
+        start = time.monotonic()
+        try:
+            response = self.client.chat.completions.create(**kwargs)
+            if stream:
+                chunks = iter(response)
+                response = _Stream(response, chunks, next(chunks, None), self._slots.release)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._latencies[stream].append(time.monotonic() - start)
+        if not stream:
+            self._slots.release()
+        return response
+
+    def _hedged(self, kwargs, hedge_after):
+        primary = self._hedge_pool.submit(self._with_retries, kwargs)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        hedge = self._hedge_pool.submit(self._attempt, kwargs, False)
+        with self._lock:
+            self._hedges += 1
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                result = future.result()
+                if result is None:
+                    continue  # the hedge found no spare capacity
+                winner = "hedge" if future is hedge else "primary"
+                LLM_HEDGES.inc(winner=winner)
+                if future is hedge:
+                    with self._lock:
+                        self._hedges_won += 1
+                for loser in pending:
+                    loser.add_done_callback(_discard)
+                return result
+        raise error
+
+    def stats(self):
+        with self._lock:
+            counts = {
+                "retries": self._retries,
+                "hedges": self._hedges,
+                "hedges_won": self._hedges_won,
+            }
+        return {
+            **counts,
+            "hedge_after_seconds": {
+                "complete": self._hedge_after(False),
+                "stream": self._hedge_after(True),
+            },
+        }
+
+
+def _pooled_client(timeout, max_concurrency):
+    """An OpenAI client on one keep-alive connection pool, without its own retries"""
+    import httpx
+
+    return OpenAI(
+        timeout=timeout,
+        # Retries happen in the gateway, where the limiters can see them
+        max_retries=0,
+        http_client=httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_concurrency * 2,
+                max_keepalive_connections=max_concurrency * 2,
+            ),
+        ),
+    )
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _discard(future):
+    """Close the losing attempt of a hedge so a stream stops generating"""
+    if future.exception() is None and isinstance(future.result(), _Stream):
+        future.result().close()
+
+
+def gateway_from_env():
+    """Build the gateway from the LLM_* environment variables"""
+    hedge_quantile = float(os.environ.get("LLM_HEDGE_QUANTILE", "0"))
+    return LLMGateway(
+        rpm=int(os.environ.get("LLM_RPM", "500")),
+        tpm=int(os.environ.get("LLM_TPM", "90000")),
+        max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "8")),
+        max_retries=int(os.environ.get("LLM_MAX_RETRIES", "4")),
+        timeout=float(os.environ.get("LLM_TIMEOUT", "60")),
+        hedge_quantile=hedge_quantile or None,
+    )
@@ -0,0 +1,83 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+FENCE_OPEN = "```python"
+FENCE_CLOSE = "```"
+
+
+class CodeFenceExtractor:
+    """
+    Incrementally pulls the first ```python block out of a streamed
+    completion. `feed()` returns whatever new code became safe to show; a
+    couple of trailing characters are held back while they could still be
+    the start of the closing fence.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.closed = False
+        self._start = None  # index just past the opening fence
+        self._emitted = 0  # code characters already returned
+
+    @property
+    def code(self):
+        if self._start is None:
+            return ""
+        end = self.text.find(FENCE_CLOSE, self._start)
+        return self.text[self._start : end if end != -1 else len(self.text)]
+
+    def feed(self, delta: str) -> str:
+        if self.closed:
+            return ""
+        # Only rescan the tail that could contain a fence split across chunks
+        scan_from = max(len(self.text) - len(FENCE_OPEN), 0)
+        self.text += delta
+        if self._start is None:
+            idx = self.text.find(FENCE_OPEN, scan_from)
+            if idx == -1:
+                return ""
+            self._start = idx + len(FENCE_OPEN)
+            scan_from = self._start
+
+        end = self.text.find(FENCE_CLOSE, max(scan_from, self._start))
+        if end != -1:
+            self.closed = True
+            safe_end = end
+        else:
+            safe_end = len(self.text) - (len(FENCE_CLOSE) - 1)
+        safe_end = max(safe_end, self._start + self._emitted)
+        new = self.text[self._start + self._emitted : safe_end]
+        self._emitted += len(new)
+        return new
+
+
+def stream_completion(client, model, prompt, temperature, on_code=None):
+    """
+    Stream a chat completion and stop reading as soon as the python code
+    fence closes; the prose after it is never needed. `on_code` is called
+    with each new piece of code as it arrives. Returns the text received,
+    which still contains the complete fenced block.
+    """
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        stream=True,
+    )
+    extractor = CodeFenceExtractor()
+    try:
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            new_code = extractor.feed(delta)
+            if new_code and on_code is not None:
+                on_code(new_code)
+            if extractor.closed:
+                logger.info("Code fence closed, ending stream early")
+                break
+    finally:
+        # Dropping the connection stops generation of tokens we would ignore
+        stream.close()
+    return extractor.text
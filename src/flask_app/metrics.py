@@ -0,0 +1,213 @@
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans range from a cache lookup to a full 1080p render
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += self._samples(items)
+        return lines
+
+    def _samples(self, items):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def _samples(self, items):
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "animator_stage_seconds",
+    "Time spent in each pipeline stage",
+    ["stage", "outcome"],
+)
+STAGE_TOTAL = REGISTRY.counter(
+    "animator_stage_total",
+    "Pipeline stages run, by outcome",
+    ["stage", "outcome"],
+)
+
+RENDER_QUEUE_DEPTH = REGISTRY.gauge(
+    "animator_render_queue_depth", "Renders waiting for a slot"
+)
+RENDER_BUSY = REGISTRY.gauge("animator_render_busy_workers", "Render slots in use")
+RENDER_WORKERS = REGISTRY.gauge("animator_render_workers", "Render slots configured")
+RENDER_COMPLETED = REGISTRY.gauge(
+    "animator_render_completed", "Renders finished since startup"
+)
+RENDER_REJECTED = REGISTRY.gauge(
+    "animator_render_rejected", "Renders turned away with a full queue since startup"
+)
+
+
+def observe_stage(stage, seconds, outcome="ok", script_id=None, **tags):
+    """Record a finished stage as a metric sample and a structured log line"""
+    STAGE_SECONDS.observe(seconds, stage=stage, outcome=outcome)
+    STAGE_TOTAL.inc(stage=stage, outcome=outcome)
+    # script_id and tags stay out of the labels to keep cardinality bounded
+    logger.info(
+        json.dumps(
+            {
+                "span": stage,
+                "script_id": script_id,
+                "outcome": outcome,
+                "seconds": round(seconds, 4),
+                **tags,
+            }
+        )
+    )
+
+
+@contextmanager
+def span(stage, script_id=None, **tags):
+    """
+    Time the body as one pipeline stage. The yielded dict may set "outcome"
+    (e.g. "cached", "rejected") and extra tags; an exception escaping the body
+    records outcome "error" unless one was already set.
+    """
+    info = {"outcome": "ok", **tags}
+    start = time.perf_counter()
+    try:
+        yield info
+    except BaseException:
+        if info["outcome"] == "ok":
+            info["outcome"] = "error"
+        raise
+    finally:
+        outcome = info.pop("outcome")
+        observe_stage(stage, time.perf_counter() - start, outcome, script_id, **info)
+
+
+def update_render_gauges(stats):
+    """Copy RenderScheduler.stats() into the scrape-time gauges"""
+    RENDER_QUEUE_DEPTH.set(stats["queue_depth"])
+    RENDER_BUSY.set(stats["busy"])
+    RENDER_WORKERS.set(stats["workers"])
+    RENDER_COMPLETED.set(stats["completed"])
+    RENDER_REJECTED.set(stats["rejected"])
+
+
+def render_latest():
+    return REGISTRY.render()
@@ -0,0 +1,140 @@
+import ast
+import logging
+
+from render_repair import trim_error
+
+logger = logging.getLogger(__name__)
+
+# Modules a generated scene may import; everything else is rejected
+ALLOWED_IMPORTS = {"manim", "math", "random", "itertools", "functools", "typing"}
+
+# Builtins that reach the filesystem, network or interpreter
+BANNED_CALLS = {
+    "open",
+    "exec",
+    "eval",
+    "compile",
+    "__import__",
+    "input",
+    "breakpoint",
+    "globals",
+    "setattr",
+    "delattr",
+}
+
+# `from manim import *` re-exports numpy as np; the prompt forbids real math
+BANNED_NAMES = {"np", "numpy", "os", "sys", "subprocess", "socket", "shutil"}
+
+BANNED_METHODS = {"dot"}
+
+# Dunders that walk from any object to modules, builtins or code objects;
+# ordinary ones like super().__init__ stay allowed
+BANNED_ATTRIBUTES = {
+    "__globals__",
+    "__builtins__",
+    "__subclasses__",
+    "__bases__",
+    "__base__",
+    "__mro__",
+    "__class__",
+    "__dict__",
+    "__code__",
+    "__closure__",
+    "__func__",
+    "__self__",
+    "__loader__",
+    "__spec__",
+    "__import__",
+    "__getattribute__",
+    "__reduce__",
+    "__reduce_ex__",
+    "gi_frame",
+    "f_globals",
+    "f_locals",
+    "f_back",
+}
+
+
+class PreflightError(Exception):
+    """A generated script failed validation before rendering"""
+
+    def __init__(self, problems):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+def check_script(code: str, scene_name: str) -> ast.Module:
+    """
+    Static checks on a generated script: it parses, defines `scene_name`
+    with a `construct` method, and avoids banned imports and calls.
+    Raises PreflightError listing every problem found.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        raise PreflightError([f"Syntax error on line {e.lineno}: {e.msg}"]) from e
+
+    problems = []
+    scene = next(
+        (
+            node
+            for node in tree.body
+            if isinstance(node, ast.ClassDef) and node.name == scene_name
+        ),
+        None,
+    )
+    if scene is None:
+        problems.append(f"No class named {scene_name}")
+    elif not scene.bases:
+        problems.append(f"{scene_name} does not inherit from a Scene")
+    elif not any(
+        isinstance(node, ast.FunctionDef) and node.name == "construct"
+        for node in scene.body
+    ):
+        problems.append(f"{scene_name} has no construct() method")
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split(".")[0] not in ALLOWED_IMPORTS:
+                    problems.append(f"Line {node.lineno}: import of {alias.name}")
+        elif isinstance(node, ast.ImportFrom):
+            if (node.module or "").split(".")[0] not in ALLOWED_IMPORTS:
+                problems.append(f"Line {node.lineno}: import from {node.module}")
+        elif isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Name) and func.id in BANNED_CALLS:
+                problems.append(f"Line {node.lineno}: call to {func.id}()")
+            elif isinstance(func, ast.Attribute) and func.attr in BANNED_METHODS:
+                problems.append(f"Line {node.lineno}: call to .{func.attr}()")
+        elif isinstance(node, ast.Name) and node.id in BANNED_NAMES:
+            problems.append(f"Line {node.lineno}: use of {node.id}")
+        elif isinstance(node, ast.Attribute) and node.attr in BANNED_ATTRIBUTES:
+            problems.append(f"Line {node.lineno}: access to {node.attr}")
+
+    if problems:
+        raise PreflightError(problems)
+    return tree
+
+
+def preflight(code, script_file, scene_name, dry_runner=None, max_duration=None, cancel=None):
+    """
+    Validate a script before it takes a render slot. Runs the static checks,
+    then (if a `dry_runner` such as a WarmRenderPool is given) constructs the
+    scene with animations skipped. Returns whatever the dry run reported,
+    e.g. the number of play()/wait() calls. Scenes whose animations add up
+    to more than `max_duration` seconds are rejected without rendering.
+    """
+    check_script(code, scene_name)
+    if dry_runner is None:
+        return {}
+    result = dry_runner.dry_run(script_file, scene_name, cancel=cancel)
+    if result.get("returncode"):
+        error = trim_error(result.get("error", ""), script_file, code)
+        raise PreflightError([f"Dry run failed: {error}"])
+    duration = result.get("duration")
+    if max_duration and duration and duration > max_duration:
+        raise PreflightError(
+            [f"Scene runs for {duration:.0f}s, longer than the {max_duration:g}s limit"]
+        )
+    return result
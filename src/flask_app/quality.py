@@ -0,0 +1,26 @@
+import os
+
+# Render tiers, cheapest first. `flags` go to the manim CLI (and are parsed by
+# the warm workers); `folder` is the directory manim writes that tier into.
+QUALITY_TIERS = {
+    # Stand-in preview while the render queue is over its latency target
+    "draft": {"flags": ["-ql", "-r", "426,240", "--fps", "10"], "folder": "240p10"},
+    "preview": {"flags": ["-ql"], "folder": "480p15"},
+    "medium": {"flags": ["-qm"], "folder": "720p30"},
+    "high": {"flags": ["-qh"], "folder": "1080p60"},
+}
+
+DEFAULT_PREVIEW = "preview"
+DEGRADED_PREVIEW = "draft"
+
+
+def tier_flags(tier):
+    return QUALITY_TIERS[tier]["flags"]
+
+
+def video_path(script_file, scene_name, tier, media_dir="media"):
+    """Where manim puts the mp4 for `script_file` rendered at `tier`"""
+    stem = os.path.splitext(os.path.basename(script_file))[0]
+    return os.path.join(
+        media_dir, "videos", stem, QUALITY_TIERS[tier]["folder"], f"{scene_name}.mp4"
+    )
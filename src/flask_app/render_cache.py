@@ -0,0 +1,137 @@
+import io
+import os
+import shutil
+import fcntl
+import hashlib
+import logging
+import tempfile
+import tokenize
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Stand-in for the scene class name so per-request names (Scene_<id>) share entries
+SCENE_PLACEHOLDER = "__SCENE__"
+
+
+def normalize_script(code: str, scene_name: str) -> str:
+    """
+    Canonical form of a script for hashing: its token stream without
+    comments or blank lines, and with the scene class name replaced by a
+    placeholder wherever it appears as a name (never inside strings). Layout
+    inside string literals is kept, since Manim renders text verbatim.
+    Scripts that don't tokenize are hashed as written.
+    """
+    code = code.replace("\r\n", "\n")
+    tokens = []
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+            if tok.type in (tokenize.NL, tokenize.COMMENT):
+                continue
+            text = tok.string
+            if tok.type == tokenize.NAME and text == scene_name:
+                text = SCENE_PLACEHOLDER
+            elif tok.type == tokenize.INDENT:
+                # Nesting is carried by INDENT/DEDENT, not by their width
+                text = ""
+            tokens.append(f"{tokenize.tok_name[tok.type]} {text!r}")
+    except (tokenize.TokenError, SyntaxError):
+        return code
+    return "\n".join(tokens)
+
+
+def script_key(code: str, scene_name: str, quality_flags) -> str:
+    """Content address of a render: normalized script plus quality flags"""
+    h = hashlib.sha256()
+    h.update(normalize_script(code, scene_name).encode())
+    h.update(b"\0")
+    h.update(" ".join(quality_flags).encode())
+    return h.hexdigest()
+
+
+class RenderCache:
+    """
+    Finished mp4s stored flat under `root` as `<key>.mp4`, next to any
+    renditions made from them (see renditions.py).
+
+    The file mtime doubles as the LRU clock: hits touch it, eviction removes
+    the oldest files until the directory fits in `max_bytes`. Entries are
+    written to a temp file and renamed into place, so readers never see a
+    partial video and several processes can share the same directory.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.root, f"{key}.mp4")
+
+    def get(self, key):
+        """Return the cached video path for `key`, or None on a miss"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, video_path):
+        """Store a rendered video under `key` and return its cache path"""
+        path = self.path_for(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        os.close(fd)
+        try:
+            try:
+                # Hard link avoids copying when the render lives on the same disk
+                os.unlink(tmp_path)
+                os.link(video_path, tmp_path)
+            except OSError:
+                shutil.copyfile(video_path, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        os.utime(path)
+        self.evict()
+        return path
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.root, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits its budget"""
+        with self._locked():
+            entries = []
+            total = 0
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    # Skip the lock and files still being written
+                    if entry.name.startswith(".") or entry.name.endswith(".tmp"):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= size
+                    logger.info(f"Evicted {path} from render cache")
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,426 @@
+"""
+Render node: pulls scene renders from the shared work queue and runs them.
+
+    python render_node.py --queue sqlite://.cache/work_queue.sqlite3 --workers 4
+    python render_node.py --queue http://web:5000/queue --token $WORK_QUEUE_TOKEN
+
+Start as many as there are machines to render on. Nodes must see the same
+media directory as the web tier (same host, or a shared volume), since that
+is where the videos land. The web tier side is QueueRenderScheduler.
+"""
+
+import os
+import math
+import time
+import uuid
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import CancelledError, Future
+
+from render_pool import (
+    RenderScheduler,
+    QueueFull,
+    available_cores,
+    wait_for,
+    PRIORITY_INTERACTIVE,
+)
+from limits import limits_from_env
+from work_queue import queue_from_url
+
+logger = logging.getLogger(__name__)
+
+RENDER_QUEUE = "renders"
+# Stderr kept in a result message; enough for the traceback at the end
+OUTPUT_TAIL = 4000
+# Replies nobody collects (the web process restarted) are dropped after a day
+REPLY_TTL = 24 * 3600
+
+
+class QueueRenderScheduler:
+    """
+    Stands in for RenderScheduler in the web tier when renders run on
+    render nodes: each render becomes a message on the work queue, and a
+    collector thread resolves its Future when the node's reply arrives on
+    this process's own reply queue. Renders that exhaust their attempts
+    fail with the last error the queue recorded. A render whose `cancel`
+    event is set is withdrawn from the queue, and the node running it
+    kills it.
+    """
+
+    def __init__(self, queue, max_queue=64, poll_interval=1.0, dead_check_interval=15):
+        self.queue = queue
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+        self.dead_check_interval = dead_check_interval
+        self.reply_to = f"render_results.{socket.gethostname()}.{os.getpid()}.{uuid.uuid4().hex[:6]}"
+        # request id -> (future, message id, submitted at, cancel event)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._rejected = 0
+        self._durations = deque(maxlen=50)
+        threading.Thread(target=self._collect, name="render-results", daemon=True).start()
+        logger.info(f"Sending renders to the work queue, replies on {self.reply_to}")
+
+    def _depth(self):
+        return self.queue.stats(RENDER_QUEUE)["ready"]
+
+    def submit_render(
+        self,
+        script_file,
+        scene_name,
+        flags,
+        priority=PRIORITY_INTERACTIVE,
+        media_dir=None,
+        wait_below=None,
+        cancel=None,
+    ):
+        if wait_below is not None:
+            while self._depth() >= min(wait_below, self.max_queue):
+                time.sleep(self.poll_interval)
+        elif self._depth() >= self.max_queue:
+            with self._lock:
+                self._rejected += 1
+            raise QueueFull(self.retry_after())
+
+        with open(script_file) as f:
+            code = f.read()
+        request_id = uuid.uuid4().hex
+        future = Future()
+        with self._lock:
+            self._pending[request_id] = (future, None, time.time(), cancel)
+        message_id = self.queue.put(
+            RENDER_QUEUE,
+            {
+                "request_id": request_id,
+                "reply_to": self.reply_to,
+                "script_file": script_file,
+                # Nodes on other hosts may not have the script yet
+                "code": code,
+                "scene_name": scene_name,
+                "flags": list(flags),
+                "media_dir": media_dir or "media",
+            },
+            priority=priority,
+        )
+        with self._lock:
+            if request_id in self._pending:
+                _, _, submitted_at, _ = self._pending[request_id]
+                self._pending[request_id] = (future, message_id, submitted_at, cancel)
+        return future
+
+    def render(
+        self,
+        script_file,
+        scene_name,
+        flags,
+        priority=PRIORITY_INTERACTIVE,
+        wait_below=None,
+        cancel=None,
+    ):
+        future = self.submit_render(
+            script_file, scene_name, flags, priority, wait_below=wait_below, cancel=cancel
+        )
+        return wait_for(future, cancel)
+
+    def idle_slots(self):
+        # Node slots aren't visible from here, so never split a scene
+        return 0
+
+    def saturated(self):
+        return self._depth() >= self.max_queue
+
+    def estimated_wait(self, priority=PRIORITY_INTERACTIVE):
+        # The queue's stats aren't split by priority, so count everything ready
+        counts = self.queue.stats(RENDER_QUEUE)
+        if counts["ready"] == 0:
+            return 0.0
+        avg = sum(self._durations) / len(self._durations) if self._durations else 30
+        return counts["ready"] / max(counts["leased"], 1) * avg
+
+    def retry_after(self):
+        counts = self.queue.stats(RENDER_QUEUE)
+        avg = sum(self._durations) / len(self._durations) if self._durations else 30
+        return max(1, math.ceil((counts["ready"] + 1) / max(counts["leased"], 1) * avg))
+
+    def stats(self):
+        counts = self.queue.stats(RENDER_QUEUE)
+        with self._lock:
+            return {
+                "workers": counts["leased"],
+                "busy": counts["leased"],
+                "queue_depth": counts["ready"],
+                "max_queue": self.max_queue,
+                "dead_letters": counts["dead"],
+                "in_flight": len(self._pending),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_render_seconds": (
+                    sum(self._durations) / len(self._durations)
+                    if self._durations
+                    else None
+                ),
+                "backend": "queue",
+            }
+
+    def _collect(self):
+        last_dead_check = time.monotonic()
+        while True:
+            try:
+                message = self.queue.get(self.reply_to, wait=self.poll_interval)
+                if message is not None:
+                    self._resolve(message.body)
+                    self.queue.ack(message)
+                self._withdraw_cancelled()
+                if time.monotonic() - last_dead_check >= self.dead_check_interval:
+                    last_dead_check = time.monotonic()
+                    self._fail_dead()
+            except Exception:
+                logger.exception("Collecting render results failed")
+                time.sleep(self.poll_interval)
+
+    def _resolve(self, reply):
+        with self._lock:
+            # Delivery is at-least-once; a repeated reply finds nothing pending
+            pending = self._pending.pop(reply["request_id"], None)
+            if pending is None:
+                return
+            future, _, submitted_at, _ = pending
+            self._completed += 1
+            self._durations.append(time.time() - submitted_at)
+        if not future.done():
+            future.set_result(
+                subprocess.CompletedProcess(
+                    args=reply.get("args", []),
+                    returncode=reply["returncode"],
+                    stdout=reply.get("stdout", ""),
+                    stderr=reply.get("stderr", ""),
+                )
+            )
+
+    def _withdraw_cancelled(self):
+        """Take cancelled renders off the queue, or have their node kill them"""
+        with self._lock:
+            cancelled = [
+                (request_id, future, message_id)
+                for request_id, (future, message_id, _, cancel) in self._pending.items()
+                if message_id is not None
+                and (future.cancelled() or (cancel is not None and cancel.is_set()))
+            ]
+            for request_id, _, _ in cancelled:
+                del self._pending[request_id]
+        for request_id, future, message_id in cancelled:
+            future.cancel()
+            if self.queue.cancel(message_id):
+                logger.info(f"Withdrew cancelled render {request_id} (message {message_id})")
+
+    def _fail_dead(self):
+        with self._lock:
+            pending = [
+                (request_id, message_id)
+                for request_id, (_, message_id, _, _) in self._pending.items()
+                if message_id is not None
+            ]
+        for request_id, message_id in pending:
+            state = self.queue.peek(message_id)
+            if state is None or state["state"] != "dead":
+                continue
+            with self._lock:
+                entry = self._pending.pop(request_id, None)
+            if entry is not None and not entry[0].done():
+                entry[0].set_exception(
+                    RuntimeError(
+                        f"Render failed after {state['attempts']} attempts: {state['last_error']}"
+                    )
+                )
+
+
+class _Heartbeat:
+    """
+    Keeps a message's lease alive while its render runs, and sets
+    `cancelled` once the web tier withdraws the message, checking every
+    `check_interval` seconds.
+    """
+
+    def __init__(self, queue, message, visibility_timeout, check_interval=2):
+        self.queue = queue
+        self.message = message
+        self.visibility_timeout = visibility_timeout
+        self.check_interval = min(check_interval, visibility_timeout / 3)
+        self.cancelled = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        extended_at = time.monotonic()
+        while not self._stop.wait(self.check_interval):
+            try:
+                state = self.queue.peek(self.message.id)
+                if state is None or state["state"] == "cancelled":
+                    logger.info(f"Message {self.message.id} was cancelled, stopping its render")
+                    self.cancelled.set()
+                    return
+                if time.monotonic() - extended_at < self.visibility_timeout / 3:
+                    continue
+                extended_at = time.monotonic()
+                if not self.queue.extend(self.message, self.visibility_timeout):
+                    logger.warning(f"Lost the lease on message {self.message.id}")
+                    return
+            except Exception:
+                logger.exception(f"Checking the lease on message {self.message.id} failed")
+
+    def stop(self):
+        self._stop.set()
+
+
+def _write_script(path, code):
+    """Write the script unless this node already has the same one"""
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == code:
+                return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(code)
+    os.replace(tmp_path, path)
+
+
+def handle(message, scheduler, cancel=None):
+    """
+    Render one queued scene; returns the reply for the web tier. The render
+    is killed (or never started) once `cancel` is set.
+    """
+    body = message.body
+    _write_script(body["script_file"], body["code"])
+    result = wait_for(
+        scheduler.submit_render(
+            body["script_file"],
+            body["scene_name"],
+            body["flags"],
+            media_dir=body["media_dir"],
+            cancel=cancel,
+        ),
+        cancel,
+    )
+    return {
+        "request_id": body["request_id"],
+        "args": list(result.args) if isinstance(result.args, (list, tuple)) else [],
+        "returncode": result.returncode,
+        "stdout": (result.stdout or "")[-OUTPUT_TAIL:],
+        "stderr": (result.stderr or "")[-OUTPUT_TAIL:],
+    }
+
+
+def pull(queue, scheduler, visibility_timeout, stop, retry_delay=5):
+    """One puller: lease, render, reply, ack, until `stop` is set"""
+    while not stop.is_set():
+        try:
+            message = queue.get(RENDER_QUEUE, wait=10, visibility_timeout=visibility_timeout)
+        except Exception:
+            logger.exception("Leasing from the work queue failed")
+            stop.wait(retry_delay)
+            continue
+        if message is None:
+            continue
+        heartbeat = _Heartbeat(queue, message, visibility_timeout)
+        try:
+            reply = handle(message, scheduler, heartbeat.cancelled)
+        except CancelledError:
+            logger.info(f"Dropped cancelled message {message.id} before rendering it")
+            continue
+        except Exception as e:
+            logger.exception(f"Render of message {message.id} failed")
+            queue.nack(message, error=f"{type(e).__name__}: {e}", delay=retry_delay)
+            continue
+        finally:
+            heartbeat.stop()
+        if heartbeat.cancelled.is_set():
+            # Nobody is waiting for the reply, and the message is already withdrawn
+            logger.info(f"Killed the render of cancelled message {message.id}")
+            continue
+        # Reply before acking: a crash in between repeats the render, never loses it
+        queue.put(message.body["reply_to"], reply, ttl=REPLY_TTL)
+        queue.ack(message)
+        logger.info(f"Rendered message {message.id} (exit {reply['returncode']})")
+
+
+def run_node(queue, workers, backend=None, visibility_timeout=600, limits=None):
+    """Start `workers` pullers sharing one local RenderScheduler; returns the stop event"""
+    scheduler = RenderScheduler(
+        workers=workers, max_queue=workers, backend=backend, limits=limits
+    )
+    stop = threading.Event()
+    for i in range(workers):
+        threading.Thread(
+            target=pull,
+            args=(queue, scheduler, visibility_timeout, stop),
+            name=f"pull-{i}",
+            daemon=True,
+        ).start()
+    logger.info(f"Render node pulling with {workers} workers")
+    return stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queue", default=os.environ.get("WORK_QUEUE_URL"))
+    parser.add_argument("--token", default=os.environ.get("WORK_QUEUE_TOKEN"))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("RENDER_WORKERS", "0")) or available_cores(),
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("warm", "cli"),
+        default=os.environ.get("RENDER_BACKEND", "warm"),
+    )
+    parser.add_argument(
+        "--visibility-timeout",
+        type=int,
+        default=int(os.environ.get("WORK_QUEUE_VISIBILITY_TIMEOUT", "600")),
+    )
+    args = parser.parse_args()
+    if not args.queue:
+        parser.error("--queue or WORK_QUEUE_URL is required")
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    limits = limits_from_env()
+    backend = None
+    if args.backend == "warm":
+        from glyph_cache import GlyphCache
+        from warm_pool import WarmRenderPool
+
+        glyph_cache = GlyphCache(
+            os.environ.get(
+                "GLYPH_CACHE_DIR",
+                os.path.join(tempfile.gettempdir(), "animator-glyph-cache"),
+            ),
+            max_bytes=int(os.environ.get("GLYPH_CACHE_MAX_BYTES", 512 * 1024**2)),
+        )
+        backend = WarmRenderPool(
+            args.workers,
+            max_jobs_per_worker=int(os.environ.get("RENDER_WORKER_MAX_JOBS", "50")),
+            glyph_cache=glyph_cache,
+            limits=limits,
+        )
+    queue = queue_from_url(args.queue, token=args.token)
+    stop = run_node(queue, args.workers, backend, args.visibility_timeout, limits)
+    try:
+        while not stop.wait(3600):
+            pass
+    except KeyboardInterrupt:
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import os
+import math
+import time
+import heapq
+import logging
+import itertools
+import threading
+import subprocess
+from collections import deque
+from functools import partial
+from concurrent.futures import Future, wait
+
+from metrics import observe_stage
+from limits import RenderLimits, run_limited
+
+logger = logging.getLogger(__name__)
+
+# Lower numbers run first; equal priorities run in submission order
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+# Bulk work (e.g. /generate_batch) yields to interactive renders and their upgrades
+PRIORITY_BATCH = 20
+
+
+def available_cores():
+    """Cores this process may actually run on (respects taskset/cgroup pinning)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class QueueFull(Exception):
+    """Raised when the render queue is at capacity"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Render queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RenderScheduler:
+    """
+    Bounded priority queue in front of a fixed number of render slots.
+
+    Each slot is a thread that drives one render (a `manim` process or a warm
+    worker) at a time, so at most `workers` renders run concurrently (one per
+    core by default) and at most `max_queue` more wait their turn. Anything
+    beyond that is rejected with a retry-after estimate instead of piling up.
+
+    CLI renders run under `limits` (a RenderLimits) and stop at the first
+    error they print; a warm `backend` enforces its own limits. Renders
+    submitted with a `cancel` event are dropped from the queue or killed
+    mid-render once it is set.
+    """
+
+    def __init__(self, workers=None, max_queue=None, backend=None, limits=None):
+        self.workers = workers or available_cores()
+        self.max_queue = max_queue if max_queue is not None else self.workers * 4
+        # Optional in-process renderer (e.g. WarmRenderPool); None means the CLI
+        self.backend = backend
+        self.limits = limits or RenderLimits()
+        self._heap = []
+        self._counter = itertools.count()
+        lock = threading.Lock()
+        self._cond = threading.Condition(lock)
+        # Signalled whenever a queued render starts, for submitters waiting for room
+        self._room = threading.Condition(lock)
+        self._busy = 0
+        self._busy_time = 0.0
+        self._started_at = time.time()
+        self._completed = 0
+        self._rejected = 0
+        # Recent render durations, used for the retry-after estimate
+        self._durations = deque(maxlen=50)
+        for i in range(self.workers):
+            threading.Thread(
+                target=self._worker, name=f"render-{i}", daemon=True
+            ).start()
+        logger.info(
+            f"Render scheduler started with {self.workers} workers, "
+            f"queue limit {self.max_queue}"
+        )
+
+    def submit(self, cmd, priority=PRIORITY_INTERACTIVE, **popen_kwargs):
+        """
+        Queue a command. Returns a Future resolving to the
+        `subprocess.CompletedProcess`; raises QueueFull if at capacity.
+        """
+        popen_kwargs.setdefault("capture_output", True)
+        popen_kwargs.setdefault("text", True)
+        return self.submit_task(partial(subprocess.run, cmd, **popen_kwargs), priority)
+
+    def submit_task(
+        self, task, priority=PRIORITY_INTERACTIVE, wait_below=None, cancel=None
+    ):
+        """
+        Queue a zero-argument callable to run in a render slot. With
+        `wait_below`, block until fewer than that many renders are queued
+        instead of raising QueueFull, so bulk submitters leave the rest of
+        the queue to interactive work. A task whose `cancel` event is set
+        before a slot frees up never runs.
+        """
+        future = Future()
+        with self._cond:
+            if wait_below is not None:
+                while len(self._heap) >= min(wait_below, self.max_queue):
+                    self._room.wait()
+            elif len(self._heap) >= self.max_queue:
+                self._rejected += 1
+                raise QueueFull(self._retry_after())
+            heapq.heappush(
+                self._heap,
+                (priority, next(self._counter), time.time(), task, future, cancel),
+            )
+            self._cond.notify()
+        return future
+
+    def submit_render(
+        self,
+        script_file,
+        scene_name,
+        flags,
+        priority=PRIORITY_INTERACTIVE,
+        media_dir=None,
+        wait_below=None,
+        cancel=None,
+    ):
+        """Queue a scene render on the configured backend"""
+        if self.backend is not None:
+            task = partial(
+                self.backend.render,
+                script_file,
+                scene_name,
+                flags,
+                media_dir or "media",
+                cancel=cancel,
+            )
+        else:
+            args = list(flags)
+            if media_dir:
+                args += ["--media_dir", media_dir]
+            # Killed at the first traceback rather than left to wind down
+            task = partial(
+                run_limited,
+                self.limits.cli_command([*args, script_file, scene_name]),
+                self.limits,
+                cancel,
+                fail_fast=True,
+            )
+        return self.submit_task(task, priority, wait_below, cancel)
+
+    def run(self, cmd, priority=PRIORITY_INTERACTIVE, **popen_kwargs):
+        """Submit and block until the command finishes"""
+        return self.submit(cmd, priority, **popen_kwargs).result()
+
+    def render(
+        self,
+        script_file,
+        scene_name,
+        flags,
+        priority=PRIORITY_INTERACTIVE,
+        wait_below=None,
+        cancel=None,
+    ):
+        """
+        Submit a render and block until it finishes. Raises CancelledError
+        if `cancel` is set while it is still queued.
+        """
+        future = self.submit_render(
+            script_file,
+            scene_name,
+            flags,
+            priority,
+            wait_below=wait_below,
+            cancel=cancel,
+        )
+        return wait_for(future, cancel)
+
+    def idle_slots(self):
+        """Render slots that would start work immediately"""
+        with self._cond:
+            return max(self.workers - self._busy - len(self._heap), 0)
+
+    def saturated(self):
+        with self._cond:
+            return len(self._heap) >= self.max_queue
+
+    def retry_after(self):
+        with self._cond:
+            return self._retry_after()
+
+    def estimated_wait(self, priority=PRIORITY_INTERACTIVE):
+        """
+        Seconds a render submitted now at `priority` would likely wait for a
+        slot: the renders queued ahead of it plus those holding a slot,
+        drained across all slots at the recent average render time.
+        """
+        with self._cond:
+            ahead = sum(1 for entry in self._heap if entry[0] <= priority)
+            waves = max(ahead + self._busy - self.workers + 1, 0) / self.workers
+            return waves * self._avg_duration()
+
+    def _avg_duration(self):
+        return sum(self._durations) / len(self._durations) if self._durations else 30
+
+    def _retry_after(self):
+        # Time for the queue ahead of us to drain across all slots
+        return max(1, math.ceil((len(self._heap) + 1) / self.workers * self._avg_duration()))
+
+    def stats(self):
+        with self._cond:
+            elapsed = max(time.time() - self._started_at, 1e-9)
+            return {
+                "workers": self.workers,
+                "busy": self._busy,
+                "queue_depth": len(self._heap),
+                "max_queue": self.max_queue,
+                "utilization": self._busy / self.workers,
+                "lifetime_utilization": self._busy_time / (elapsed * self.workers),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_render_seconds": (
+                    sum(self._durations) / len(self._durations)
+                    if self._durations
+                    else None
+                ),
+                "backend": self.backend.stats()
+                if hasattr(self.backend, "stats")
+                else None,
+            }
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                priority, _, queued_at, task, future, cancel = heapq.heappop(self._heap)
+                self._room.notify()
+                if cancel is not None and cancel.is_set():
+                    future.cancel()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._busy += 1
+
+            start = time.time()
+            observe_stage("queue_wait", start - queued_at, priority=priority)
+            outcome = "error"
+            try:
+                result = task()
+                if getattr(result, "returncode", 0) == 0:
+                    outcome = "ok"
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                duration = time.time() - start
+                observe_stage("render_slot", duration, outcome, priority=priority)
+                with self._cond:
+                    self._busy -= 1
+                    self._busy_time += duration
+                    self._completed += 1
+                    self._durations.append(duration)
+                logger.info(
+                    f"Render finished in {duration:.1f}s "
+                    f"after {start - queued_at:.1f}s in queue"
+                )
+
+
+def wait_for(future, cancel=None, poll_interval=0.5):
+    """
+    `future.result()`, except that setting `cancel` while the future is
+    still queued cancels it at once. A running render notices `cancel`
+    itself and returns early.
+    """
+    while cancel is not None and not future.done():
+        wait([future], timeout=poll_interval)
+        if cancel.is_set() and future.cancel():
+            break
+    return future.result()
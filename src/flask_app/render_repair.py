@@ -0,0 +1,101 @@
+"""
+Failed renders, boiled down: spotting the error in manim's output as it
+streams, trimming it to what matters, and asking the LLM for a fixed script.
+"""
+
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The summary line that ends a Python traceback, e.g.
+# "NameError: name 'x' is not defined" or "manim.utils.tex.TexError: ..."
+ERROR_LINE = re.compile(r"^(?:[A-Za-z_]\w*\.)*[A-Za-z_]\w*(?:Error|Exception)(?::\s|$)")
+# Frame borders and markers in rich's tracebacks, which manim enables
+RICH_DECORATION = re.compile(r"[│╭╮╰╯─❱]")
+# Lines kept from a (possibly multi-line) exception message
+MESSAGE_LINES = 8
+
+
+class BrokenScript(Exception):
+    """
+    A script failed validation or rendering in a way the LLM may be able to
+    fix. `error` is the trimmed failure to show it; `details` go into the
+    job's error payload if no repair succeeds.
+    """
+
+    def __init__(self, message, stage, error, **details):
+        super().__init__(message)
+        self.stage = stage
+        self.error = error
+        self.details = details
+
+
+REPAIR_PROMPT = """The following Manim Community script failed with this error:
+
+{error}
+
+Script:
+```python
+{code}
+```
+
+Fix the script so it renders. Keep the scene class named {scene_name} and keep
+the animation the same apart from the fix. Reply with the complete corrected
+script in a single ```python code block."""
+
+
+def trim_error(output, script_file=None, code=None, limit=1500):
+    """
+    The part of a render's stderr (or a traceback) worth showing: the final
+    exception and, when the traceback passes through `script_file`, the
+    script line that raised it. Falls back to the tail of `output`.
+    """
+    lines = [RICH_DECORATION.sub("", line).strip() for line in (output or "").splitlines()]
+    last = max((i for i, line in enumerate(lines) if ERROR_LINE.match(line)), default=None)
+    if last is None:
+        return (output or "").strip()[-limit:]
+
+    message = []
+    for line in lines[last : last + MESSAGE_LINES]:
+        if not line and message:
+            break
+        message.append(line)
+    parts = ["\n".join(message)]
+
+    if script_file:
+        # Plain tracebacks say `"<path>", line N`, rich ones `<path>:N`
+        location = re.compile(re.escape(os.path.basename(script_file)) + r'(?:", line |:)(\d+)')
+        line_numbers = [
+            int(match.group(1))
+            for line in lines[:last]
+            for match in [location.search(line)]
+            if match
+        ]
+        if line_numbers:
+            number = line_numbers[-1]
+            source = code.splitlines() if code else []
+            if 0 < number <= len(source):
+                parts.append(f"at line {number}: {source[number - 1].strip()}")
+            else:
+                parts.append(f"at line {number}")
+    return "\n".join(parts)[:limit]
+
+
+def request_repair(llm_cache, client, model, code, error, scene_name, temperature=0.2):
+    """
+    Ask the LLM to fix `code` given the trimmed `error`. Returns
+    `(content, cached)`; identical failures reuse the cached fix.
+    """
+    prompt = REPAIR_PROMPT.format(error=error, code=code, scene_name=scene_name)
+    logger.info(f"Asking for a repair of {scene_name}: {error.splitlines()[0] if error else ''}")
+    return llm_cache.complete(
+        client,
+        model=model,
+        prompt=prompt,
+        # The whole prompt is the key; there is no question to lift out of it
+        question="",
+        temperature=temperature,
+        scene_name=scene_name,
+    )
@@ -0,0 +1,196 @@
+"""
+Derived outputs of a finished render: a poster frame, an animated GIF
+preview and a low-bitrate mp4 for small screens. They are transcoded with
+ffmpeg on a worker pool of their own, so they never hold a render slot.
+"""
+
+import os
+import logging
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# name -> file suffix, MIME type, and ffmpeg arguments before and after -i
+RENDITIONS = {
+    "poster": {
+        "suffix": ".poster.jpg",
+        "content_type": "image/jpeg",
+        # Manim scenes open on an empty frame; the last one shows the result
+        "input": ["-sseof", "-0.5"],
+        "output": ["-frames:v", "1", "-q:v", "3"],
+    },
+    "preview": {
+        "suffix": ".preview.gif",
+        "content_type": "image/gif",
+        "input": [],
+        "output": [
+            "-vf",
+            "fps=10,scale='min(480,iw)':-2:flags=lanczos,"
+            "split[a][b];[a]palettegen=max_colors=128[p];[b][p]paletteuse",
+            "-loop",
+            "0",
+        ],
+    },
+    "mobile": {
+        "suffix": ".mobile.mp4",
+        "content_type": "video/mp4",
+        "input": [],
+        "output": [
+            "-vf",
+            "scale=-2:'min(360,ih)'",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-crf",
+            "30",
+            "-maxrate",
+            "300k",
+            "-bufsize",
+            "600k",
+            "-pix_fmt",
+            "yuv420p",
+            "-an",
+            "-movflags",
+            "+faststart",
+        ],
+    },
+}
+
+
+def rendition_path(video_path, name):
+    """Where rendition `name` of `video_path` lives: next to it, same stem"""
+    return os.path.splitext(video_path)[0] + RENDITIONS[name]["suffix"]
+
+
+def transcode(video_path, name, timeout=None):
+    """
+    Write rendition `name` of `video_path` and return its path. Videos are
+    named by content in the render cache, so an existing rendition is
+    reused (and touched, like a cache hit) instead of transcoded again.
+    The output is written to a hidden temp file and renamed into place.
+    """
+    spec = RENDITIONS[name]
+    path = rendition_path(video_path, name)
+    try:
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+
+    # ffmpeg picks the format from the extension, so the temp file keeps it
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=".", suffix=spec["suffix"]
+    )
+    os.close(fd)
+    try:
+        result = subprocess.run(
+            [
+                "ffmpeg",
+                "-y",
+                "-loglevel",
+                "error",
+                *spec["input"],
+                "-i",
+                video_path,
+                *spec["output"],
+                tmp_path,
+            ],
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg exited with {result.returncode}: {result.stderr.strip()[-500:]}"
+            )
+        os.replace(tmp_path, path)
+        return path
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+class RenditionPool:
+    """
+    Transcodes every rendition in `names` on `workers` threads. submit()
+    starts all of a video's renditions at once and returns a future per
+    name; each resolves to an entry for the job result, with `status`
+    "done" (plus `url`, `content_type` and `bytes`) or "failed".
+    """
+
+    def __init__(self, names=tuple(RENDITIONS), workers=3, timeout=120):
+        unknown = [name for name in names if name not in RENDITIONS]
+        if unknown:
+            raise ValueError(
+                f"Unknown renditions {unknown}, use some of {list(RENDITIONS)}"
+            )
+        self.names = tuple(names)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="rendition"
+        )
+
+    def pending(self, video_path, url_for):
+        """
+        Entries for renditions of `video_path` that are on their way, each
+        with the URL `url_for(path)` says it will be published at
+        """
+        return {
+            name: {
+                "status": "pending",
+                "url": url_for(rendition_path(video_path, name)),
+                "content_type": RENDITIONS[name]["content_type"],
+            }
+            for name in self.names
+        }
+
+    def submit(self, video_path, publish, script_id=None):
+        """
+        Start every rendition of `video_path`. `publish(path)` runs on the
+        pool thread once an output is written and returns its URL.
+        """
+        return {
+            name: self._executor.submit(self._run, video_path, name, publish, script_id)
+            for name in self.names
+        }
+
+    def _run(self, video_path, name, publish, script_id):
+        try:
+            with span("rendition", script_id, kind=name) as s:
+                if os.path.exists(rendition_path(video_path, name)):
+                    s["outcome"] = "cached"
+                path = transcode(video_path, name, self.timeout)
+                url = publish(path)
+        except Exception as e:
+            logger.warning(f"{name} rendition of {video_path} failed: {e}")
+            return {"status": "failed", "error": str(e)}
+        return {
+            "status": "done",
+            "url": url,
+            "content_type": RENDITIONS[name]["content_type"],
+            "bytes": os.path.getsize(path),
+        }
+
+
+def renditions_from_env():
+    """
+    RenditionPool for RENDITIONS (comma-separated names, all by default),
+    RENDITION_WORKERS and RENDITION_TIMEOUT; None when RENDITIONS is empty
+    """
+    names = [
+        name.strip()
+        for name in os.environ.get("RENDITIONS", ",".join(RENDITIONS)).split(",")
+        if name.strip()
+    ]
+    if not names:
+        return None
+    return RenditionPool(
+        names,
+        workers=int(os.environ.get("RENDITION_WORKERS", "3")),
+        timeout=float(os.environ.get("RENDITION_TIMEOUT", "120")) or None,
+    )
@@ -0,0 +1,534 @@
+"""
+Hand-tuned scenes for the questions asked most often. A recognized question
+is answered from a template instead of the LLM, with parameters (matrix
+entries, side lengths) taken from the question when it gives them, and the
+most popular templates are rendered ahead of time so they are cache hits.
+"""
+
+import os
+import re
+import ast
+import logging
+
+from render_cache import script_key
+from render_pool import PRIORITY_BACKGROUND
+from quality import tier_flags, video_path
+
+logger = logging.getLogger(__name__)
+
+# Longer questions ask for more than a template shows; leave them to the LLM
+MAX_WORDS = 20
+
+# Questions about why or what something means want an explanation, not a worked
+# example, even when they name a template's topic
+CONCEPTUAL_WORDS = {
+    "why",
+    "mean",
+    "means",
+    "meaning",
+    "geometric",
+    "geometrically",
+    "intuition",
+    "intuitive",
+    "intuitively",
+    "interpret",
+    "interpretation",
+    "represent",
+    "represents",
+    "always",
+    "never",
+    "prove",
+    "proof",
+    "derive",
+    "derivation",
+}
+# Yes/no questions ("Is the hypotenuse always...?") are conceptual too
+YES_NO_OPENERS = {"is", "are", "can", "does", "do", "should", "could", "will", "would"}
+
+# How a question may ask for a worked example of a template's topic, e.g.
+# "How do you calculate the dot product?"
+LEAD_IN = (
+    r"(?:(?:what is|what's|explain|show me|show|teach me|"
+    r"how (?:do|does|can|would|should) (?:you|i|we|one)"
+    r"(?: compute| calculate| find| work out| do| get)?|"
+    r"how to(?: compute| calculate| find| work out| do| get)?|"
+    r"compute|calculate|find|work out) )?"
+)
+
+
+def _canonical(*subjects):
+    """Regex for a whole question asking about one of `subjects`, nothing more"""
+    return re.compile(
+        rf"^{LEAD_IN}(?:the |a |an )?(?:{'|'.join(subjects)})(?: work| works)?$"
+    )
+
+
+class SceneTemplate:
+    """
+    A parameterized scene. `keywords` is a list of word sets that must all
+    be hit by the question (any word of each set); any word in `exclude`
+    rules the template out. `parse(question)` returns the parameters the
+    question gives, {} when it gives none, or None when it gives operands
+    the template can't draw. A question without operands only gets the
+    `defaults` when it is one of the `canonical` phrasings (a regex on the
+    normalized question). `build(class_name, **params)` returns the script.
+    """
+
+    def __init__(
+        self, name, class_name, keywords, parse, build, defaults, canonical, exclude=()
+    ):
+        self.name = name
+        self.class_name = class_name
+        self.keywords = [set(words) for words in keywords]
+        self.exclude = set(exclude)
+        self.parse = parse
+        self.build = build
+        self.defaults = defaults
+        self.canonical = canonical
+
+    def matches(self, words):
+        return not (words & self.exclude) and all(words & group for group in self.keywords)
+
+    def script(self, params=None):
+        return self.build(self.class_name, **{**self.defaults, **(params or {})})
+
+
+def _num(x):
+    """A parameter as it should appear in code and on screen: 2 rather than 2.0"""
+    x = float(x)
+    return int(x) if x.is_integer() else round(x, 3)
+
+
+def _tex(x):
+    """A factor in a written-out product; negatives get parentheses"""
+    x = _num(x)
+    return f"({x})" if x < 0 else str(x)
+
+
+def _literals(question):
+    """Bracketed number lists in the question, e.g. [[2, -1], [3, 4]] and [1, 2]"""
+    found = []
+    depth = start = 0
+    for i, char in enumerate(question):
+        if char == "[":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == "]" and depth:
+            depth -= 1
+            if depth == 0:
+                try:
+                    found.append(ast.literal_eval(question[start : i + 1]))
+                except (ValueError, SyntaxError):
+                    pass
+    return found
+
+
+def _is_vector(value, sizes=(2, 3, 4)):
+    return (
+        isinstance(value, list)
+        and len(value) in sizes
+        and all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in value)
+    )
+
+
+def _is_matrix(value, rows=(2, 3), columns=(2, 3)):
+    return (
+        isinstance(value, list)
+        and len(value) in rows
+        and all(_is_vector(row, columns) for row in value)
+        and len({len(row) for row in value}) == 1
+    )
+
+
+def _parse_matrix_vector(question):
+    literals = _literals(question)
+    if not literals:
+        return {}
+    matrices = [m for m in literals if _is_matrix(m)]
+    vectors = [v for v in literals if _is_vector(v)]
+    if len(matrices) == 1 and len(vectors) == 1 and len(matrices[0][0]) == len(vectors[0]):
+        return {"matrix": matrices[0], "vector": vectors[0]}
+    return None
+
+
+def _parse_dot_product(question):
+    literals = _literals(question)
+    if not literals:
+        return {}
+    if len(literals) == 2 and all(_is_vector(v) for v in literals):
+        if len(literals[0]) == len(literals[1]):
+            return {"u": literals[0], "v": literals[1]}
+    return None
+
+
+def _parse_determinant(question):
+    literals = _literals(question)
+    if not literals:
+        return {}
+    if len(literals) == 1 and _is_matrix(literals[0], rows=(2,), columns=(2,)):
+        return {"matrix": literals[0]}
+    return None
+
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+# "hypotenuse is 13", "hypotenuse of 13", "c = 13", "13 is the hypotenuse"
+_HYPOTENUSE = re.compile(
+    rf"\bhypotenuse,?\s+(?:is\s+|of\s+|equals\s+|=\s*|of length\s+|length\s+)?{_NUMBER}"
+    rf"|\bc\s*=\s*{_NUMBER}"
+    rf"|{_NUMBER}\s+(?:is|as)\s+the\s+hypotenuse"
+)
+# Words that name the numbers as legs: "legs 3 and 4", "sides of 3 and 4", "a = 3"
+_LEGS = re.compile(r"\blegs?\b|\bsides?\b|\b[ab]\s*=")
+# The hypotenuse is what is being asked for: "find the hypotenuse ..."
+_ASKS_HYPOTENUSE = re.compile(
+    r"\b(?:find|what is|what's|compute|calculate|work out|length of) the hypotenuse\b"
+)
+
+
+def _parse_pythagorean(question):
+    """
+    Legs `a` and `b`, or leg `a` and hypotenuse `c`. Numbers are only used
+    when the question says which is which; otherwise it goes to the LLM.
+    """
+    text = question.lower()
+    numbers = [float(n) for n in re.findall(_NUMBER, text)]
+    if not numbers:
+        return {}
+    if len(numbers) != 2 or not all(0 < n <= 1000 for n in numbers):
+        return None
+    hypotenuse = _HYPOTENUSE.search(text)
+    if hypotenuse:
+        c = float(next(group for group in hypotenuse.groups() if group))
+        legs = list(numbers)
+        legs.remove(c)
+        if legs[0] >= c:
+            return None
+        return {"a": legs[0], "b": None, "c": c}
+    if "hypotenuse" in text and not _ASKS_HYPOTENUSE.search(text):
+        return None
+    if not (_LEGS.search(text) or _ASKS_HYPOTENUSE.search(text)):
+        return None
+    return {"a": numbers[0], "b": numbers[1], "c": None}
+
+
+def _matrix_vector_scene(class_name, matrix, vector):
+    matrix = [[_num(x) for x in row] for row in matrix]
+    vector = [_num(x) for x in vector]
+    result = [_num(sum(a * b for a, b in zip(row, vector))) for row in matrix]
+    steps = [
+        " + ".join(f"{_tex(a)} \\cdot {_tex(b)}" for a, b in zip(row, vector)) + f" = {r}"
+        for row, r in zip(matrix, result)
+    ]
+    return f'''from manim import *
+
+
+class {class_name}(Scene):
+    def construct(self):
+        title = Text("Multiplying a matrix by a vector", font_size=36).to_edge(UP)
+        matrix = Matrix({matrix!r})
+        vector = Matrix({[[x] for x in vector]!r})
+        equals = MathTex("=")
+        result = Matrix({[[x] for x in result]!r})
+        VGroup(matrix, vector, equals, result).arrange(RIGHT).shift(UP * 0.5)
+        steps = {steps!r}
+
+        self.play(Write(title))
+        self.play(Create(matrix), Create(vector))
+        self.wait(1)
+        self.play(Write(equals), Create(result.get_brackets()))
+
+        column = SurroundingRectangle(vector.get_columns()[0], color=YELLOW)
+        self.play(Create(column))
+        for row, entry, step in zip(matrix.get_rows(), result.get_entries(), steps):
+            highlight = SurroundingRectangle(row, color=YELLOW)
+            work = MathTex(step).next_to(matrix, DOWN, buff=1).set_x(0)
+            self.play(Create(highlight), Write(work))
+            self.play(TransformFromCopy(work, entry))
+            self.play(FadeOut(highlight), FadeOut(work))
+        self.play(FadeOut(column))
+        self.wait(1)
+'''
+
+
+def _right_triangle(a, b):
+    """
+    Corners (right angle, end of `a`, end of `b`) and a hypotenuse label spot
+    for legs `a` and `b`, fitted in the left half of the frame with the right
+    angle at the bottom left
+    """
+    scale = min(5 / a, 4 / b)
+    x0, y0 = -6.0, -2.5
+    right = [x0, y0, 0]
+    base = [round(x0 + a * scale, 3), y0, 0]
+    top = [x0, round(y0 + b * scale, 3), 0]
+    middle = [round((base[0] + x0) / 2 + 0.4, 3), round((top[1] + y0) / 2 + 0.4, 3), 0]
+    return right, base, top, middle
+
+
+def _pythagorean_scene(class_name, a, b=None, c=None):
+    if b is None:
+        return _pythagorean_leg_scene(class_name, a, c)
+    a, b = _num(a), _num(b)
+    c_squared = _num(a * a + b * b)
+    c = _num(c_squared**0.5)
+    right, base, top, middle = _right_triangle(a, b)
+    x0, y0 = right[:2]
+    answer = f"c = \\sqrt{{{c_squared}}} " + (
+        f"= {c}" if float(c).is_integer() else f"\\approx {c:.2f}"
+    )
+    return f'''from manim import *
+
+
+class {class_name}(Scene):
+    def construct(self):
+        title = Text("The Pythagorean theorem", font_size=36).to_edge(UP)
+        triangle = Polygon({right!r}, {base!r}, {top!r}, color=BLUE)
+        corner = Square(side_length=0.3).move_to({[x0 + 0.15, y0 + 0.15, 0]!r})
+        leg_a = MathTex({f"a = {a}"!r}).next_to(Line({right!r}, {base!r}), DOWN)
+        leg_b = MathTex({f"b = {b}"!r}).next_to(Line({right!r}, {top!r}), LEFT)
+        hypotenuse = MathTex("c").move_to({middle!r})
+        formula = MathTex("a^2 + b^2 = c^2").move_to([3.5, 1.5, 0])
+        squares = MathTex({f"{a}^2 + {b}^2 = {_num(a * a)} + {_num(b * b)} = {c_squared}"!r})
+        squares.next_to(formula, DOWN, buff=0.5)
+        answer = MathTex({answer!r}).next_to(squares, DOWN, buff=0.5)
+
+        self.play(Write(title))
+        self.play(Create(triangle), Create(corner))
+        self.play(Write(leg_a), Write(leg_b), Write(hypotenuse))
+        self.wait(1)
+        self.play(Write(formula))
+        self.play(Write(squares))
+        self.play(Write(answer))
+        self.play(Indicate(hypotenuse), Indicate(answer))
+        self.wait(1)
+'''
+
+
+def _pythagorean_leg_scene(class_name, a, c):
+    """The missing leg `b` of a right triangle with leg `a` and hypotenuse `c`"""
+    a, c = _num(a), _num(c)
+    b_squared = _num(c * c - a * a)
+    b = _num(b_squared**0.5)
+    right, base, top, middle = _right_triangle(a, b)
+    x0, y0 = right[:2]
+    answer = f"b = \\sqrt{{{b_squared}}} " + (
+        f"= {b}" if float(b).is_integer() else f"\\approx {b:.2f}"
+    )
+    return f'''from manim import *
+
+
+class {class_name}(Scene):
+    def construct(self):
+        title = Text("The Pythagorean theorem", font_size=36).to_edge(UP)
+        triangle = Polygon({right!r}, {base!r}, {top!r}, color=BLUE)
+        corner = Square(side_length=0.3).move_to({[x0 + 0.15, y0 + 0.15, 0]!r})
+        leg_a = MathTex({f"a = {a}"!r}).next_to(Line({right!r}, {base!r}), DOWN)
+        leg_b = MathTex("b").next_to(Line({right!r}, {top!r}), LEFT)
+        hypotenuse = MathTex({f"c = {c}"!r}).move_to({middle!r})
+        formula = MathTex("b^2 = c^2 - a^2").move_to([3.5, 1.5, 0])
+        squares = MathTex({f"b^2 = {c}^2 - {a}^2 = {_num(c * c)} - {_num(a * a)} = {b_squared}"!r})
+        squares.next_to(formula, DOWN, buff=0.5)
+        answer = MathTex({answer!r}).next_to(squares, DOWN, buff=0.5)
+
+        self.play(Write(title))
+        self.play(Create(triangle), Create(corner))
+        self.play(Write(leg_a), Write(leg_b), Write(hypotenuse))
+        self.wait(1)
+        self.play(Write(formula))
+        self.play(Write(squares))
+        self.play(Write(answer))
+        self.play(Indicate(leg_b), Indicate(answer))
+        self.wait(1)
+'''
+
+
+def _dot_product_scene(class_name, u, v):
+    u = [_num(x) for x in u]
+    v = [_num(x) for x in v]
+    total = _num(sum(a * b for a, b in zip(u, v)))
+    parts = []
+    for a, b in zip(u, v):
+        parts += [f"{_tex(a)} \\cdot {_tex(b)}", "+"]
+    parts[-1] = "="
+    parts.append(str(total))
+    return f'''from manim import *
+
+
+class {class_name}(Scene):
+    def construct(self):
+        title = Text("The dot product", font_size=36).to_edge(UP)
+        u = Matrix({[[x] for x in u]!r})
+        dot = MathTex("\\\\cdot")
+        v = Matrix({[[x] for x in v]!r})
+        equals = MathTex("=")
+        vectors = VGroup(u, dot, v, equals).arrange(RIGHT).to_edge(LEFT, buff=1)
+        work = MathTex(*{parts!r}).next_to(vectors, RIGHT)
+
+        self.play(Write(title))
+        self.play(Create(u), Write(dot), Create(v))
+        self.play(Write(equals))
+        self.wait(1)
+        pairs = zip(u.get_entries(), v.get_entries())
+        for i, (a, b) in enumerate(pairs):
+            boxes = VGroup(SurroundingRectangle(a), SurroundingRectangle(b))
+            self.play(Create(boxes))
+            self.play(TransformFromCopy(VGroup(a, b), work[2 * i]))
+            if 2 * i + 1 < len(work) - 2:
+                self.play(Write(work[2 * i + 1]))
+            self.play(FadeOut(boxes))
+        self.play(Write(work[-2]), Write(work[-1]))
+        self.play(Indicate(work[-1]))
+        self.wait(1)
+'''
+
+
+def _determinant_scene(class_name, matrix):
+    (a, b), (c, d) = [[_num(x) for x in row] for row in matrix]
+    det = _num(a * d - b * c)
+    parts = [f"{_tex(a)} \\cdot {_tex(d)}", "-", f"{_tex(b)} \\cdot {_tex(c)}", "=", str(det)]
+    return f'''from manim import *
+
+
+class {class_name}(Scene):
+    def construct(self):
+        title = Text("The determinant of a 2x2 matrix", font_size=36).to_edge(UP)
+        label = MathTex("\\\\det")
+        matrix = Matrix({[[a, b], [c, d]]!r})
+        VGroup(label, matrix).arrange(RIGHT).shift(UP)
+        formula = MathTex("ad - bc").next_to(matrix, DOWN, buff=0.6).set_x(0)
+        work = MathTex(*{parts!r})
+        work.next_to(formula, DOWN, buff=0.5)
+        work[0].set_color(BLUE)
+        work[2].set_color(RED)
+        entries = matrix.get_entries()
+
+        self.play(Write(title))
+        self.play(Write(label), Create(matrix))
+        self.play(Write(formula))
+        self.wait(1)
+        self.play(entries[0].animate.set_color(BLUE), entries[3].animate.set_color(BLUE))
+        self.play(TransformFromCopy(VGroup(entries[0], entries[3]), work[0]))
+        self.play(entries[1].animate.set_color(RED), entries[2].animate.set_color(RED))
+        self.play(Write(work[1]), TransformFromCopy(VGroup(entries[1], entries[2]), work[2]))
+        self.play(Write(work[3]), Write(work[4]))
+        self.play(Indicate(work[4]))
+        self.wait(1)
+'''
+
+
+# Most requested first; prewarm() renders from the front of this list
+TEMPLATES = [
+    SceneTemplate(
+        "matrix_vector",
+        "MatrixVectorScene",
+        [
+            {"matrix", "matrices"},
+            {"vector", "vectors"},
+            {"multiply", "multiplying", "multiplication", "times", "product"},
+        ],
+        _parse_matrix_vector,
+        _matrix_vector_scene,
+        {"matrix": [[2, -1], [3, 4]], "vector": [1, 2]},
+        _canonical(
+            r"(?:multiply|multiplying|multiplication of) a matrix (?:by|with|and) a vector",
+            r"matrix[ -]vector (?:multiplication|product)",
+            r"product of a matrix and a vector",
+        ),
+        exclude={"3x3", "4x4", "nxn", "three", "four", "eigenvalue", "eigenvector"},
+    ),
+    SceneTemplate(
+        "pythagorean",
+        "PythagoreanScene",
+        [{"pythagorean", "pythagoras", "hypotenuse"}],
+        _parse_pythagorean,
+        _pythagorean_scene,
+        {"a": 3, "b": 4, "c": None},
+        _canonical(r"(?:pythagorean|pythagoras|pythagoras') theorem"),
+        exclude={"prove", "proof", "converse", "triples", "3d"},
+    ),
+    SceneTemplate(
+        "dot_product",
+        "DotProductScene",
+        [{"dot", "scalar", "inner"}, {"product", "products"}],
+        _parse_dot_product,
+        _dot_product_scene,
+        {"u": [1, 2, 3], "v": [4, -1, 2]},
+        _canonical(r"(?:dot|scalar) product(?: of (?:two|2) vectors)?"),
+        exclude={"matrix", "matrices", "cross", "angle", "projection"},
+    ),
+    SceneTemplate(
+        "determinant",
+        "DeterminantScene",
+        [{"determinant", "determinants"}],
+        _parse_determinant,
+        _determinant_scene,
+        {"matrix": [[3, 1], [2, 4]]},
+        _canonical(r"determinant(?: of a 2x2 matrix)?", r"2x2 determinant"),
+        exclude={"3x3", "4x4", "nxn", "three", "four", "cofactor", "cofactors", "eigenvalue"},
+    ),
+]
+
+
+def match_template(question):
+    """
+    `(template, params)` for a question a template answers, else None: an
+    explicit computation whose operands parse, or a canonical phrasing of
+    the template's topic. Anything else, conceptual questions included,
+    is left to the LLM.
+    """
+    text = " ".join(re.sub(r"[?.!,;:]+(?=\s|$)", " ", question.lower()).split())
+    words = re.findall(r"[a-z0-9]+", text)
+    if len(words) > MAX_WORDS or not words:
+        return None
+    if CONCEPTUAL_WORDS & set(words) or words[0] in YES_NO_OPENERS:
+        return None
+    for template in TEMPLATES:
+        if template.matches(set(words)):
+            params = template.parse(question)
+            if params is None:
+                return None
+            if not params and not template.canonical.match(text):
+                return None
+            return template, params
+    return None
+
+
+def prewarm(scheduler, render_cache, script_dir, tiers, count=None, prepare=None):
+    """
+    Render the `count` most requested templates with their default
+    parameters at each of `tiers` into `render_cache`, one at a time at
+    background priority, so their first request is already a cache hit.
+    `prepare(script_file, path)` runs on each video before it is cached. Blocks; run it
+    on a thread.
+    """
+    for template in TEMPLATES[:count]:
+        code = template.script()
+        script_file = os.path.join(script_dir, f"template_{template.name}.py")
+        for tier in tiers:
+            key = script_key(code, template.class_name, tier_flags(tier))
+            if render_cache.get(key) is not None:
+                continue
+            with open(script_file, "w") as f:
+                f.write(code)
+            try:
+                result = scheduler.submit_render(
+                    script_file,
+                    template.class_name,
+                    tier_flags(tier),
+                    priority=PRIORITY_BACKGROUND,
+                ).result()
+            except Exception:
+                logger.exception(f"Pre-warming template {template.name} at {tier} failed")
+                continue
+            path = video_path(script_file, template.class_name, tier)
+            if result.returncode != 0 or not os.path.exists(path):
+                logger.warning(
+                    f"Pre-warming template {template.name} at {tier} failed: "
+                    f"{(result.stderr or '')[-500:]}"
+                )
+                continue
+            if prepare is not None:
+                prepare(script_file, path)
+            render_cache.put(key, path)
+            logger.info(f"Pre-warmed template {template.name} at {tier}")
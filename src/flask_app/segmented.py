@@ -0,0 +1,129 @@
+import os
+import shutil
+import logging
+import subprocess
+from concurrent.futures import wait
+
+from quality import tier_flags, video_path
+from render_pool import QueueFull, PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+
+def plan_segments(num_plays, segments, min_plays_per_segment=2):
+    """
+    Split animations 0..num_plays-1 into at most `segments` contiguous,
+    inclusive (start, end) ranges of roughly equal length.
+    """
+    segments = max(1, min(segments, num_plays // min_plays_per_segment))
+    size, extra = divmod(num_plays, segments)
+    ranges = []
+    start = 0
+    for i in range(segments):
+        end = start + size + (1 if i < extra else 0) - 1
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+
+def concat_videos(parts, output_path):
+    """Join mp4s with identical encoding settings without re-encoding"""
+    list_file = f"{output_path}.parts.txt"
+    with open(list_file, "w") as f:
+        for part in parts:
+            f.write(f"file '{os.path.abspath(part)}'\n")
+    try:
+        return subprocess.run(
+            [
+                "ffmpeg",
+                "-y",
+                "-loglevel",
+                "error",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                list_file,
+                "-c",
+                "copy",
+                # moov first, so the joined video starts playing right away
+                "-movflags",
+                "+faststart",
+                output_path,
+            ],
+            capture_output=True,
+            text=True,
+        )
+    finally:
+        os.remove(list_file)
+
+
+def render_segmented(
+    scheduler,
+    script_file,
+    scene_name,
+    tier,
+    num_plays,
+    segments,
+    priority=PRIORITY_INTERACTIVE,
+    media_dir="media",
+    cancel=None,
+):
+    """
+    Render one scene as several animation ranges in parallel render slots
+    (manim's `-n start,end`), each into its own media dir, then stitch the
+    pieces into the usual output path. Every segment still runs construct()
+    from the top; animations outside its range are skipped, not drawn, so
+    the scene state at the boundary is exact. Setting `cancel` kills every
+    segment.
+
+    Returns a CompletedProcess-like result for the whole render.
+    """
+    ranges = plan_segments(num_plays, segments)
+    stem = os.path.splitext(os.path.basename(script_file))[0]
+    segment_root = os.path.join(media_dir, "segments", stem, tier)
+    flags = tier_flags(tier)
+
+    futures = []
+    try:
+        for i, (start, end) in enumerate(ranges):
+            futures.append(
+                scheduler.submit_render(
+                    script_file,
+                    scene_name,
+                    [*flags, "-n", f"{start},{end}"],
+                    priority,
+                    media_dir=os.path.join(segment_root, str(i)),
+                    cancel=cancel,
+                )
+            )
+    except QueueFull:
+        for future in futures:
+            future.cancel()
+        raise
+
+    logger.info(f"Rendering {script_file} as {len(ranges)} segments: {ranges}")
+    try:
+        for i, future in enumerate(futures):
+            result = future.result()
+            if result.returncode != 0:
+                # No point drawing the rest of a scene that already failed
+                for pending in futures[i + 1 :]:
+                    pending.cancel()
+                return result
+
+        parts = [
+            video_path(script_file, scene_name, tier, os.path.join(segment_root, str(i)))
+            for i in range(len(ranges))
+        ]
+        output_path = video_path(script_file, scene_name, tier, media_dir)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        return concat_videos(parts, output_path)
+    finally:
+        wait([future for future in futures if not future.cancelled()])
+        shutil.rmtree(segment_root, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(segment_root))
+        except OSError:
+            pass  # another tier of the same script is still using it
@@ -0,0 +1,215 @@
+import os
+import shutil
+import logging
+import mimetypes
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # only needed for STORAGE_BACKEND=s3
+    boto3 = TransferConfig = None
+
+    class ClientError(Exception):
+        """What a stand-in S3 client raises; botocore's has the same `response`"""
+
+        def __init__(self, response, operation_name=None):
+            super().__init__(response)
+            self.response = response
+
+logger = logging.getLogger(__name__)
+
+# Render cache keys are content hashes, so those objects never change
+IMMUTABLE_PREFIXES = ("cache/",)
+
+
+def cache_control(key):
+    if key.startswith(IMMUTABLE_PREFIXES):
+        return "public, max-age=31536000, immutable"
+    return "public, no-cache"
+
+
+class LocalStorage:
+    """
+    Artifacts in a directory the app serves itself. Keys are paths relative
+    to `root`, URLs are `base_url/key`. Putting a file that already lives at
+    its key is free, which is the common case when `root` is the media dir.
+    """
+
+    def __init__(self, root, base_url):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def path_for(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def put_file(self, local_path, key):
+        dest = self.path_for(key)
+        if os.path.abspath(local_path) == os.path.abspath(dest):
+            return self.url(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest), suffix=".tmp")
+        os.close(fd)
+        try:
+            # copyfile streams in chunks (sendfile on Linux), never the whole mp4
+            shutil.copyfile(local_path, tmp_path)
+            os.replace(tmp_path, dest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return self.url(key)
+
+    def url(self, key):
+        return f"{self.base_url}/{key}"
+
+
+class S3Storage:
+    """
+    Artifacts in an S3-compatible bucket (AWS, GCS interop, MinIO, ...).
+
+    Uploads stream from disk in `part_size` multipart chunks, several parts
+    at a time. URLs are `public_url/key` when the bucket is fronted by a CDN
+    or public endpoint, presigned GETs otherwise. `client` replaces the
+    boto3 S3 client, e.g. with a local stand-in.
+    """
+
+    def __init__(
+        self,
+        bucket,
+        prefix="",
+        endpoint_url=None,
+        public_url=None,
+        part_size=8 * 1024**2,
+        max_concurrency=4,
+        url_expires=7 * 24 * 3600,
+        client=None,
+    ):
+        if boto3 is None and client is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3: pip install boto3")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.url_expires = url_expires
+        self.client = client or boto3.client("s3", endpoint_url=endpoint_url)
+        self.transfer_config = (
+            TransferConfig(
+                multipart_threshold=part_size,
+                multipart_chunksize=part_size,
+                max_concurrency=max_concurrency,
+            )
+            if TransferConfig is not None
+            else None
+        )
+
+    def _object_key(self, key):
+        return self.prefix + key
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put_file(self, local_path, key):
+        self.client.upload_file(
+            local_path,
+            self.bucket,
+            self._object_key(key),
+            ExtraArgs={
+                "ContentType": mimetypes.guess_type(local_path)[0]
+                or "application/octet-stream",
+                "CacheControl": cache_control(key),
+            },
+            Config=self.transfer_config,
+        )
+        return self.url(key)
+
+    def url(self, key):
+        if self.public_url:
+            return f"{self.public_url}/{self._object_key(key)}"
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=self.url_expires,
+        )
+
+
+class Uploader:
+    """
+    Publishes rendered files from the local media dir to a storage backend
+    on its own threads, so an upload overlaps the next render instead of
+    holding a render slot. Keys mirror paths under `media_root`; files in a
+    render cache kept elsewhere (`cache_root`) get "cache/<name>" keys.
+    """
+
+    def __init__(self, storage, media_root, workers=2, cache_root=None):
+        self.storage = storage
+        self.media_root = media_root
+        self.cache_root = cache_root
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="upload"
+        )
+
+    def key_for(self, path):
+        """Storage key for `path`; ValueError for files outside both roots"""
+        full = os.path.abspath(path)
+        for root, prefix in ((self.media_root, ""), (self.cache_root, "cache/")):
+            if root is None:
+                continue
+            root = os.path.abspath(root)
+            if full != root and os.path.commonpath([root, full]) == root:
+                return prefix + os.path.relpath(full, root).replace(os.sep, "/")
+        raise ValueError(
+            f"{path} is neither under {self.media_root} nor the render cache"
+        )
+
+    def url_for(self, path):
+        """The URL `path` has, or will have once published"""
+        return self.storage.url(self.key_for(path))
+
+    def submit(self, path, prepare=None):
+        """
+        Start publishing `path`; returns a Future resolving to its URL.
+        `prepare(path)`, if given, runs first on the upload thread and
+        returns the path to publish (e.g. after remuxing and caching it).
+        """
+        return self._executor.submit(self._publish, path, prepare)
+
+    def publish(self, path):
+        """Publish `path` and block until its URL is known"""
+        return self.submit(path).result()
+
+    def _publish(self, path, prepare=None):
+        if prepare is not None:
+            path = prepare(path)
+        key = self.key_for(path)
+        # Content-addressed objects only need uploading once
+        if key.startswith(IMMUTABLE_PREFIXES) and self.storage.exists(key):
+            return self.storage.url(key)
+        url = self.storage.put_file(path, key)
+        logger.info(f"Published {path} as {key}")
+        return url
+
+
+def storage_from_env(media_root, base_url):
+    """Build the backend named by STORAGE_BACKEND ("local" or "s3")"""
+    backend = os.environ.get("STORAGE_BACKEND", "local")
+    if backend == "local":
+        return LocalStorage(media_root, base_url)
+    if backend == "s3":
+        return S3Storage(
+            os.environ["S3_BUCKET"],
+            prefix=os.environ.get("S3_PREFIX", ""),
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL"),
+            public_url=os.environ.get("S3_PUBLIC_URL"),
+            part_size=int(os.environ.get("S3_PART_SIZE", 8 * 1024**2)),
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}, use local or s3")
@@ -0,0 +1,88 @@
+from admission import DEGRADE, NORMAL, SHED, LoadGovernor
+from code_repair import cap_waits
+
+
+class Scheduler:
+    """Stands in for RenderScheduler with a settable interactive wait estimate"""
+
+    def __init__(self, wait=0.0):
+        self.wait = wait
+
+    def estimated_wait(self, priority):
+        return self.wait
+
+
+def test_long_literal_waits_are_capped():
+    code = (
+        "self.wait(3)\n"
+        "self.wait(duration=2.5)\n"
+        "self.wait(0.5)\n"
+        "self.wait(2, frozen_frame=True)\n"
+    )
+    assert cap_waits(code, 1) == (
+        "self.wait(1)\n"
+        "self.wait(duration=1)\n"
+        "self.wait(0.5)\n"
+        "self.wait(1, frozen_frame=True)\n"
+    )
+
+
+def test_computed_waits_strings_and_comments_are_kept():
+    code = "self.wait(n)\nself.wait(2 * 3)\nText('self.wait(9)')  # self.wait(9)\n"
+    assert cap_waits(code, 1) == code
+
+
+def test_untokenizable_script_is_unchanged():
+    broken = 'self.wait(5)\nx = """never closed\n'
+    assert cap_waits(broken, 1) == broken
+
+
+def test_levels_follow_the_estimated_wait():
+    scheduler = Scheduler()
+    governor = LoadGovernor(scheduler, slo=60, interval=0)
+    assert governor.assess()["level"] == NORMAL
+    scheduler.wait = 30
+    assert governor.assess()["level"] == SHED
+    scheduler.wait = 61
+    load = governor.assess()
+    assert load == {"level": DEGRADE, "estimated_wait": 61, "slo": 60, "actions": []}
+
+
+def test_levels_recover_with_hysteresis():
+    scheduler = Scheduler(61)
+    governor = LoadGovernor(scheduler, slo=60, recover=0.75, interval=0)
+    assert governor.assess()["level"] == DEGRADE
+    # Below the degrade threshold, but not by enough to step down yet
+    scheduler.wait = 50
+    assert governor.assess()["level"] == DEGRADE
+    scheduler.wait = 40
+    assert governor.assess()["level"] == SHED
+    scheduler.wait = 25
+    assert governor.assess()["level"] == SHED
+    scheduler.wait = 20
+    assert governor.assess()["level"] == NORMAL
+
+
+def test_estimate_is_cached_for_the_interval():
+    scheduler = Scheduler(61)
+    governor = LoadGovernor(scheduler, slo=60, interval=3600)
+    assert governor.assess()["level"] == DEGRADE
+    scheduler.wait = 0
+    assert governor.assess()["level"] == DEGRADE
+
+
+def test_no_slo_means_normal():
+    governor = LoadGovernor(Scheduler(1000), slo=0)
+    assert governor.assess()["level"] == NORMAL
+
+
+def test_recorded_actions_show_up_in_the_load_and_stats():
+    governor = LoadGovernor(Scheduler(61), slo=60, interval=0)
+    load = governor.assess()
+    governor.record(load, "draft_tier")
+    governor.record(load, "cap_waits")
+    governor.record(governor.assess(), "draft_tier")
+    assert load["actions"] == ["draft_tier", "cap_waits"]
+    stats = governor.stats()
+    assert stats["degradations"] == {"draft_tier": 2, "cap_waits": 1}
+    assert "actions" not in stats
@@ -0,0 +1,17 @@
+from batches import Batch
+
+
+def test_distinct_math_questions_stay_separate_items():
+    batch = Batch(["What is 2+3?", "What is 2-3?", "What is 2*3?", "what is 2+3"])
+    assert [item["question"] for item in batch.items] == [
+        "What is 2+3?",
+        "What is 2-3?",
+        "What is 2*3?",
+    ]
+    assert [item["inputs"] for item in batch.items] == [[0, 3], [1], [2]]
+    assert batch.duplicates == 1
+
+
+def test_vectors_differing_in_sign_stay_separate_items():
+    batch = Batch(["Norm of [5,-6]", "Norm of [5,6]"])
+    assert len(batch.items) == 2 and batch.duplicates == 0
@@ -0,0 +1,50 @@
+from code_repair import repair_code
+
+SCRIPT = """from manim import *
+
+class MyScene(Scene):
+    def construct(self):
+        v = Matrix([1, 2])
+        m = Matrix([[1, 2], [3, 4]]).T
+        r = m.dot(v)
+        t = Text("a.dot(b) and M.T")  # x.dot(y)
+        self.play(Write(r))
+"""
+
+
+def test_dot_calls_are_stripped_keeping_the_receiver():
+    assert repair_code("r = m.dot(v)\n") == "r = m\n"
+    assert repair_code("r = a.dot(b.dot(c)).T\n") == "r = a\n"
+    fixed = repair_code("r = Matrix(m).dot(f(x, y))\ns = 1\n")
+    assert fixed == "r = Matrix(m)\ns = 1\n"
+
+
+def test_strings_and_comments_are_left_alone():
+    fixed = repair_code(SCRIPT)
+    assert 't = Text("a.dot(b) and M.T")  # x.dot(y)' in fixed
+    assert "r = m\n" in fixed
+    assert "Matrix([[1, 2], [3, 4]])\n" in fixed
+    assert "Matrix([[1], [2]])" in fixed
+
+
+def test_scene_class_is_renamed_to_the_requested_name():
+    fixed = repair_code(SCRIPT, "Scene_42")
+    assert "class Scene_42(Scene):" in fixed and "MyScene" not in fixed
+
+
+def test_existing_scene_name_is_kept():
+    script = SCRIPT.replace("MyScene", "Scene_42")
+    helper = "class Helper(Scene):\n    pass\n\n"
+    fixed = repair_code(helper + script, "Scene_42")
+    assert "class Helper(Scene):" in fixed and "class Scene_42(Scene):" in fixed
+
+
+def test_only_the_class_name_is_renamed():
+    script = SCRIPT.replace('"a.dot(b) and M.T"', '"MyScene"')
+    fixed = repair_code(script, "Scene_42")
+    assert 'Text("MyScene")' in fixed and "class Scene_42(Scene):" in fixed
+
+
+def test_untokenizable_scripts_are_returned_unchanged():
+    broken = 'class A(Scene):\n    x = """never closed\n'
+    assert repair_code(broken, "B") == broken
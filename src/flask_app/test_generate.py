@@ -54,12 +54,26 @@ The script must run with manim -pql script.py {SCENE_NAME} without errors
 
         # Print response
         print(f"Status code: {response.status_code}")
-        if response.status_code == 200:
-            result = response.json()
-            print(json.dumps(result, indent=2))
-            print(f"\nVideo URL: {result.get('static_video_url')}")
-        else:
+        if response.status_code != 202:
             print(f"Error: {response.text}")
+            return
+
+        job = response.json()
+        print(json.dumps(job, indent=2))
+
+        # Poll the job until the render finishes
+        status_url = f"http://127.0.0.1:5000{job['status_url']}"
+        deadline = time.time() + 300
+        while time.time() < deadline:
+            result = requests.get(status_url, timeout=10).json()
+            print(f"Stage: {result['stage']}")
+            if result["status"] in ("done", "error"):
+                print(json.dumps(result, indent=2))
+                if result["status"] == "done":
+                    print(f"\nVideo URL: {result['result'].get('video_url')}")
+                return
+            time.sleep(2)
+        print("Job did not finish in time.")
 
     except requests.exceptions.Timeout:
         print("Request timed out. The server might be taking too long to respond.")
@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+from janitor import Janitor
+
+
+def render(media, stem, size, cache_dir=None):
+    """A finished render under media/videos/<stem>, optionally linked into a cache"""
+    tier = media / "videos" / stem / "480p15"
+    tier.mkdir(parents=True)
+    mp4 = tier / f"{stem}.mp4"
+    mp4.write_bytes(b"x" * size)
+    if cache_dir is not None:
+        cache_dir.mkdir(exist_ok=True)
+        os.link(mp4, cache_dir / f"key-{stem}.mp4")
+    return mp4
+
+
+@pytest.fixture
+def make_janitor(tmp_path):
+    janitors = []
+
+    def make(**quotas):
+        janitor = Janitor(
+            str(tmp_path / "index.sqlite3"),
+            media_dir=str(tmp_path / "media"),
+            script_dir=str(tmp_path / "scripts"),
+            quotas=quotas,
+            interval=3600,
+            min_age=0,
+        )
+        janitors.append(janitor)
+        return janitor
+
+    yield make
+    for janitor in janitors:
+        janitor.close()
+
+
+def test_hard_links_count_once(tmp_path, make_janitor):
+    media = tmp_path / "media"
+    mp4 = render(media, "a", 1000)
+    os.link(mp4, mp4.parent / "copy.mp4")
+    janitor = make_janitor(videos=(None, None))
+    janitor.track_render(str(mp4))
+    assert janitor.index.totals("videos") == (1, 1000)
+
+
+def test_serving_the_cache_entry_keeps_its_render(tmp_path, make_janitor):
+    media, cache = tmp_path / "media", tmp_path / "media" / "cache"
+    janitor = make_janitor(videos=(None, 1))
+    old = render(media, "old", 10, cache)
+    janitor.track_render(str(old))
+    time.sleep(0.01)
+    new = render(media, "new", 10)
+    janitor.track_render(str(new))
+    # Only the cache URL of the older render is ever served
+    time.sleep(0.01)
+    janitor.touch(str(cache / "key-old.mp4"))
+    janitor.run_once()
+    assert old.exists() and not new.exists()
+
+
+def test_adopt_counts_existing_links_once(tmp_path, make_janitor):
+    media = tmp_path / "media"
+    render(media, "a", 100, media / "cache")
+    mp4 = render(media, "b", 100)
+    os.link(mp4, mp4.parent / "b-copy.mp4")
+    janitor = make_janitor(videos=(None, None))
+    assert janitor.index.totals("videos") == (2, 200)
@@ -0,0 +1,126 @@
+import time
+import threading
+
+from jobs import Job, JobManager, SingleFlight, sse_events
+from llm_cache import request_key
+
+
+def blocked_job(release):
+    def run(job):
+        release.wait(5)
+        return {"ok": True}
+
+    return run
+
+
+def test_concurrent_questions_coalesce_only_when_equal():
+    jobs = JobManager(max_workers=4)
+    release = threading.Event()
+    try:
+        first, coalesced = jobs.submit_once(
+            request_key("What is 2+3?", None, "low"), blocked_job(release)
+        )
+        assert not coalesced
+        same, coalesced = jobs.submit_once(
+            request_key("what is 2+3", None, "low"), blocked_job(release)
+        )
+        assert coalesced and same is first
+
+        others = [
+            jobs.submit_once(request_key(question, None, "low"), blocked_job(release))
+            for question in ("What is 2-3?", "What is 2*3?")
+        ]
+        assert all(not coalesced for _, coalesced in others)
+        assert len({first.id, *(job.id for job, _ in others)}) == 3
+
+        other_quality, coalesced = jobs.submit_once(
+            request_key("What is 2+3?", None, "high"), blocked_job(release)
+        )
+        assert not coalesced and other_quality is not first
+    finally:
+        release.set()
+
+
+def test_single_flight_keeps_different_math_apart():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    results = {}
+
+    def slow(answer, gate):
+        started.set()
+        gate.wait(5)
+        return answer
+
+    def ask(question, answer, gate):
+        key = request_key(question, None, "low", "none")
+        results[question] = flight.do(key, slow, answer, gate)
+
+    leader = threading.Thread(target=ask, args=("What is 2+3?", 5, release))
+    leader.start()
+    started.wait(5)
+    # Asked while "2+3" is still in flight, yet answered on its own
+    answered = threading.Event()
+    answered.set()
+    ask("What is 2-3?", -1, answered)
+    release.set()
+    leader.join(5)
+    assert results == {"What is 2+3?": (5, False), "What is 2-3?": (-1, False)}
+
+
+def open_stream(job, last_id=-1):
+    stream = sse_events(job, last_id, heartbeat=0.01)
+    frame = next(stream)
+    return stream, frame
+
+
+def tracked_job(**graces):
+    jobs = JobManager(**graces)
+    job = Job()
+    jobs.track(job)
+    return jobs, job
+
+
+def test_dropped_stream_that_reconnects_keeps_its_job():
+    jobs, job = tracked_job(disconnect_grace=15, idle_grace=120)
+    stream, _ = open_stream(job)
+    stream.close()
+    assert job.dropped_at is not None
+
+    # EventSource comes back a few seconds later and resumes after what it saw
+    job.emit("render")
+    stream, frame = open_stream(job, last_id=0)
+    assert "event: render" in frame
+    jobs.reap(now=time.time() + 60)
+    assert not job.cancelled.is_set()
+    stream.close()
+
+
+def test_dropped_stream_is_released_after_the_grace():
+    jobs, job = tracked_job(disconnect_grace=15, idle_grace=120)
+    stream, _ = open_stream(job)
+    stream.close()
+
+    jobs.reap(now=time.time() + 5)
+    assert not job.cancelled.is_set()
+    jobs.reap(now=time.time() + 20)
+    assert job.cancelled.is_set() and job.status == "error"
+
+
+def test_polling_client_keeps_a_long_job():
+    jobs, job = tracked_job(disconnect_grace=15, idle_grace=120)
+    start = time.time()
+    for poll in range(1, 10):
+        job.last_seen = start + poll * 30
+        jobs.reap(now=start + poll * 30 + 29)
+    assert not job.cancelled.is_set()
+
+    jobs.reap(now=job.last_seen + 121)
+    assert job.cancelled.is_set()
+
+
+def test_extra_releases_never_leave_negative_requesters():
+    job = Job()
+    assert job.release() is True
+    job.release()
+    assert job.requesters == 0
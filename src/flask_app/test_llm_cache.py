@@ -0,0 +1,41 @@
+import pytest
+
+from llm_cache import cache_key, normalize_question
+
+PROMPT = "Explain {QUESTION} with a Manim scene"
+
+
+def key(question):
+    return cache_key("gpt", 0.2, PROMPT.format(QUESTION=question), question)
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ("What is 2+3?", "What is 2-3?"),
+        ("What is 2+3?", "What is 2*3"),
+        ("What is 2-3?", "What is 2*3"),
+        ("Add the vectors [5,-6] and [1,1]", "Add the vectors [5,6] and [1,1]"),
+    ],
+)
+def test_different_math_keeps_different_keys(first, second):
+    assert normalize_question(first) != normalize_question(second)
+    assert key(first) != key(second)
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ("How do I multiply a matrix?", "how do i multiply a matrix"),
+        ("What is 2+3?", "  what IS 2+3 "),
+        ("Hi, what is 2.5 / 5?!", "hi what is 2.5 / 5"),
+    ],
+)
+def test_trivial_rephrasings_share_a_key(first, second):
+    assert normalize_question(first) == normalize_question(second)
+    assert key(first) == key(second)
+
+
+def test_punctuation_between_digits_is_kept():
+    assert normalize_question("2.5") != normalize_question("2,5")
+    assert normalize_question("Ratio 2:3.") == "ratio 2:3"
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+
+from llm_stream import CodeFenceExtractor, stream_completion
+
+COMPLETION = (
+    "Here is the scene:\n```python\nfrom manim import *\n\n"
+    "class A(Scene):\n    def construct(self):\n        self.wait(1)\n```\n"
+    "This shows the idea. ```python\nignored()\n```"
+)
+CODE = (
+    "\nfrom manim import *\n\n"
+    "class A(Scene):\n    def construct(self):\n        self.wait(1)\n"
+)
+
+
+def chunks(text, size):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 8, 64, len(COMPLETION)])
+def test_split_fences_yield_exactly_the_code(size):
+    extractor = CodeFenceExtractor()
+    pieces = [extractor.feed(chunk) for chunk in chunks(COMPLETION, size)]
+    assert "".join(pieces) == CODE
+    assert extractor.closed and extractor.code == CODE
+
+
+def test_partial_closing_fence_is_held_back():
+    extractor = CodeFenceExtractor()
+    assert extractor.feed("``") == ""
+    assert extractor.feed("`pyth") == ""
+    assert extractor.feed("on\nx = 1\n`") == "\nx = 1"
+    # Backticks that may open the closing fence are never shown
+    assert extractor.feed("`") == "\n"
+    assert not extractor.closed
+    assert extractor.feed("`") == ""
+    assert extractor.closed and extractor.code == "\nx = 1\n"
+    assert extractor.feed("more prose") == ""
+
+
+def test_backticks_inside_code_are_not_a_close():
+    extractor = CodeFenceExtractor()
+    out = extractor.feed("```python\ns = '`'\n")
+    out += extractor.feed("t = 1\n``")
+    assert not extractor.closed
+    out += extractor.feed("`")
+    assert out == "\ns = '`'\nt = 1\n" and extractor.closed
+
+
+class FakeStream:
+    """An OpenAI chat completion stream delivering `text` in fixed chunks"""
+
+    def __init__(self, text, size):
+        self.events = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=c))])
+            for c in chunks(text, size)
+        ]
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        for event in self.events:
+            self.read += 1
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_stops_once_the_fence_closes():
+    stream = FakeStream(COMPLETION, 4)
+    completions = SimpleNamespace(create=lambda **kwargs: stream)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    received = []
+    text = stream_completion(client, "gpt-4", "prompt", 0.3, on_code=received.append)
+    assert "".join(received) == CODE
+    assert text.count("```") == 2 and "ignored" not in text
+    assert stream.closed and stream.read < len(stream.events)
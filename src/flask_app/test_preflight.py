@@ -0,0 +1,51 @@
+import pytest
+
+from preflight import PreflightError, check_script
+
+SCENE = """
+from manim import *
+
+class Demo(Scene):
+{body}
+"""
+
+
+def script(body):
+    return SCENE.format(body=body)
+
+
+def test_super_init_passes():
+    check_script(
+        script(
+            "    def __init__(self, **kwargs):\n"
+            "        super().__init__(**kwargs)\n"
+            "    def construct(self):\n"
+            "        self.wait(1)\n"
+        ),
+        "Demo",
+    )
+
+
+@pytest.mark.parametrize(
+    "expr",
+    [
+        "().__class__.__bases__[0].__subclasses__()",
+        "self.construct.__globals__",
+        "print.__self__",
+        "(lambda: 0).__code__",
+        "Scene.__dict__",
+    ],
+)
+def test_escape_dunders_are_rejected(expr):
+    with pytest.raises(PreflightError) as e:
+        check_script(script(f"    def construct(self):\n        x = {expr}\n"), "Demo")
+    assert any("access to" in problem for problem in e.value.problems)
+
+
+def test_banned_calls_and_names_still_reported():
+    with pytest.raises(PreflightError) as e:
+        check_script(
+            script("    def construct(self):\n        open('x')\n        np.zeros(3)"),
+            "Demo",
+        )
+    assert e.value.problems == ["Line 6: call to open()", "Line 7: use of np"]
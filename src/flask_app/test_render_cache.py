@@ -0,0 +1,72 @@
+import os
+
+from render_cache import RenderCache, normalize_script, script_key
+
+SCRIPT = '''from manim import *
+
+class Scene_1(Scene):
+    def construct(self):
+        title = Text("Step  1:   add")
+        self.play(Write(title))
+'''
+
+
+def normalized(code):
+    return normalize_script(code, "Scene_1")
+
+
+def test_comments_blank_lines_and_indent_width_are_ignored():
+    reformatted = '''from manim import *
+# generated
+
+
+class Scene_1(Scene):
+  def construct(self):  # entry point
+    title = Text("Step  1:   add")
+
+    self.play(Write(title))
+'''
+    assert normalized(reformatted) == normalized(SCRIPT)
+
+
+def test_string_literal_layout_is_kept():
+    squeezed = SCRIPT.replace('"Step  1:   add"', '"Step 1: add"')
+    assert normalized(squeezed) != normalized(SCRIPT)
+    multiline = SCRIPT.replace('"Step  1:   add"', '"""Step 1\n    add"""')
+    dedented = SCRIPT.replace('"Step  1:   add"', '"""Step 1\nadd"""')
+    assert normalized(multiline) != normalized(dedented)
+
+
+def test_scene_name_is_replaced_outside_strings_only():
+    renamed = SCRIPT.replace("Scene_1", "Scene_2")
+    assert script_key(renamed, "Scene_2", ["-ql"]) == script_key(
+        SCRIPT, "Scene_1", ["-ql"]
+    )
+    in_text = SCRIPT.replace('"Step  1:   add"', '"Scene_1"')
+    other = SCRIPT.replace('"Step  1:   add"', '"Scene_2"')
+    assert normalized(in_text) != normalized(other)
+
+
+def test_quality_flags_are_part_of_the_key():
+    low, high = (script_key(SCRIPT, "Scene_1", [flag]) for flag in ("-ql", "-qh"))
+    assert low != high
+
+
+def test_untokenizable_scripts_hash_as_written():
+    broken = 'class A(Scene):\n    x = """never closed\n'
+    assert normalize_script(broken, "A") == broken
+
+
+def test_put_get_and_evict_oldest(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), max_bytes=10)
+    first, second = tmp_path / "a.mp4", tmp_path / "b.mp4"
+    first.write_bytes(b"x" * 6)
+    second.write_bytes(b"y" * 6)
+    assert cache.get("a") is None
+    path = cache.put("a", str(first))
+    assert cache.get("a") == path
+    os.utime(path, (1, 1))
+    cache.put("b", str(second))
+    assert cache.get("a") is None
+    with open(cache.get("b"), "rb") as f:
+        assert f.read() == b"y" * 6
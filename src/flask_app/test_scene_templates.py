@@ -0,0 +1,72 @@
+import ast
+
+import pytest
+
+from scene_templates import TEMPLATES, match_template
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "determinant of a 5x5 matrix",
+        "Why is the dot product of perpendicular vectors zero?",
+        "What does the determinant mean geometrically?",
+        "Is the hypotenuse always the longest side?",
+        "How do you multiply two matrices?",
+        "Pythagorean theorem with 6 and 8",
+        "Find the determinant of [[1,2,3],[4,5,6],[7,8,9]]",
+    ],
+)
+def test_conceptual_and_unparsed_questions_go_to_the_llm(question):
+    assert match_template(question) is None
+
+
+@pytest.mark.parametrize(
+    "question, name, params",
+    [
+        ("How do you multiply a matrix by a vector?", "matrix_vector", {}),
+        ("What is the Pythagorean theorem?", "pythagorean", {}),
+        ("How do you calculate the dot product of two vectors?", "dot_product", {}),
+        ("What is the determinant of a 2x2 matrix?", "determinant", {}),
+        (
+            "Multiply the matrix [[1,2],[3,4]] by the vector [5,6]",
+            "matrix_vector",
+            {"matrix": [[1, 2], [3, 4]], "vector": [5, 6]},
+        ),
+        ("Find the determinant of [[1,2],[3,4]]", "determinant", {"matrix": [[1, 2], [3, 4]]}),
+        (
+            "Find the hypotenuse of a right triangle with legs 3 and 4",
+            "pythagorean",
+            {"a": 3, "b": 4, "c": None},
+        ),
+    ],
+)
+def test_computations_and_canonical_phrasings_match(question, name, params):
+    template, matched = match_template(question)
+    assert template.name == name
+    assert matched == params
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "one leg is 5 and the hypotenuse is 13",
+        "13 is the hypotenuse and one side is 5",
+        "The hypotenuse is 13 and a leg is 5, find the other leg",
+    ],
+)
+def test_hypotenuse_is_not_taken_for_a_leg(question):
+    template, params = match_template(question)
+    assert params == {"a": 5, "b": None, "c": 13}
+    script = template.script(params)
+    assert "b = \\\\sqrt{144} = 12" in script
+    ast.parse(script)
+
+
+def test_leg_longer_than_hypotenuse_goes_to_the_llm():
+    assert match_template("one leg is 13 and the hypotenuse is 5") is None
+
+
+def test_default_scripts_parse():
+    for template in TEMPLATES:
+        ast.parse(template.script())
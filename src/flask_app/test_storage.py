@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+import storage
+from storage import LocalStorage, S3Storage, Uploader
+
+
+class StubS3:
+    """In-memory stand-in for the few boto3 S3 client calls S3Storage makes"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise storage.ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {}
+
+    def upload_file(self, local_path, bucket, key, ExtraArgs=None, Config=None):
+        with open(local_path, "rb") as f:
+            self.objects[(bucket, key)] = (f.read(), ExtraArgs)
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://signed/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+def write(path, data=b"video"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_local_put_copies_and_serves(tmp_path):
+    backend = LocalStorage(str(tmp_path / "media"), "/media/")
+    src = write(str(tmp_path / "elsewhere" / "a.mp4"))
+    assert not backend.exists("videos/a.mp4")
+    assert backend.put_file(src, "videos/a.mp4") == "/media/videos/a.mp4"
+    assert backend.exists("videos/a.mp4")
+    with open(backend.path_for("videos/a.mp4"), "rb") as f:
+        assert f.read() == b"video"
+    assert os.listdir(tmp_path / "media" / "videos") == ["a.mp4"]
+
+
+def test_local_put_in_place_is_free(tmp_path):
+    backend = LocalStorage(str(tmp_path), "media")
+    src = write(str(tmp_path / "videos" / "a.mp4"))
+    assert backend.put_file(src, "videos/a.mp4") == "media/videos/a.mp4"
+    assert os.listdir(tmp_path / "videos") == ["a.mp4"]
+
+
+def test_s3_put_exists_and_urls(tmp_path):
+    client = StubS3()
+    backend = S3Storage("bucket", prefix="/renders/", client=client)
+    src = write(str(tmp_path / "a.mp4"))
+    assert not backend.exists("cache/a.mp4")
+    url = backend.put_file(src, "cache/a.mp4")
+    assert url == "https://signed/bucket/renders/cache/a.mp4?expires=604800"
+    assert backend.exists("cache/a.mp4")
+    data, extra = client.objects[("bucket", "renders/cache/a.mp4")]
+    assert data == b"video"
+    assert extra["ContentType"] == "video/mp4"
+    assert "immutable" in extra["CacheControl"]
+
+    backend.put_file(src, "videos/a.mp4")
+    _, extra = client.objects[("bucket", "renders/videos/a.mp4")]
+    assert extra["CacheControl"] == "public, no-cache"
+
+
+def test_s3_public_url(tmp_path):
+    backend = S3Storage(
+        "bucket", prefix="renders", public_url="https://cdn.example/", client=StubS3()
+    )
+    assert backend.url("cache/a.mp4") == "https://cdn.example/renders/cache/a.mp4"
+
+
+def test_s3_other_errors_propagate():
+    class Denied(StubS3):
+        def head_object(self, Bucket, Key):
+            raise storage.ClientError({"Error": {"Code": "403"}}, "HeadObject")
+
+    with pytest.raises(storage.ClientError):
+        S3Storage("bucket", client=Denied()).exists("cache/a.mp4")
+
+
+def test_s3_against_moto(tmp_path):
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="bucket")
+        backend = S3Storage("bucket", prefix="renders", client=client)
+        src = write(str(tmp_path / "a.mp4"))
+        assert not backend.exists("cache/a.mp4")
+        backend.put_file(src, "cache/a.mp4")
+        assert backend.exists("cache/a.mp4")
+        head = client.head_object(Bucket="bucket", Key="renders/cache/a.mp4")
+        assert head["ContentType"] == "video/mp4"
+        assert "renders/cache/a.mp4" in backend.url("cache/a.mp4")
+
+
+def test_keys_for_media_and_outside_render_cache(tmp_path):
+    media = tmp_path / "media"
+    uploader = Uploader(
+        LocalStorage(str(media), "media"),
+        str(media),
+        workers=1,
+        cache_root=str(tmp_path / "render-cache"),
+    )
+    assert uploader.key_for(str(media / "videos" / "a.mp4")) == "videos/a.mp4"
+    assert uploader.key_for(str(tmp_path / "render-cache" / "k.mp4")) == "cache/k.mp4"
+    # A sibling whose name merely starts with the media dir's is not inside it
+    with pytest.raises(ValueError):
+        uploader.key_for(str(tmp_path / "media-old" / "a.mp4"))
+    with pytest.raises(ValueError):
+        uploader.key_for(str(tmp_path / "a.mp4"))
+
+
+def test_outside_cache_publishes_under_media(tmp_path):
+    media = tmp_path / "media"
+    uploader = Uploader(
+        LocalStorage(str(media), "media"),
+        str(media),
+        workers=1,
+        cache_root=str(tmp_path / "render-cache"),
+    )
+    src = write(str(tmp_path / "render-cache" / "k.mp4"))
+    assert uploader.publish(src) == "media/cache/k.mp4"
+    assert os.path.exists(media / "cache" / "k.mp4")
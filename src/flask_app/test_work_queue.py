@@ -0,0 +1,100 @@
+import time
+
+import pytest
+from flask import Flask
+
+from work_queue import HTTPQueue, SQLiteQueue, local_transport, queue_api
+
+TOKEN = "t"
+
+
+@pytest.fixture(params=["sqlite", "http"])
+def queue(request, tmp_path):
+    """The same SQLite queue, used directly or through queue_api with a token"""
+    backing = SQLiteQueue(
+        str(tmp_path / "queue.sqlite3"), max_attempts=2, poll_interval=0.01
+    )
+    if request.param == "sqlite":
+        return backing
+    app = Flask(__name__)
+    app.register_blueprint(queue_api(backing, token=TOKEN), url_prefix="/queue")
+    return HTTPQueue(
+        "http://queue", token=TOKEN, transport=local_transport(app, "/queue")
+    )
+
+
+def test_expired_lease_is_redelivered(queue):
+    message_id = queue.put("renders", {"n": 1})
+    first = queue.get("renders", visibility_timeout=0.2)
+    assert first.id == message_id and first.attempts == 1
+    assert queue.get("renders") is None
+
+    time.sleep(0.3)
+    second = queue.get("renders", visibility_timeout=30)
+    assert second.id == message_id
+    assert second.attempts == 2
+    assert second.body == {"n": 1}
+
+
+def test_ack_with_lost_lease_returns_false(queue):
+    message_id = queue.put("renders", {"n": 1})
+    first = queue.get("renders", visibility_timeout=0.2)
+    time.sleep(0.3)
+    second = queue.get("renders", visibility_timeout=30)
+
+    assert queue.ack(first) is False
+    assert queue.extend(first) is False
+    assert queue.peek(message_id)["state"] == "leased"
+    assert queue.ack(second) is True
+    assert queue.peek(message_id) is None
+
+
+def test_failing_message_is_dead_lettered(queue):
+    message_id = queue.put("renders", {"n": 1})
+    for _ in range(2):
+        message = queue.get("renders", visibility_timeout=30)
+        assert queue.nack(message, error="boom") is True
+
+    assert queue.get("renders") is None
+    assert queue.peek(message_id)["state"] == "dead"
+    dead = queue.dead_letters("renders")
+    assert [(d["id"], d["last_error"]) for d in dead] == [(message_id, "boom")]
+    assert queue.stats("renders")["dead"] == 1
+
+    assert queue.requeue(message_id) is True
+    assert queue.get("renders").id == message_id
+
+
+def test_expired_last_attempt_is_dead_lettered(queue):
+    message_id = queue.put("renders", {"n": 1})
+    for _ in range(2):
+        assert queue.get("renders", visibility_timeout=0.1) is not None
+        time.sleep(0.2)
+
+    assert queue.get("renders") is None
+    assert queue.peek(message_id)["last_error"] == "lease expired"
+
+
+def test_http_queue_needs_the_token(tmp_path):
+    app = Flask(__name__)
+    backing = SQLiteQueue(str(tmp_path / "queue.sqlite3"))
+    app.register_blueprint(queue_api(backing, token=TOKEN), url_prefix="/queue")
+    anonymous = HTTPQueue("http://queue", transport=local_transport(app, "/queue"))
+    with pytest.raises(RuntimeError, match="401"):
+        anonymous.put("renders", {"n": 1})
+
+
+def test_cancel_withdraws_ready_and_leased_messages(queue):
+    waiting = queue.put("renders", {"n": 1})
+    running = queue.put("renders", {"n": 2})
+    assert queue.cancel(waiting) is True
+    assert queue.peek(waiting) is None
+
+    message = queue.get("renders", visibility_timeout=30)
+    assert message.id == running
+    assert queue.cancel(running) is True
+    assert queue.peek(running)["state"] == "cancelled"
+    assert queue.extend(message) is False
+    assert queue.ack(message) is False
+    assert queue.get("renders") is None
+    assert queue.cancel(running) is False
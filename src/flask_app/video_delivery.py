@@ -0,0 +1,160 @@
+import os
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+
+from flask import Response, abort, request, send_file
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed URLs never change meaning, so browsers may keep them forever
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Everything else is cached but checked against the ETag before reuse
+REVALIDATE = "public, no-cache"
+
+_etags = OrderedDict()
+_etags_lock = threading.Lock()
+_ETAG_CACHE_SIZE = 4096
+
+
+def content_etag(path):
+    """
+    Strong ETag from a sha256 of the file's bytes. Hashes are remembered per
+    (path, inode, size, mtime), so a video is read once, not once per request.
+    """
+    st = os.stat(path)
+    stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+    with _etags_lock:
+        cached = _etags.get(path)
+        if cached is not None and cached[0] == stamp:
+            _etags.move_to_end(path)
+            return cached[1]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    etag = h.hexdigest()[:32]
+
+    with _etags_lock:
+        _etags[path] = (stamp, etag)
+        _etags.move_to_end(path)
+        while len(_etags) > _ETAG_CACHE_SIZE:
+            _etags.popitem(last=False)
+    return etag
+
+
+def send_video(directory, filename, immutable=False):
+    """
+    Serve a file with byte-range support, a strong ETag and cache headers.
+
+    Flask answers If-None-Match / If-Range / Range itself and hands whole
+    files to the server's wsgi.file_wrapper (sendfile under gunicorn). With
+    X_ACCEL_REDIRECT_PREFIX set, nginx is told to send the file instead, so
+    range requests are zero-copy too.
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    # Renders are written relative to the working directory, not the app root
+    path = os.path.abspath(path)
+
+    etag = content_etag(path)
+    prefix = os.environ.get("X_ACCEL_REDIRECT_PREFIX")
+    if prefix:
+        response = Response(mimetype="video/mp4" if path.endswith(".mp4") else None)
+        response.headers["X-Accel-Redirect"] = (
+            prefix.rstrip("/")
+            + "/"
+            + os.path.relpath(path, os.path.abspath(directory)).replace(os.sep, "/")
+        )
+        response.set_etag(etag)
+        response = response.make_conditional(request)
+    else:
+        response = send_file(path, conditional=True, etag=etag)
+    response.headers["Cache-Control"] = IMMUTABLE if immutable else REVALIDATE
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+
+def _top_level_atoms(path):
+    """Yield the type of each top-level mp4 box, in file order"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        pos = 0
+        while pos + 8 <= size:
+            f.seek(pos)
+            box_size, box_type = struct.unpack(">I4s", f.read(8))
+            if box_size == 1:
+                # 64-bit size follows the type
+                box_size = struct.unpack(">Q", f.read(8))[0]
+            elif box_size == 0:
+                box_size = size - pos  # box runs to the end of the file
+            if box_size < 8:
+                return  # corrupt; let ffmpeg sort it out
+            yield box_type
+            pos += box_size
+
+
+def is_faststart(path):
+    """True if the moov atom comes before the media data"""
+    for box_type in _top_level_atoms(path):
+        if box_type == b"moov":
+            return True
+        if box_type == b"mdat":
+            return False
+    return False
+
+
+def faststart(path):
+    """
+    Move the moov atom to the front of an mp4 so playback can start before
+    the whole file has downloaded. Remuxes with `-c copy` (no re-encode) and
+    swaps the result in atomically. Returns True if the file was rewritten.
+    """
+    try:
+        if is_faststart(path):
+            return False
+    except OSError:
+        return False
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", suffix=".faststart.tmp"
+    )
+    os.close(fd)
+    try:
+        result = subprocess.run(
+            [
+                "ffmpeg",
+                "-y",
+                "-loglevel",
+                "error",
+                "-i",
+                path,
+                "-c",
+                "copy",
+                "-movflags",
+                "+faststart",
+                "-f",
+                "mp4",
+                tmp_path,
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            logger.warning(f"faststart remux of {path} failed: {result.stderr.strip()}")
+            return False
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        logger.warning(f"faststart remux of {path} failed: {e}")
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
@@ -0,0 +1,422 @@
+import os
+import re
+import sys
+import json
+import time
+import queue
+import select
+import logging
+import threading
+import traceback
+import subprocess
+import importlib.util
+
+from limits import (
+    KILLED,
+    RenderLimits,
+    RenderLimitExceeded,
+    cpu_budget,
+    frame_caps,
+    install_frame_hook,
+    kill_tree,
+    run_limited,
+)
+
+logger = logging.getLogger(__name__)
+
+# manim CLI quality letters -> config.quality names
+QUALITY_NAMES = {
+    "l": "low_quality",
+    "m": "medium_quality",
+    "h": "high_quality",
+    "p": "production_quality",
+    "k": "fourk_quality",
+}
+
+
+def quality_from_flags(flags):
+    """Pick the quality out of CLI-style flags such as ["-pql"] or ["-qh"]"""
+    for flag in flags:
+        match = re.match(r"^-[a-z]*q([lmhpk])", flag)
+        if match:
+            return QUALITY_NAMES[match.group(1)]
+    return "low_quality"
+
+
+def overrides_from_flags(flags):
+    """config overrides for the CLI's `-r W,H` and `--fps N` flags"""
+    overrides = {}
+    for flag, value in zip(flags, flags[1:]):
+        if flag in ("-r", "--resolution"):
+            width, _, height = value.partition(",")
+            overrides["pixel_width"], overrides["pixel_height"] = int(width), int(height)
+        elif flag in ("--fps", "--frame_rate"):
+            overrides["frame_rate"] = float(value)
+    return overrides
+
+
+def animation_range_from_flags(flags):
+    """Parse the CLI's `-n start,end` animation selection, or None"""
+    for flag, value in zip(flags, flags[1:]):
+        if flag in ("-n", "--from_animation_number"):
+            start, _, end = value.partition(",")
+            return int(start), int(end) if end else None
+    return None
+
+
+class _Worker:
+    """One long-lived render process speaking JSON lines over stdin/stdout"""
+
+    def __init__(self, env=None, limits=None):
+        self.jobs = 0
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            env=env,
+            # Own process group, so a kill takes ffmpeg and latex children with it
+            start_new_session=True,
+        )
+        if limits is not None:
+            # Before manim is imported: the worker's first act is that import
+            limits.apply_memory_limit(self.proc.pid)
+        self._ready = False
+
+    @property
+    def alive(self):
+        return self.proc.poll() is None
+
+    def _read(self):
+        line = self.proc.stdout.readline()
+        if not line:
+            raise EOFError("render worker exited")
+        return json.loads(line)
+
+    def run(self, job, timeout=None, cancel=None):
+        """
+        Send `job` and return the worker's reply. The worker is killed (and
+        RenderLimitExceeded raised) if the reply takes longer than `timeout`
+        or `cancel` is set first.
+        """
+        if not self._ready:
+            # First line is the worker announcing manim has been imported
+            self._read()
+            self._ready = True
+        self.proc.stdin.write(json.dumps(job) + "\n")
+        self.proc.stdin.flush()
+        self.jobs += 1
+        reason = self._wait_for_reply(timeout, cancel)
+        if reason:
+            kill_tree(self.proc)
+            self.proc.wait()
+            raise RenderLimitExceeded(reason)
+        return self._read()
+
+    def _wait_for_reply(self, timeout, cancel, poll_interval=0.5):
+        """None once a reply is readable, else why we gave up on it"""
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            readable, _, _ = select.select([self.proc.stdout], [], [], poll_interval)
+            if readable:
+                return None
+            if cancel is not None and cancel.is_set():
+                return "Render cancelled"
+            if deadline is not None and time.monotonic() > deadline:
+                return f"Render exceeded the {timeout:g}s time limit"
+
+    def stop(self):
+        if self.alive:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except Exception:
+                self.proc.kill()
+
+
+class WarmRenderPool:
+    """
+    Pre-started render processes that import manim once and then render
+    scenes through its Python API, skipping interpreter startup, the manim
+    import and config parsing on every job. Each worker is replaced after
+    `max_jobs_per_worker` renders to contain leaks.
+
+    With a `glyph_cache`, every worker compiles TeX and Text into the same
+    shared directories and reports hit/miss counts back with each job.
+
+    `limits` (a RenderLimits) caps every job: workers run under its memory
+    rlimit, count CPU time and frames per job, and are killed and replaced
+    when a job outlives its wall-clock budget or is cancelled.
+    """
+
+    # Trim the glyph cache after this many renders
+    EVICT_EVERY = 25
+
+    def __init__(self, size, max_jobs_per_worker=50, glyph_cache=None, limits=None):
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.glyph_cache = glyph_cache
+        self.limits = limits or RenderLimits()
+        self._env = dict(os.environ)
+        if glyph_cache is not None:
+            self._env["GLYPH_CACHE_DIR"] = glyph_cache.root
+        self._stats_lock = threading.Lock()
+        self._glyph_stats = {}
+        self._renders = 0
+        self._killed = 0
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(_Worker(self._env, self.limits))
+
+    def _replace(self, worker):
+        worker.stop()
+        self._idle.put(_Worker(self._env, self.limits))
+
+    def _record(self, result):
+        with self._stats_lock:
+            self._renders += 1
+            for kind, delta in result.get("glyph_stats", {}).items():
+                totals = self._glyph_stats.setdefault(
+                    kind, {"hits": 0, "misses": 0, "miss_seconds": 0.0}
+                )
+                for name, value in delta.items():
+                    totals[name] += value
+            evict = self.glyph_cache is not None and self._renders % self.EVICT_EVERY == 0
+        if evict:
+            threading.Thread(target=self.glyph_cache.evict, daemon=True).start()
+
+    def stats(self):
+        """Glyph cache counters summed over all workers"""
+        with self._stats_lock:
+            glyphs = {}
+            for kind, totals in self._glyph_stats.items():
+                misses = totals["misses"]
+                avg_miss = totals["miss_seconds"] / misses if misses else 0.0
+                glyphs[kind] = dict(
+                    totals, estimated_seconds_saved=totals["hits"] * avg_miss
+                )
+            return {"renders": self._renders, "killed": self._killed, "glyph_cache": glyphs}
+
+    def _run_job(self, job, cancel=None):
+        job["limits"] = self.limits.to_dict()
+        worker = self._idle.get()
+        try:
+            result = worker.run(job, self.limits.wall_seconds, cancel)
+        except RenderLimitExceeded as e:
+            logger.warning(f"Killed render worker: {e}")
+            with self._stats_lock:
+                self._killed += 1
+            result = {"returncode": KILLED, "error": str(e)}
+        except (EOFError, OSError, ValueError) as e:
+            logger.error(f"Render worker failed: {e}")
+            result = {"returncode": 1, "error": f"Render worker failed: {e}"}
+        else:
+            self._record(result)
+        finally:
+            if worker.alive and worker.jobs < self.max_jobs_per_worker:
+                self._idle.put(worker)
+            else:
+                # Recycle in the background so this render returns right away
+                threading.Thread(target=self._replace, args=(worker,), daemon=True).start()
+        return result
+
+    def render(self, script_file, scene_name, flags, media_dir="media", cancel=None):
+        """
+        Render `scene_name` from `script_file` on a warm worker. Returns a
+        `subprocess.CompletedProcess` so callers can treat it like the CLI.
+        """
+        result = self._run_job(
+            {
+                "mode": "render",
+                "script": os.path.abspath(script_file),
+                "scene": scene_name,
+                "quality": quality_from_flags(flags),
+                "media_dir": os.path.abspath(media_dir),
+                "animations": animation_range_from_flags(flags),
+                "overrides": overrides_from_flags(flags),
+            },
+            cancel,
+        )
+        return subprocess.CompletedProcess(
+            args=["manim", *flags, script_file, scene_name],
+            returncode=result["returncode"],
+            stdout=result.get("video_path", ""),
+            stderr=result.get("error", ""),
+        )
+
+    def dry_run(self, script_file, scene_name, media_dir="media", cancel=None):
+        """
+        Run the scene's construct() with animations skipped and nothing
+        written. Returns a dict with `returncode`, `error` on failure, and
+        the number of play()/wait() calls on success.
+        """
+        return self._run_job(
+            {
+                "mode": "dry_run",
+                "script": os.path.abspath(script_file),
+                "scene": scene_name,
+                "quality": "low_quality",
+                "media_dir": os.path.abspath(media_dir),
+            },
+            cancel,
+        )
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().stop()
+
+
+class OneShotDryRunner:
+    """
+    Pre-flight dry runs without a warm pool: every dry_run() starts a fresh
+    worker process for that one job (paying the manim import each time) and
+    runs it through run_limited() under `limits`. Same results as
+    WarmRenderPool.dry_run(), so segment planning works with any backend.
+    """
+
+    def __init__(self, glyph_cache=None, limits=None):
+        self.limits = limits or RenderLimits()
+        self._env = dict(os.environ)
+        if glyph_cache is not None:
+            self._env["GLYPH_CACHE_DIR"] = glyph_cache.root
+
+    def dry_run(self, script_file, scene_name, media_dir="media", cancel=None):
+        """See WarmRenderPool.dry_run()"""
+        job = {
+            "mode": "dry_run",
+            "script": os.path.abspath(script_file),
+            "scene": scene_name,
+            "quality": "low_quality",
+            "media_dir": os.path.abspath(media_dir),
+            "limits": self.limits.to_dict(),
+        }
+        result = run_limited(
+            [sys.executable, os.path.abspath(__file__), "--once", json.dumps(job)],
+            self.limits,
+            cancel=cancel,
+            env=self._env,
+        )
+        # The worker's reply is its last line; there is none if it was killed
+        lines = result.stdout.strip().splitlines()
+        try:
+            return json.loads(lines[-1])
+        except (IndexError, ValueError):
+            return {
+                "returncode": result.returncode or 1,
+                "error": result.stderr or "Dry run produced no result",
+            }
+
+
+def _load_scene_class(job, counter):
+    spec = importlib.util.spec_from_file_location(f"_generated_{counter}", job["script"])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, job["scene"])
+
+
+def _job_config(job, glyph_cache):
+    # input_file keeps the CLI layout: <media_dir>/videos/<script stem>/<quality>/
+    overrides = {
+        "quality": job["quality"],
+        "media_dir": job["media_dir"],
+        "input_file": job["script"],
+        "preview": False,
+        "progress_bar": "none",
+        "verbosity": "WARNING",
+    }
+    # Resolution and frame rate go after the quality preset they refine
+    overrides.update(job.get("overrides") or {})
+    if job.get("animations"):
+        start, end = job["animations"]
+        overrides["from_animation_number"] = start
+        if end is not None:
+            overrides["upto_animation_number"] = end
+    if glyph_cache is not None:
+        overrides.update(glyph_cache.config())
+    return overrides
+
+
+def _render_job(job, counter, glyph_cache=None):
+    from manim import tempconfig
+
+    scene_cls = _load_scene_class(job, counter)
+    with tempconfig(_job_config(job, glyph_cache)):
+        scene = scene_cls()
+        scene.render()
+        return {"video_path": str(scene.renderer.file_writer.movie_file_path)}
+
+
+def _dry_run_job(job, counter, glyph_cache=None):
+    from manim import tempconfig
+    from manim.renderer.cairo_renderer import CairoRenderer
+
+    scene_cls = _load_scene_class(job, counter)
+    overrides = _job_config(job, glyph_cache)
+    overrides.update({"dry_run": True, "write_to_movie": False, "save_last_frame": False})
+    with tempconfig(overrides):
+        # Skipped animations jump straight to their end state without frames
+        scene = scene_cls(renderer=CairoRenderer(skip_animations=True))
+        scene.render()
+        return {
+            "num_plays": scene.renderer.num_plays,
+            "duration": getattr(scene.renderer, "time", None),
+        }
+
+
+JOB_MODES = {"render": _render_job, "dry_run": _dry_run_job}
+
+
+def _start_worker():
+    """Import manim and set up hooks; returns the protocol stream and glyph cache"""
+    # Keep the real stdout for the protocol; anything manim prints goes to stderr
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+
+    import manim  # noqa: F401 -- the expensive import, paid once per worker
+
+    install_frame_hook()
+
+    glyph_cache = None
+    if os.environ.get("GLYPH_CACHE_DIR"):
+        from glyph_cache import GlyphCache
+
+        glyph_cache = GlyphCache(os.environ["GLYPH_CACHE_DIR"])
+        glyph_cache.install()
+    return protocol, glyph_cache
+
+
+def _execute(job, counter, glyph_cache):
+    limits = RenderLimits.from_dict(job.get("limits"))
+    try:
+        with cpu_budget(limits.cpu_seconds), frame_caps(
+            limits.max_frames, limits.max_duration
+        ):
+            result = JOB_MODES[job.get("mode", "render")](job, counter, glyph_cache)
+        result["returncode"] = 0
+    except BaseException:
+        result = {"returncode": 1, "error": traceback.format_exc()}
+    if glyph_cache is not None:
+        result["glyph_stats"] = glyph_cache.drain_stats()
+    return result
+
+
+def worker_main():
+    protocol, glyph_cache = _start_worker()
+    protocol.write(json.dumps({"ready": True}) + "\n")
+    for counter, line in enumerate(sys.stdin):
+        result = _execute(json.loads(line), counter, glyph_cache)
+        protocol.write(json.dumps(result) + "\n")
+
+
+def run_once(job):
+    """Run a single job (`warm_pool.py --once '<json>'`) and print its reply"""
+    protocol, glyph_cache = _start_worker()
+    protocol.write(json.dumps(_execute(job, 0, glyph_cache)) + "\n")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--once"]:
+        run_once(json.loads(sys.argv[2]))
+    else:
+        worker_main()
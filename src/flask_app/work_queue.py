@@ -0,0 +1,531 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import urllib.error
+import urllib.request
+from contextlib import closing
+
+from flask import Blueprint, abort, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+# Longest a single lease request may block on the server; clients loop for longer waits
+MAX_SERVER_WAIT = 20
+
+
+class Message:
+    """A leased message; pass it back to ack/nack/extend"""
+
+    def __init__(self, id, queue, body, attempts, lease):
+        self.id = id
+        self.queue = queue
+        self.body = body
+        self.attempts = attempts
+        self.lease = lease
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "queue": self.queue,
+            "body": self.body,
+            "attempts": self.attempts,
+            "lease": self.lease,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["id"], data["queue"], data["body"], data["attempts"], data["lease"]
+        )
+
+
+class SQLiteQueue:
+    """
+    Durable at-least-once work queue in a SQLite file, shared by every
+    process on the host.
+
+    `get()` leases the next ready message for `visibility_timeout` seconds.
+    The holder must `ack()` it when done; if it `nack()`s, or the lease runs
+    out (the worker died), the message is delivered again. After
+    `max_attempts` deliveries a failing message is moved to the dead letters
+    instead, where `requeue()` can revive it. Lower `priority` values are
+    delivered first. `cancel()` withdraws a message: a ready one is
+    deleted, a leased one is marked "cancelled" for its holder to notice.
+    """
+
+    def __init__(self, path, visibility_timeout=300, max_attempts=3, poll_interval=0.2):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._last_expiry = 0.0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    queue TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    available_at REAL NOT NULL,
+                    expires_at REAL,
+                    lease TEXT,
+                    last_error TEXT,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            db.execute(
+                """
+                CREATE INDEX IF NOT EXISTS messages_next
+                ON messages (queue, state, priority, available_at)
+                """
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS messages_expiry ON messages (expires_at)"
+            )
+
+    def _connect(self):
+        # Autocommit, so _claim can take the write lock with BEGIN IMMEDIATE
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def put(self, queue, body, priority=0, delay=0, ttl=None):
+        """Enqueue a JSON-serialisable `body`; returns the message id"""
+        now = time.time()
+        self._expire(now)
+        with closing(self._connect()) as db:
+            cursor = db.execute(
+                """
+                INSERT INTO messages
+                    (queue, body, priority, state, attempts, available_at, expires_at, created_at)
+                VALUES (?, ?, ?, 'ready', 0, ?, ?, ?)
+                """,
+                (
+                    queue,
+                    json.dumps(body),
+                    priority,
+                    now + delay,
+                    now + ttl if ttl else None,
+                    now,
+                ),
+            )
+            return cursor.lastrowid
+
+    def get(self, queue, wait=0, visibility_timeout=None):
+        """
+        Lease the next ready message, waiting up to `wait` seconds for one.
+        Returns a Message, or None if the queue stayed empty.
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            message = self._claim(queue, visibility_timeout or self.visibility_timeout)
+            if message is not None or time.monotonic() >= deadline:
+                return message
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+    def _claim(self, queue, visibility_timeout):
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    # Expired leases are ready again: their worker never acked
+                    row = db.execute(
+                        """
+                        SELECT id, body, attempts FROM messages
+                        WHERE queue = ? AND state IN ('ready', 'leased')
+                            AND available_at <= ? AND (expires_at IS NULL OR expires_at > ?)
+                        ORDER BY priority, id LIMIT 1
+                        """,
+                        (queue, now, now),
+                    ).fetchone()
+                    if row is None:
+                        db.execute("COMMIT")
+                        return None
+                    message_id, body, attempts = row
+                    if attempts >= self.max_attempts:
+                        db.execute(
+                            """
+                            UPDATE messages SET state = 'dead', lease = NULL,
+                                last_error = COALESCE(last_error, 'lease expired')
+                            WHERE id = ?
+                            """,
+                            (message_id,),
+                        )
+                        logger.warning(f"Message {message_id} on {queue} dead-lettered")
+                        continue
+                    lease = uuid.uuid4().hex
+                    db.execute(
+                        """
+                        UPDATE messages SET state = 'leased', lease = ?,
+                            attempts = attempts + 1, available_at = ?
+                        WHERE id = ?
+                        """,
+                        (lease, now + visibility_timeout, message_id),
+                    )
+                    db.execute("COMMIT")
+                    return Message(message_id, queue, json.loads(body), attempts + 1, lease)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def ack(self, message):
+        """Delete a finished message; False if the lease was lost meanwhile"""
+        with closing(self._connect()) as db:
+            cursor = db.execute(
+                "DELETE FROM messages WHERE id = ? AND lease = ? AND state = 'leased'",
+                (message.id, message.lease),
+            )
+            return cursor.rowcount == 1
+
+    def nack(self, message, error=None, delay=0):
+        """Give a message back for redelivery, or dead-letter it on its last attempt"""
+        with closing(self._connect()) as db:
+            cursor = db.execute(
+                """
+                UPDATE messages SET
+                    state = CASE WHEN attempts >= ? THEN 'dead' ELSE 'ready' END,
+                    lease = NULL, available_at = ?, last_error = ?
+                WHERE id = ? AND lease = ? AND state = 'leased'
+                """,
+                (self.max_attempts, time.time() + delay, error, message.id, message.lease),
+            )
+            return cursor.rowcount == 1
+
+    def extend(self, message, seconds=None):
+        """Push a lease's expiry `seconds` from now; False if it was already lost"""
+        with closing(self._connect()) as db:
+            cursor = db.execute(
+                """
+                UPDATE messages SET available_at = ?
+                WHERE id = ? AND lease = ? AND state = 'leased'
+                """,
+                (
+                    time.time() + (seconds or self.visibility_timeout),
+                    message.id,
+                    message.lease,
+                ),
+            )
+            return cursor.rowcount == 1
+
+    def cancel(self, message_id, keep=60):
+        """
+        Withdraw a message nobody needs any more. A ready one is deleted; a
+        leased one can no longer be extended or acked and shows as
+        "cancelled" in peek() for `keep` seconds, so its holder can stop.
+        False if it was already finished, dead or gone.
+        """
+        now = time.time()
+        with closing(self._connect()) as db:
+            cursor = db.execute(
+                "DELETE FROM messages WHERE id = ? AND state = 'ready'", (message_id,)
+            )
+            if cursor.rowcount == 1:
+                return True
+            cursor = db.execute(
+                """
+                UPDATE messages SET state = 'cancelled', lease = NULL, expires_at = ?
+                WHERE id = ? AND state = 'leased'
+                """,
+                (now + keep, message_id),
+            )
+            return cursor.rowcount == 1
+
+    def peek(self, message_id):
+        """
+        State of a message ("ready", "leased", "dead", "cancelled"), or None
+        once acked
+        """
+        with closing(self._connect()) as db:
+            row = db.execute(
+                "SELECT queue, state, attempts, last_error FROM messages WHERE id = ?",
+                (message_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        queue, state, attempts, last_error = row
+        return {
+            "id": message_id,
+            "queue": queue,
+            "state": state,
+            "attempts": attempts,
+            "last_error": last_error,
+        }
+
+    def dead_letters(self, queue, limit=100):
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                """
+                SELECT id, body, attempts, last_error FROM messages
+                WHERE queue = ? AND state = 'dead' ORDER BY id LIMIT ?
+                """,
+                (queue, limit),
+            ).fetchall()
+        return [
+            {"id": i, "body": json.loads(body), "attempts": attempts, "last_error": error}
+            for i, body, attempts, error in rows
+        ]
+
+    def requeue(self, message_id):
+        """Give a dead letter a fresh set of attempts"""
+        with closing(self._connect()) as db:
+            cursor = db.execute(
+                """
+                UPDATE messages SET state = 'ready', attempts = 0, available_at = ?
+                WHERE id = ? AND state = 'dead'
+                """,
+                (time.time(), message_id),
+            )
+            return cursor.rowcount == 1
+
+    def stats(self, queue):
+        now = time.time()
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                """
+                SELECT
+                    CASE WHEN state = 'leased' AND available_at <= ? THEN 'ready'
+                         ELSE state END,
+                    COUNT(*)
+                FROM messages WHERE queue = ? GROUP BY 1
+                """,
+                (now, queue),
+            ).fetchall()
+        return {"ready": 0, "leased": 0, "dead": 0, **dict(rows)}
+
+    def _expire(self, now):
+        """Drop messages past their ttl, at most once a minute"""
+        if now - self._last_expiry < 60:
+            return
+        self._last_expiry = now
+        with closing(self._connect()) as db:
+            db.execute("DELETE FROM messages WHERE expires_at < ?", (now,))
+
+
+class HTTPQueue:
+    """
+    Client for a queue served by `queue_api()` on another host, with the
+    same interface as SQLiteQueue so render nodes need not share a disk
+    with the queue. `transport(method, path, payload, headers)` returns
+    `(status, json)`; the default speaks HTTP, tests can pass
+    `local_transport(app)` instead. Every transport gets the token header.
+    """
+
+    def __init__(self, base_url, token=None, transport=None, timeout=MAX_SERVER_WAIT + 10):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.transport = transport or self._http
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def _http(self, method, path, payload=None, headers=None):
+        req = urllib.request.Request(
+            self.base_url + path,
+            method=method,
+            data=json.dumps(payload).encode() if payload is not None else None,
+            headers=headers or {},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                body = response.read()
+                return response.status, json.loads(body) if body else None
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return 404, None
+            raise
+
+    def _call(self, method, path, payload=None, allow_missing=False):
+        status, data = self.transport(method, path, payload, self._headers())
+        if status >= 400 and not (allow_missing and status == 404):
+            raise RuntimeError(f"Queue server answered {status} for {method} {path}")
+        return status, data
+
+    def put(self, queue, body, priority=0, delay=0, ttl=None):
+        _, data = self._call(
+            "POST",
+            f"/{queue}/messages",
+            {"body": body, "priority": priority, "delay": delay, "ttl": ttl},
+        )
+        return data["id"]
+
+    def get(self, queue, wait=0, visibility_timeout=None):
+        deadline = time.monotonic() + wait
+        while True:
+            remaining = max(deadline - time.monotonic(), 0)
+            status, data = self._call(
+                "POST",
+                f"/{queue}/lease",
+                {
+                    "wait": min(remaining, MAX_SERVER_WAIT),
+                    "visibility_timeout": visibility_timeout,
+                },
+            )
+            if status == 200 and data:
+                return Message.from_dict(data)
+            if time.monotonic() >= deadline:
+                return None
+
+    def ack(self, message):
+        return self._lease_call(message, "ack", {})
+
+    def nack(self, message, error=None, delay=0):
+        return self._lease_call(message, "nack", {"error": error, "delay": delay})
+
+    def extend(self, message, seconds=None):
+        return self._lease_call(message, "extend", {"seconds": seconds})
+
+    def _lease_call(self, message, action, payload):
+        _, data = self._call(
+            "POST",
+            f"/{message.queue}/messages/{message.id}/{action}",
+            {"lease": message.lease, **payload},
+        )
+        return bool(data and data.get("ok"))
+
+    def cancel(self, message_id):
+        _, data = self._call("POST", f"/messages/{message_id}/cancel")
+        return bool(data and data.get("ok"))
+
+    def peek(self, message_id):
+        status, data = self._call("GET", f"/messages/{message_id}", allow_missing=True)
+        return data if status == 200 else None
+
+    def dead_letters(self, queue, limit=100):
+        return self._call("GET", f"/{queue}/dead?limit={limit}")[1]
+
+    def requeue(self, message_id):
+        _, data = self._call("POST", f"/messages/{message_id}/requeue")
+        return bool(data and data.get("ok"))
+
+    def stats(self, queue):
+        return self._call("GET", f"/{queue}/stats")[1]
+
+
+def queue_api(queue, token=None):
+    """
+    Blueprint exposing `queue` (normally a SQLiteQueue) over HTTP for
+    HTTPQueue clients. Every request must carry `Authorization: Bearer
+    <token>` when `token` is set.
+    """
+    api = Blueprint("work_queue", __name__)
+
+    @api.before_request
+    def check_token():
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            abort(401)
+
+    def leased(queue_name, message_id):
+        return Message(message_id, queue_name, None, 0, request.json["lease"])
+
+    @api.route("/<name>/messages", methods=["POST"])
+    def put(name):
+        payload = request.json
+        message_id = queue.put(
+            name,
+            payload["body"],
+            priority=payload.get("priority", 0),
+            delay=payload.get("delay", 0),
+            ttl=payload.get("ttl"),
+        )
+        return jsonify({"id": message_id}), 201
+
+    @api.route("/<name>/lease", methods=["POST"])
+    def lease(name):
+        payload = request.json or {}
+        message = queue.get(
+            name,
+            wait=min(float(payload.get("wait") or 0), MAX_SERVER_WAIT),
+            visibility_timeout=payload.get("visibility_timeout"),
+        )
+        if message is None:
+            return "", 204
+        return jsonify(message.to_dict())
+
+    @api.route("/<name>/messages/<int:message_id>/ack", methods=["POST"])
+    def ack(name, message_id):
+        return jsonify({"ok": queue.ack(leased(name, message_id))})
+
+    @api.route("/<name>/messages/<int:message_id>/nack", methods=["POST"])
+    def nack(name, message_id):
+        payload = request.json
+        return jsonify(
+            {
+                "ok": queue.nack(
+                    leased(name, message_id),
+                    error=payload.get("error"),
+                    delay=payload.get("delay", 0),
+                )
+            }
+        )
+
+    @api.route("/<name>/messages/<int:message_id>/extend", methods=["POST"])
+    def extend(name, message_id):
+        seconds = request.json.get("seconds")
+        return jsonify({"ok": queue.extend(leased(name, message_id), seconds)})
+
+    @api.route("/messages/<int:message_id>")
+    def peek(message_id):
+        state = queue.peek(message_id)
+        if state is None:
+            abort(404)
+        return jsonify(state)
+
+    @api.route("/messages/<int:message_id>/cancel", methods=["POST"])
+    def cancel(message_id):
+        return jsonify({"ok": queue.cancel(message_id)})
+
+    @api.route("/messages/<int:message_id>/requeue", methods=["POST"])
+    def requeue(message_id):
+        return jsonify({"ok": queue.requeue(message_id)})
+
+    @api.route("/<name>/dead")
+    def dead(name):
+        return jsonify(queue.dead_letters(name, int(request.args.get("limit", 100))))
+
+    @api.route("/<name>/stats")
+    def stats(name):
+        return jsonify(queue.stats(name))
+
+    return api
+
+
+def local_transport(app, prefix=""):
+    """
+    HTTPQueue transport that calls `app` in-process through Flask's test
+    client; a stand-in for the network in tests and single-process setups.
+    """
+    client = app.test_client()
+
+    def transport(method, path, payload=None, headers=None):
+        response = client.open(
+            prefix + path, method=method, json=payload, headers=headers
+        )
+        return response.status_code, response.get_json(silent=True)
+
+    return transport
+
+
+def queue_from_url(url, token=None, **kwargs):
+    """
+    `sqlite://<path>` for a queue file on this host (`sqlite:///abs/path` or
+    `sqlite://relative/path`), `http(s)://host/prefix` for a queue served by
+    queue_api() elsewhere.
+    """
+    if url.startswith("sqlite://"):
+        return SQLiteQueue(url[len("sqlite://") :], **kwargs)
+    if url.startswith(("http://", "https://")):
+        return HTTPQueue(url, token=token)
+    raise ValueError(f"Unknown work queue URL {url!r}, use sqlite:// or http(s)://")
@@ -1,10 +1,36 @@
 import os
+import sys
+import time
 import uuid
-import subprocess
-from flask import Flask, request, jsonify
+import tempfile
+import threading
+from flask import Flask, Response, request, jsonify, g
 from werkzeug.utils import secure_filename
 import re
-from openai import OpenAI
+
+# Shared pipeline modules live next to the main Flask app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flask_app'))
+from render_pool import RenderScheduler, QueueFull, available_cores, PRIORITY_BACKGROUND
+from warm_pool import WarmRenderPool, OneShotDryRunner
+from limits import limits_from_env
+from glyph_cache import GlyphCache
+from render_cache import RenderCache, script_key
+from llm_cache import LLMCache, request_key
+from llm_gateway import gateway_from_env
+from preflight import preflight, PreflightError
+from quality import QUALITY_TIERS, DEFAULT_PREVIEW, DEGRADED_PREVIEW, tier_flags, video_path as tier_video_path
+from code_repair import repair_code, cap_waits
+from render_repair import request_repair, trim_error
+from video_delivery import send_video, faststart
+from storage import IMMUTABLE_PREFIXES, Uploader, storage_from_env
+from renditions import renditions_from_env
+from janitor import Janitor
+from jobs import SingleFlight
+from work_queue import SQLiteQueue, queue_api, queue_from_url
+from render_node import QueueRenderScheduler
+from admission import LoadGovernor, NORMAL, DEGRADE
+from scene_templates import match_template, prewarm as prewarm_templates
+from metrics import span, observe_stage, update_render_gauges, render_latest, CONTENT_TYPE
 
 app = Flask(__name__)
 
@@ -13,8 +39,141 @@ UPLOAD_FOLDER = 'media/videos'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Make sure your OPENAI_API_KEY is set in the environment
-client = OpenAI()
+# Bounded render slots, one per core unless RENDER_WORKERS says otherwise
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', '0')) or available_cores()
+# "warm" renders in pre-started processes that import manim once; "cli" spawns manim
+RENDER_BACKEND = os.environ.get('RENDER_BACKEND', 'warm')
+# Per-render time, memory and length caps; see limits_from_env()
+render_limits = limits_from_env()
+glyph_cache = GlyphCache(
+    os.environ.get('GLYPH_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'animator-glyph-cache')),
+    max_bytes=int(os.environ.get('GLYPH_CACHE_MAX_BYTES', 512 * 1024**2))
+)
+
+# With WORK_QUEUE_URL set, renders are queued for render nodes (render_node.py)
+WORK_QUEUE_URL = os.environ.get('WORK_QUEUE_URL')
+WORK_QUEUE_TOKEN = os.environ.get('WORK_QUEUE_TOKEN')
+if WORK_QUEUE_URL:
+    work_queue = queue_from_url(WORK_QUEUE_URL, token=WORK_QUEUE_TOKEN)
+    render_scheduler = QueueRenderScheduler(
+        work_queue,
+        max_queue=int(os.environ.get('RENDER_QUEUE_SIZE', '64'))
+    )
+    if WORK_QUEUE_TOKEN and isinstance(work_queue, SQLiteQueue):
+        app.register_blueprint(queue_api(work_queue, WORK_QUEUE_TOKEN), url_prefix='/queue')
+else:
+    render_scheduler = RenderScheduler(
+        workers=RENDER_WORKERS,
+        backend=WarmRenderPool(
+            RENDER_WORKERS,
+            max_jobs_per_worker=int(os.environ.get('RENDER_WORKER_MAX_JOBS', '50')),
+            glyph_cache=glyph_cache,
+            limits=render_limits
+        ) if RENDER_BACKEND == 'warm' else None,
+        limits=render_limits
+    )
+
+# Pre-flight dry runs never take a render slot: separate warm workers with the
+# warm backend, otherwise a one-shot process per script. '0' skips dry runs
+if os.environ.get('PREFLIGHT_WORKERS') == '0':
+    preflight_pool = None
+elif RENDER_BACKEND == 'warm':
+    preflight_pool = WarmRenderPool(
+        int(os.environ.get('PREFLIGHT_WORKERS', '1')),
+        glyph_cache=glyph_cache,
+        limits=render_limits
+    )
+else:
+    preflight_pool = OneShotDryRunner(glyph_cache=glyph_cache, limits=render_limits)
+
+# Latency target for queued renders; past half of it upgrades are shed, past
+# all of it renders drop to the draft tier with short waits. 0 disables
+governor = LoadGovernor(
+    render_scheduler,
+    slo=float(os.environ.get('LATENCY_SLO', '60')),
+    max_wait=float(os.environ.get('DEGRADE_MAX_WAIT', '1'))
+)
+
+# Tier re-rendered in the background after the preview; "none" disables it
+UPGRADE_QUALITY = os.environ.get('UPGRADE_QUALITY', 'high')
+
+# Content-addressed cache of finished renders, shared with other workers
+render_cache = RenderCache(
+    os.environ.get('RENDER_CACHE_DIR', 'media/cache'),
+    max_bytes=int(os.environ.get('RENDER_CACHE_MAX_BYTES', 2 * 1024**3))
+)
+
+# Where finished videos are published; video_url is the backend's URL for them
+uploader = Uploader(
+    storage_from_env('media', base_url='media'),
+    media_root='media',
+    workers=int(os.environ.get('UPLOAD_WORKERS', '2')),
+    cache_root=render_cache.root
+)
+
+# Poster frame, GIF preview and low-bitrate variant of every finished video,
+# transcoded side by side on their own threads; RENDITIONS="" turns them off
+rendition_pool = renditions_from_env()
+
+def quota(name, default_bytes, default_files):
+    """(max_bytes, max_files) from <name>_QUOTA_BYTES / <name>_QUOTA_FILES; 0 disables"""
+    max_bytes = int(os.environ.get(f'{name}_QUOTA_BYTES', default_bytes))
+    max_files = int(os.environ.get(f'{name}_QUOTA_FILES', default_files))
+    return (max_bytes or None, max_files or None)
+
+# Evicts least recently served scripts and render trees once over quota;
+# scripts live next to their render trees in UPLOAD_FOLDER here
+janitor = Janitor(
+    os.environ.get('JANITOR_INDEX_PATH', os.path.join('.cache', 'artifacts.sqlite3')),
+    media_dir='media',
+    script_dir=UPLOAD_FOLDER,
+    quotas={
+        'videos': quota('VIDEO', 5 * 1024**3, 5000),
+        'scripts': quota('SCRIPT', 256 * 1024**2, 20000)
+    },
+    interval=int(os.environ.get('JANITOR_INTERVAL', '60')),
+    min_age=int(os.environ.get('JANITOR_MIN_AGE', '600')),
+    tex_dirs=[os.path.join('media', 'Tex'), glyph_cache.tex_dir]
+)
+
+# /generate calls currently running, keyed on normalized question and options
+in_flight = SingleFlight()
+
+# Make sure your OPENAI_API_KEY is set in the environment. Calls go through
+# the gateway, which enforces the account's rate limits and retries
+client = gateway_from_env()
+
+# Persistent cache of LLM completions keyed on model, prompt and question
+llm_cache = LLMCache(
+    os.environ.get('LLM_CACHE_PATH', os.path.join('.cache', 'llm_cache.sqlite3')),
+    ttl=int(os.environ.get('LLM_CACHE_TTL', 7 * 24 * 3600)),
+    max_entries=int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 5000))
+)
+
+# Stream completions and cut them off as soon as the code fence closes
+LLM_STREAM = os.environ.get('LLM_STREAM', '1') != '0'
+
+# Times a failing script goes back to the LLM with its error before giving up
+RENDER_REPAIR_ATTEMPTS = int(os.environ.get('RENDER_REPAIR_ATTEMPTS', '2'))
+
+# Answer canonical questions from hand-tuned scene templates instead of the
+# LLM, and render the TEMPLATE_PREWARM most popular ones at startup
+SCENE_TEMPLATES = os.environ.get('SCENE_TEMPLATES', '1') != '0'
+TEMPLATE_PREWARM = int(os.environ.get('TEMPLATE_PREWARM', '4'))
+
+def prepare_render(script_file, path):
+    """What every finished render goes through before it is cached"""
+    faststart(path)
+    janitor.track_render(script_file)
+
+if SCENE_TEMPLATES and TEMPLATE_PREWARM:
+    threading.Thread(
+        target=prewarm_templates,
+        args=(render_scheduler, render_cache, UPLOAD_FOLDER),
+        kwargs={'tiers': [DEFAULT_PREVIEW], 'count': TEMPLATE_PREWARM, 'prepare': prepare_render},
+        name='template-prewarm',
+        daemon=True
+    ).start()
 
 # Default prompt template
 DEFAULT_PROMPT_TEMPLATE = """
@@ -44,56 +203,65 @@ Create a **complete and runnable Manim CE script** that visually explains the fo
 Respond **only with valid Python code**, using standard Manim CE. No comments or markdown.
 """
 
-def auto_fix_code(code: str) -> str:
-    """
-    Fixes common GPT-generated errors in Manim matrix/vector syntax:
-    - Converts 1D Matrix([1, 2]) into column Matrix([[1], [2]])
-    - Removes unsupported .T (transpose)
-    """
-    # Remove .T used on Matrix
-    code = re.sub(r'\.T\b', '', code)
-
-    # Fix Matrix([number, number, ...]) -> Matrix([[number], [number], ...])
-    def convert_1d_matrix_to_column(match):
-        numbers = match.group(1)
-        elements = [e.strip() for e in numbers.split(',')]
-        column = ', '.join(f'[{e}]' for e in elements)
-        return f'Matrix([{column}])'
-
-    code = re.sub(r'Matrix\(\[([^\[\]]+?)\]\)', convert_1d_matrix_to_column, code)
-
-    return code
-
-def generate_manim_code(question, scene_name, prompt_template=None):
-    """Generate Manim code using OpenAI API"""
+def generate_manim_code(question, scene_name, prompt_template=None, fresh=False, script_id=None):
+    """Generate Manim code using OpenAI API, reusing cached completions unless `fresh`"""
     prompt = prompt_template or DEFAULT_PROMPT_TEMPLATE
     prompt = prompt.format(question=question, scene_name=scene_name)
     
     print(f"🧠 Generating Manim script for question: {question}")
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
-    )
-    content = response.choices[0].message.content
+    with span('llm', script_id, model='gpt-3.5-turbo', streamed=LLM_STREAM) as s:
+        content, cache_hit = llm_cache.complete(
+            client,
+            model="gpt-3.5-turbo",
+            prompt=prompt,
+            question=question,
+            temperature=0.3,
+            scene_name=scene_name,
+            bypass=fresh,
+            # Stop reading once the code fence closes
+            stream=LLM_STREAM,
+        )
+        if cache_hit:
+            s['outcome'] = 'cached'
+    if cache_hit:
+        print("♻️  Reused cached completion")
     # Extract code from markdown-style triple backticks
-    match = re.search(r"```python(.*?)```", content, re.DOTALL)
-    return match.group(1).strip() if match else content.strip()
+    with span('extract', script_id):
+        match = re.search(r"```python(.*?)```", content, re.DOTALL)
+        return match.group(1).strip() if match else content.strip()
 
-def save_code(code: str, output_file):
+def save_code(code: str, output_file, script_id=None):
     """Save the generated code to a file"""
-    with open(output_file, "w") as f:
-        f.write(code)
+    with span('file_io', script_id, op='save_script'):
+        with open(output_file, "w") as f:
+            f.write(code)
+    janitor.track_script(output_file)
     print(f"✅ Saved generated code to {output_file}")
 
-def render_scene(output_file, scene_name):
-    """Run Manim to render the scene"""
-    print(f"🎬 Running Manim to render the scene: {scene_name}")
-    result = subprocess.run(
-        ["manim", "-pql", output_file, scene_name],
-        capture_output=True,
-        text=True
-    )
+def repair_script(manim_code, failed_stage, error, output_file, scene_name, script_id, attempt):
+    """Send a failing script and its trimmed error back to the LLM; returns the fixed script"""
+    print(f"🔧 Repair attempt {attempt} after {failed_stage} failed: {error.splitlines()[0] if error else ''}")
+    with span('repair', script_id, attempt=attempt, failed_stage=failed_stage) as s:
+        content, cache_hit = request_repair(
+            llm_cache, client, 'gpt-3.5-turbo', manim_code, error, scene_name
+        )
+        if cache_hit:
+            s['outcome'] = 'cached'
+    match = re.search(r"```python(.*?)```", content, re.DOTALL)
+    manim_code = match.group(1).strip() if match else content.strip()
+    with span('auto_fix', script_id):
+        manim_code = repair_code(manim_code, scene_name)
+    save_code(manim_code, output_file, script_id)
+    return manim_code
+
+def render_scene(output_file, scene_name, tier=DEFAULT_PREVIEW, script_id=None):
+    """Run Manim to render the scene at a quality tier"""
+    print(f"🎬 Running Manim to render the scene: {scene_name} ({tier})")
+    # Includes the wait for a render slot; the scheduler reports queue_wait separately
+    with span('render', script_id, tier=tier) as s:
+        result = render_scheduler.render(output_file, scene_name, tier_flags(tier))
+        if result.returncode != 0:
+            s['outcome'] = 'error'
     
     if result.returncode != 0:
         print(f"Error rendering scene: {result.stderr}")
@@ -101,6 +269,69 @@ def render_scene(output_file, scene_name):
     
     return True, result.stdout
 
+def start_renditions(video_path, script_id):
+    """
+    Start transcoding every rendition of `video_path` in the background and
+    return them as pending, with the URLs they will be published at
+    """
+    if rendition_pool is None:
+        return {}
+    rendition_pool.submit(video_path, uploader.publish, script_id)
+    return rendition_pool.pending(video_path, uploader.url_for)
+
+def schedule_upgrade(manim_code, output_file, scene_name, tier):
+    """Queue a background re-render at `tier`; returns where the video will land"""
+    flags = tier_flags(tier)
+    queued_at = time.perf_counter()
+    try:
+        future = render_scheduler.submit_render(output_file, scene_name, flags, priority=PRIORITY_BACKGROUND)
+    except QueueFull:
+        return {'quality': tier, 'status': 'skipped'}
+    
+    def on_done(future):
+        path = tier_video_path(output_file, scene_name, tier)
+        ok = future.exception() is None and future.result().returncode == 0 and os.path.exists(path)
+        observe_stage('upgrade', time.perf_counter() - queued_at, 'ok' if ok else 'error',
+                      os.path.splitext(os.path.basename(output_file))[0], tier=tier)
+        if ok:
+            def prepare(path):
+                faststart(path)
+                janitor.track_render(output_file)
+                return render_cache.put(script_key(manim_code, scene_name, flags), path)
+            def on_published(upload):
+                if upload.exception() is None:
+                    print(f"⬆️  Upgraded render ready: {upload.result()}")
+                else:
+                    print(f"Upgrade upload failed: {upload.exception()}")
+            # Remux, cache and upload on the upload threads, not in the render slot
+            uploader.submit(path, prepare=prepare).add_done_callback(on_published)
+    
+    future.add_done_callback(on_done)
+    return {
+        'quality': tier,
+        'status': 'queued',
+        'video_path': tier_video_path(output_file, scene_name, tier)
+    }
+
+def success_response(question, video_path, video_url, py_filepath, quality, template_name,
+                     renditions, cached=False, upgrade_info=None, repairs=(), load=None):
+    """The /generate reply for a finished video; cache hits and renders share its keys"""
+    return jsonify({
+        'status': 'success',
+        'question': question,
+        'video_path': video_path,
+        'video_url': video_url,
+        'python_file': py_filepath,
+        'quality': quality,
+        'cached': cached,
+        'upgrade': upgrade_info,
+        'repairs': list(repairs),
+        'template': template_name,
+        'renditions': renditions,
+        # What the load governor changed about this request, if anything
+        'degradation': load if load and load['actions'] else None
+    })
+
 @app.route('/generate', methods=['POST'])
 def generate_animation():
     """
@@ -109,6 +340,10 @@ def generate_animation():
     POST parameters:
     - question: The math question to explain
     - prompt_template (optional): Custom prompt template to use
+    - fresh (optional): "1" to bypass the LLM cache
+    - quality (optional): tier rendered before responding, default "preview"
+    - upgrade (optional): tier re-rendered in the background afterwards,
+      default UPGRADE_QUALITY; "none" to skip
     
     Returns:
     - JSON with file path and status
@@ -118,34 +353,148 @@ def generate_animation():
     
     question = request.form['question']
     prompt_template = request.form.get('prompt_template')
+    fresh = request.form.get('fresh', '').lower() in ('1', 'true', 'yes')
+    quality = request.form.get('quality', DEFAULT_PREVIEW)
+    upgrade = request.form.get('upgrade', UPGRADE_QUALITY)
+    if quality not in QUALITY_TIERS or upgrade not in (*QUALITY_TIERS, 'none'):
+        return jsonify({'error': f'Unknown quality, use one of {list(QUALITY_TIERS)}'}), 400
+    if upgrade == quality:
+        upgrade = 'none'
     
+    if fresh:
+        return run_generation(question, prompt_template, fresh, quality, upgrade)
+    
+    # Identical questions arriving together share one LLM call and render
+    key = request_key(question, prompt_template, quality, upgrade)
+    response, shared = in_flight.do(
+        key,
+        lambda: app.make_response(run_generation(question, prompt_template, fresh, quality, upgrade))
+    )
+    if shared:
+        # Every request needs its own response object
+        response = Response(response.get_data(), status=response.status, headers=list(response.headers))
+    return response
+
+def run_generation(question, prompt_template, fresh, quality, upgrade):
+    """Generate, validate and render one question; returns the /generate response"""
     # Generate a unique ID for this request
     request_id = str(uuid.uuid4())
-    scene_name = f"Scene_{request_id[:8]}"
+    script_id = g.script_id = request_id[:8]
+    scene_name = f"Scene_{script_id}"
     
     # Create unique filenames
     py_filename = f"scene_{request_id}.py"
     py_filepath = os.path.join(app.config['UPLOAD_FOLDER'], py_filename)
     
-    # Generate and save the code
-    manim_code = auto_fix_code(generate_manim_code(question, scene_name, prompt_template))
-    save_code(manim_code, py_filepath)
+    # Canonical questions come from a hand-tuned template, with no LLM call;
+    # pre-warmed ones are then served straight from the render cache below.
+    # A custom prompt asks for something a template can't promise
+    use_template = SCENE_TEMPLATES and not fresh and not prompt_template
+    matched = match_template(question) if use_template else None
+    if matched:
+        template, params = matched
+        scene_name = template.class_name
+        print(f"📐 Question matched the {template.name} template")
+        manim_code = template.script(params)
+    else:
+        manim_code = generate_manim_code(question, scene_name, prompt_template, fresh, script_id)
+        with span('auto_fix', script_id):
+            manim_code = repair_code(manim_code, scene_name)
+    save_code(manim_code, py_filepath, script_id)
+    template_name = matched[0].name if matched else None
     
-    # Render the scene
-    success, output = render_scene(py_filepath, scene_name)
+    # Skip Manim entirely if this exact script was rendered before
+    cache_key = script_key(manim_code, scene_name, tier_flags(quality))
+    with span('file_io', script_id, op='cache_lookup', tier=quality):
+        cached_path = render_cache.get(cache_key)
+    if cached_path:
+        print(f"♻️  Render cache hit: {cached_path}")
+        with span('file_io', script_id, op='upload'):
+            video_url = uploader.publish(cached_path)
+        return success_response(question, cached_path, video_url, py_filepath, quality,
+                                template_name, start_renditions(cached_path, script_id),
+                                cached=True)
     
-    if not success:
-        return jsonify({
-            'status': 'error',
-            'message': 'Failed to render animation',
-            'details': output
-        }), 500
+    # Under load, render less rather than let the queue grow
+    load = governor.assess()
+    if load['level'] == DEGRADE and quality != DEGRADED_PREVIEW:
+        quality = DEGRADED_PREVIEW
+        governor.record(load, 'draft_tier')
+        capped = cap_waits(manim_code, governor.max_wait)
+        if capped != manim_code:
+            manim_code = capped
+            save_code(manim_code, py_filepath, script_id)
+            governor.record(load, 'cap_waits')
+        cache_key = script_key(manim_code, scene_name, tier_flags(quality))
+    
+    # Validate and render; a failing script goes back to the LLM with its error
+    repairs = []
+    while True:
+        attempt_start = time.perf_counter()
+        # Fail fast on broken scripts instead of spending a render on them
+        try:
+            with span('validate', script_id) as s:
+                try:
+                    preflight(manim_code, py_filepath, scene_name, dry_runner=preflight_pool,
+                              max_duration=render_limits.max_duration)
+                except PreflightError:
+                    s['outcome'] = 'rejected'
+                    raise
+        except PreflightError as e:
+            failed_stage, error = 'validate', '\n'.join(e.problems)
+            failure = jsonify({
+                'status': 'error',
+                'message': 'Generated script failed validation',
+                'details': e.problems,
+                'python_file': py_filepath,
+                'repairs': repairs
+            }), 422
+        else:
+            # Render the scene
+            try:
+                success, output = render_scene(py_filepath, scene_name, quality, script_id)
+            except QueueFull as e:
+                response = jsonify({
+                    'status': 'error',
+                    'message': 'Render queue is full, try again later',
+                    'retry_after': e.retry_after
+                })
+                response.status_code = 503
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+            if success:
+                break
+            failed_stage, error = 'render', trim_error(output, py_filepath, manim_code)
+            failure = jsonify({
+                'status': 'error',
+                'message': 'Failed to render animation',
+                'details': output,
+                'repairs': repairs
+            }), 500
+        
+        # A template that fails is a bug here, not something the LLM can fix
+        if matched or len(repairs) >= RENDER_REPAIR_ATTEMPTS:
+            return failure
+        manim_code = repair_script(manim_code, failed_stage, error, py_filepath, scene_name,
+                                   script_id, len(repairs) + 1)
+        cache_key = script_key(manim_code, scene_name, tier_flags(quality))
+        repairs.append({
+            'attempt': len(repairs) + 1,
+            'stage': failed_stage,
+            'error': error,
+            # The failed validation or render plus the LLM's fix
+            'seconds': round(time.perf_counter() - attempt_start, 2)
+        })
+    
+    if repairs and not matched:
+        # Later requests for this question start from the script that worked
+        prompt = (prompt_template or DEFAULT_PROMPT_TEMPLATE).format(question=question, scene_name=scene_name)
+        llm_cache.store('gpt-3.5-turbo', prompt, question, 0.3, f"```python\n{manim_code}\n```",
+                        scene_name=scene_name)
     
     # Find the generated MP4 file
-    # Manim typically saves to ./media/videos/scene_<uuid>/1080p60/Scene_<uuid>.mp4
-    video_dir = f"media/videos/{py_filename[:-3]}/1080p60"
-    video_filename = f"{scene_name}.mp4"
-    video_path = os.path.join(video_dir, video_filename)
+    # Manim saves to ./media/videos/scene_<uuid>/<tier folder>/Scene_<uuid>.mp4
+    video_path = tier_video_path(py_filepath, scene_name, quality)
     
     if not os.path.exists(video_path):
         return jsonify({
@@ -154,12 +503,65 @@ def generate_animation():
             'expected_path': video_path
         }), 500
     
-    return jsonify({
-        'status': 'success',
-        'question': question,
-        'video_path': video_path,
-        'python_file': py_filepath
-    })
+    with span('file_io', script_id, op='faststart'):
+        faststart(video_path)
+    janitor.track_render(py_filepath)
+    with span('file_io', script_id, op='cache_put'):
+        video_path = render_cache.put(cache_key, video_path)
+    with span('file_io', script_id, op='upload'):
+        video_url = uploader.publish(video_path)
+    renditions = start_renditions(video_path, script_id)
+    
+    upgrade_info = None
+    if upgrade != 'none' and load['level'] != NORMAL:
+        print(f"⏭️  Shedding the {upgrade} upgrade under load")
+        governor.record(load, 'shed_upgrade')
+        upgrade_info = {'quality': upgrade, 'status': 'shed'}
+    elif upgrade != 'none':
+        upgrade_info = schedule_upgrade(manim_code, py_filepath, scene_name, upgrade)
+    
+    return success_response(question, video_path, video_url, py_filepath, quality,
+                            template_name, renditions, upgrade_info=upgrade_info,
+                            repairs=repairs, load=load)
+
+@app.route('/media/<path:filename>', methods=['GET'])
+def serve_media(filename):
+    """Serve rendered videos with range support; render cache URLs are immutable"""
+    path = os.path.abspath(os.path.join('media', filename))
+    immutable = (path.startswith(os.path.abspath(render_cache.root) + os.sep)
+                 or filename.startswith(IMMUTABLE_PREFIXES))
+    janitor.touch(path)
+    return send_video('media', filename, immutable=immutable)
+
+@app.route('/render_stats', methods=['GET'])
+def render_stats():
+    """Render queue depth, worker utilization and LLM retries/hedges"""
+    return jsonify({**render_scheduler.stats(), 'load': governor.stats(), 'llm': client.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage timings and render queue state in the Prometheus text format"""
+    update_render_gauges(render_scheduler.stats())
+    governor.assess()
+    return Response(render_latest(), content_type=CONTENT_TYPE)
+
+@app.before_request
+def start_timer():
+    g.started_at = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    """Time /generate end to end; its stages are recorded as they run"""
+    if request.endpoint == 'generate_animation':
+        if response.status_code < 400:
+            outcome = 'ok'
+        elif response.status_code in (422, 503):
+            outcome = 'rejected'
+        else:
+            outcome = 'error'
+        observe_stage('request', time.perf_counter() - g.started_at, outcome,
+                      g.get('script_id'), status=response.status_code)
+    return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
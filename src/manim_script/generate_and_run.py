@@ -1,8 +1,13 @@
 import os
+import sys
 import subprocess
 import re
 from openai import OpenAI
 
+# Shared pipeline modules live next to the main Flask app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flask_app'))
+from code_repair import repair_code
+
 # Make sure your OPENAI_API_KEY is set in the environment
 client = OpenAI()
 
@@ -38,28 +43,6 @@ Respond **only with valid Python code**, using standard Manim CE. No comments or
 """
 
 
-import re
-
-def auto_fix_code(code: str) -> str:
-    """
-    Fixes common GPT-generated errors in Manim matrix/vector syntax:
-    - Converts 1D Matrix([1, 2]) into column Matrix([[1], [2]])
-    - Removes unsupported .T (transpose)
-    """
-    # Remove .T used on Matrix
-    code = re.sub(r'\.T\b', '', code)
-
-    # Fix Matrix([number, number, ...]) -> Matrix([[number], [number], ...])
-    def convert_1d_matrix_to_column(match):
-        numbers = match.group(1)
-        elements = [e.strip() for e in numbers.split(',')]
-        column = ', '.join(f'[{e}]' for e in elements)
-        return f'Matrix([{column}])'
-
-    code = re.sub(r'Matrix\(\[([^\[\]]+?)\]\)', convert_1d_matrix_to_column, code)
-
-    return code
-
 def generate_manim_code():
     print("🧠 Generating Manim script with GPT...")
     response = client.chat.completions.create(
@@ -82,6 +65,6 @@ def render_scene():
     subprocess.run(["manim", "-pql", OUTPUT_FILE, SCENE_NAME])
 
 if __name__ == "__main__":
-    manim_code = auto_fix_code(generate_manim_code())
+    manim_code = repair_code(generate_manim_code(), SCENE_NAME)
     save_code(manim_code)
     render_scene()